@@ -36,7 +36,8 @@ from app.services.rating_sync import (
     on_post_approved, 
     on_post_rejected_or_deleted,
     sync_all_place_ratings,
-    update_place_rating
+    update_place_rating,
+    invalidate_place_rating
 )
 
 logger = logging.getLogger(__name__)
@@ -536,17 +537,30 @@ async def update_post(
             "rating": post_data.rating
         }
         
-        success = await mongo_client.update_one(
-            "posts", {"_id": ObjectId(post_id)}, update_data
+        # Lấy related_place_id cũ cùng lúc update để invalidate cả place cũ
+        previous = await mongo_client.find_one_and_update(
+            "posts", {"_id": ObjectId(post_id)}, update_data,
+            projection={"related_place_id": 1}
         )
         
-        if not success:
+        if previous is None:
             return error_response(
                 message="Post không tồn tại",
                 error_code="NOT_FOUND",
                 status_code=404
             )
         
+        # Rating/place của post có thể đã đổi -> tính lại rating của place cũ và mới.
+        # Sync incremental chỉ thấy place hiện tại của post nên place cũ phải cập nhật ở đây
+        affected_place_ids = {previous.get("related_place_id"), post_data.related_place_id}
+        for place_id in affected_place_ids:
+            if isinstance(place_id, str) and place_id.isdigit():
+                place_id = int(place_id)
+            if isinstance(place_id, int) and place_id:
+                if not await update_place_rating(place_id, db, mongo_client):
+                    # Không ghi được PostgreSQL -> ít nhất bỏ cache để đường đọc tự tính lại
+                    invalidate_place_rating(place_id)
+        
         return success_response(message="Cập nhật post thành công")
         
     except Exception as e:
@@ -694,12 +708,15 @@ async def update_post_status(
             )
         
         # Sync rating nếu post có related_place_id và rating (bao gồm cả rating = 0)
+        # Chỉ tính lại khi tập posts approved của place thực sự thay đổi:
+        # approve lại post đã approved hay reject post chưa từng approved thì rating không đổi
         rating_synced = False
+        was_approved = post.get("status") == "approved"
         if post.get("related_place_id") and post.get("rating") is not None:
-            if new_status == "approved":
+            if new_status == "approved" and not was_approved:
                 # Post được approve -> cập nhật rating
                 rating_synced = await on_post_approved(post, db, mongo_client)
-            elif new_status == "rejected":
+            elif new_status == "rejected" and was_approved:
                 # Post bị reject -> recalculate rating (loại bỏ rating của post này)
                 rating_synced = await on_post_rejected_or_deleted(post, db, mongo_client)
         
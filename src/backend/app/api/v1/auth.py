@@ -10,13 +10,14 @@ Module này định nghĩa các API endpoints cho authentication bao gồm:
 """
 
 from fastapi import APIRouter, Depends, Request, status
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, EmailStr, Field, validator
 from typing import Optional, Dict, Any
 import logging
 
 from config.database import get_db
-from middleware.auth import get_current_user
+from middleware.auth import get_current_user, run_password_hashing
 from middleware.rate_limit import apply_rate_limit
 from app.services.auth_service import get_auth_service
 from app.services.logging_service import log_activity, get_client_ip
@@ -550,20 +551,15 @@ async def logout(
             auth_service = get_auth_service(db)
             
             # Tìm và revoke token trong database
-            from config.database import TokenRefresh
-            token_record = db.query(TokenRefresh).filter(
-                TokenRefresh.refresh_token == refresh_data.refresh_token
-            ).first()
+            revoked_user_id = await auth_service.revoke_refresh_token(refresh_data.refresh_token)
             
-            if token_record:
-                token_record.revoked = True
-                db.commit()
-                logger.info(f"Token revoked for user_id: {token_record.user_id}")
+            if revoked_user_id is not None:
+                logger.info(f"Token revoked for user_id: {revoked_user_id}")
                 
                 # Log activity - đăng xuất
                 await log_activity(
                     db=db,
-                    user_id=token_record.user_id,
+                    user_id=revoked_user_id,
                     action="logout",
                     details="Đăng xuất thành công",
                     request=request
@@ -676,7 +672,7 @@ async def forgot_password(
         email = email_data.get("email", "")
         
         # Find user (không báo lỗi nếu không tìm thấy để tránh email enumeration)
-        user = db.query(User).filter(User.email == email).first()
+        user = db.query(User).filter(func.lower(User.email) == email.strip().lower()).first()
         
         if user:
             # Generate reset token (1 hour expiry)
@@ -820,7 +816,7 @@ async def reset_password(
             )
         
         # Update password
-        user.password_hash = auth_middleware.hash_password(new_password)
+        user.password_hash = await run_password_hashing(auth_middleware.hash_password, new_password)
         db.commit()
         
         logger.info(f"Password reset successfully for user {user.id}")
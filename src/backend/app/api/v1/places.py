@@ -708,7 +708,7 @@ async def get_place_detail(
         
         # Fetch related posts from MongoDB
         from middleware.mongodb_client import mongo_client, get_mongodb
-        from app.services.rating_sync import calculate_place_rating_from_mongodb
+        from app.services.rating_sync import get_place_rating_cached
         
         related_posts = []
         # Real-time rating calculation from MongoDB (includes rating=0)
@@ -719,21 +719,18 @@ async def get_place_detail(
             await get_mongodb()
             
             # Calculate real-time rating from MongoDB posts (bao gồm cả rating=0)
-            rating_data = await calculate_place_rating_from_mongodb(place_id, mongo_client)
+            rating_data = await get_place_rating_cached(place_id, mongo_client)
             real_time_rating_count = rating_data.get("rating_count", 0)
             real_time_rating_average = rating_data.get("rating_average", 0.0)
             logger.info(f"[PLACES] Real-time rating for place {place_id}: count={real_time_rating_count}, avg={real_time_rating_average}")
             
-            # Query posts with $or to match both int and string related_place_id
+            # related_place_id đã được chuẩn hóa về int khi kết nối MongoDB
             logger.info(f"[PLACES] Fetching related posts for place_id={place_id}")
             posts = await mongo_client.find_many(
                 "posts",
                 {
-                    "$or": [
-                        {"related_place_id": place_id},
-                        {"related_place_id": str(place_id)}
-                    ],
-                    "status": "approved"
+                    "status": "approved",
+                    "related_place_id": place_id
                 },
                 sort=[("likes_count", -1), ("comments_count", -1)],
                 limit=10
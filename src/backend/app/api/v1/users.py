@@ -20,7 +20,7 @@ from config.database import get_db, User, UserPlaceFavorite, UserPostFavorite, P
 from app.utils.image_helpers import get_main_image_url, normalize_image_list, get_avatar_url
 from app.utils.place_helpers import get_place_compact
 from app.utils.content_sanitizer import sanitize_full_name, sanitize_bio, sanitize_url
-from middleware.auth import get_current_user
+from middleware.auth import get_current_user, run_password_hashing
 from middleware.response import success_response, error_response
 from middleware.mongodb_client import mongo_client, get_mongodb
 from app.services.logging_service import log_activity
@@ -317,7 +317,9 @@ async def change_password(
             )
         
         # Verify current password
-        if not auth_middleware.verify_password(password_data.current_password, user.password_hash):
+        if not await run_password_hashing(
+            auth_middleware.verify_password, password_data.current_password, user.password_hash
+        ):
             return error_response(
                 message="Mật khẩu hiện tại không đúng",
                 error_code="INVALID_PASSWORD",
@@ -325,7 +327,7 @@ async def change_password(
             )
         
         # Hash and update new password
-        user.password_hash = auth_middleware.hash_password(password_data.new_password)
+        user.password_hash = await run_password_hashing(auth_middleware.hash_password, password_data.new_password)
         db.commit()
         
         # Log activity
@@ -18,7 +18,7 @@ Usage:
 
 from .gemini_service import GeminiChatService, get_chat_service, reset_chat_service
 from .config import ChatbotConfig, get_config, reload_config
-from .prompts import HANOI_TRAVEL_PROMPT, build_prompt_with_places
+from .prompts import HANOI_TRAVEL_PROMPT, build_prompt_with_places, build_structured_prompt
 from .place_context import PlaceContextService, get_place_context_service
 
 __all__ = [
@@ -37,6 +37,7 @@ __all__ = [
     # Prompts
     "HANOI_TRAVEL_PROMPT",
     "build_prompt_with_places",
+    "build_structured_prompt",
 ]
 
 __version__ = "1.1.0"
@@ -8,10 +8,10 @@ Hỗ trợ place context injection để gợi ý địa điểm chính xác.
 import asyncio
 import logging
 import time
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Union
 
 from .config import ChatbotConfig, get_config
-from .prompts import build_prompt_with_places, is_greeting, GREETING_RESPONSES
+from .prompts import build_structured_prompt, build_prompt_parts, is_greeting, GREETING_RESPONSES
 
 logger = logging.getLogger(__name__)
 
@@ -132,14 +132,15 @@ class GeminiChatService:
         
         try:
             # Build prompt with places context
-            full_prompt = build_prompt_with_places(
+            # System prompt + places là các parts riêng để Gemini cache prefix
+            prompt = build_structured_prompt(
                 message=message,
-                places=places or [],
-                history=conversation_history
+                history=conversation_history,
+                places=places or []
             )
             
             # Generate response
-            response_text = await self._generate_response(full_prompt)
+            response_text = await self._generate_response(build_prompt_parts(prompt))
             
             if not response_text:
                 return self._fallback_response()
@@ -160,12 +161,12 @@ class GeminiChatService:
             logger.error(f"Chat error: {e}")
             return self._error_response(str(e))
     
-    async def _generate_response(self, prompt: str) -> Optional[str]:
+    async def _generate_response(self, prompt: Union[str, List[str]]) -> Optional[str]:
         """
         Generate response using Gemini API.
         
         Args:
-            prompt: Full prompt with system instructions and history
+            prompt: Full prompt string, hoặc list parts (static prefix trước, hội thoại sau)
             
         Returns:
             Generated text or None on error
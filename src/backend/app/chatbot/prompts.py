@@ -5,7 +5,11 @@ Các prompt được thiết kế để tạo trải nghiệm tốt nhất cho n
 khi tìm hiểu về du lịch Hà Nội.
 """
 
-from typing import List, Dict, Optional
+import io
+import re
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Iterable, List, Dict, Mapping, Optional, Sequence
 
 
 # Main system prompt for Hanoi travel assistant
@@ -32,9 +36,27 @@ HANOI_TRAVEL_PROMPT = """Bạn là **Hanoivivu Assistant** - trợ lý du lịch
 - Tôn trọng văn hóa và truyền thống địa phương"""
 
 
+# Static prompt fragments - built once at import instead of per request
+_HISTORY_HEADER = "\n\n## 💭 Hội thoại:\n"
+_SYSTEM_PREFIX_NO_PLACES = HANOI_TRAVEL_PROMPT + _HISTORY_HEADER
+_ROLE_LABEL = {"user": "👤 Người dùng: ", "assistant": "🤖 Trợ lý: "}
+_ASSISTANT_LABEL = _ROLE_LABEL["assistant"]
+_CURRENT_MSG_TMPL = "👤 Người dùng: {}\n🤖 Trợ lý:"
+
+# Keep last 10 messages for context (5 exchanges)
+_HISTORY_LIMIT = 10
+
+
+def _recent_history(history: Sequence[Mapping]) -> Iterable[Mapping]:
+    """Lấy _HISTORY_LIMIT tin nhắn cuối mà không copy toàn bộ history (vd. deque dài)."""
+    if isinstance(history, (list, tuple)):
+        return history[-_HISTORY_LIMIT:]
+    return islice(history, max(0, len(history) - _HISTORY_LIMIT), None)
+
+
 def build_conversation_prompt(
     message: str, 
-    history: List[Dict] = None,
+    history: Sequence[Mapping] = None,
     place_context: str = None
 ) -> str:
     """
@@ -48,37 +70,89 @@ def build_conversation_prompt(
     Returns:
         Full prompt string with system prompt, places, and conversation history
     """
-    parts = [HANOI_TRAVEL_PROMPT]
+    buf = io.StringIO()
     
-    # Add place context if available
-    if place_context:
-        parts.append(place_context)
+    # System prompt (+ place context) + history header
+    if not place_context:
+        buf.write(_SYSTEM_PREFIX_NO_PLACES)
+    else:
+        buf.write(HANOI_TRAVEL_PROMPT)
+        buf.write(place_context)
+        buf.write(_HISTORY_HEADER)
     
-    # Add conversation history
-    parts.append("\n\n## 💭 Hội thoại:\n")
+    _write_conversation(buf, history, message)
     
+    return buf.getvalue()
+
+
+def _write_conversation(buf: io.StringIO, history: Optional[Sequence[Mapping]], message: str) -> None:
+    """Write history lines + current message (dùng chung cho prompt dạng string và dạng parts)."""
     if history:
-        # Keep last 10 messages for context (5 exchanges)
-        for msg in history[-10:]:
-            role = "👤 Người dùng" if msg.get("role") == "user" else "🤖 Trợ lý"
-            content = msg.get("content", "")
+        for msg in _recent_history(history):
+            content = msg.get("content")
             if content:
-                parts.append(f"{role}: {content}\n")
+                buf.write(_ROLE_LABEL.get(msg.get("role"), _ASSISTANT_LABEL))
+                buf.write(content)
+                buf.write("\n")
     
     # Add current message
-    parts.append(f"👤 Người dùng: {message}\n🤖 Trợ lý:")
+    buf.write(_CURRENT_MSG_TMPL.format(message))
+
+
+def _format_place_context(places: List[Dict]) -> Optional[str]:
+    """Format places into context string (None nếu không có địa điểm)."""
+    if not places:
+        return None
+    
+    # Key bất biến cho cache - cùng tập địa điểm giữa các lượt hội thoại sẽ trúng cache
+    key = tuple(
+        (
+            place.get('id'),
+            place['name'],
+            place.get('rating_average', 0) or 0,
+            place.get('district_name', ''),
+            place.get('address')
+        )
+        for place in places[:5]  # Max 5 places
+    )
+    return _render_places(key)
+
+
+# Rating 0.0-5.0 chỉ có 51 giá trị hiển thị - dựng sẵn thay vì format float mỗi lần
+_RATING_STR = tuple(f"⭐{i / 10:.1f}" for i in range(51))
+
+
+@lru_cache(maxsize=512)
+def _render_places(places_key: tuple) -> str:
+    """Render places block từ key (id, name, rating, district, address)."""
+    lines = ["\n## 📍 Địa điểm có trong hệ thống:"]
     
-    return "".join(parts)
+    for i, (_, name, rating, district, address) in enumerate(places_key, 1):
+        if rating:
+            rating_str = _RATING_STR[min(50, max(0, int(round(rating * 10))))]
+        else:
+            rating_str = "Chưa có đánh giá"
+        district_str = f" - {district}" if district else ""
+        
+        lines.append(f"{i}. **{name}** ({rating_str}{district_str})")
+        
+        if address:
+            lines.append(f"   📍 {address}")
+    
+    lines.append("\n*Ưu tiên gợi ý các địa điểm trên nếu phù hợp với câu hỏi.*")
+    return "\n".join(lines)
 
 
 def build_prompt_with_places(
     message: str,
     places: List[Dict],
-    history: List[Dict] = None
+    history: Sequence[Mapping] = None
 ) -> str:
     """
     Build prompt with places injected.
     
+    Legacy single-string builder, giữ lại cho provider không hỗ trợ prompt caching.
+    
     Args:
         message: User message
         places: List of relevant places from database
@@ -87,26 +161,69 @@ def build_prompt_with_places(
     Returns:
         Full prompt with places context
     """
-    # Format places into context string
-    place_context = None
-    if places:
-        lines = ["\n## 📍 Địa điểm có trong hệ thống:"]
+    return build_conversation_prompt(message, history, _format_place_context(places))
+
+
+def build_structured_prompt(
+    message: str,
+    history: Sequence[Mapping] = None,
+    places: List[Dict] = None
+) -> Dict[str, Any]:
+    """
+    Build prompt as structured blocks so the provider can cache the static prefix.
+    
+    System prompt và place context không đổi giữa các lượt hội thoại,
+    nên được tách riêng để provider nhận diện là prefix có thể cache.
+    
+    Args:
+        message: User message
+        history: Conversation history
+        places: List of relevant places from database
         
-        for i, place in enumerate(places[:5], 1):  # Max 5 places
-            rating = place.get('rating_average', 0) or 0
-            rating_str = f"⭐{rating:.1f}" if rating else "Chưa có đánh giá"
-            district = place.get('district_name', '')
-            district_str = f" - {district}" if district else ""
-            
-            lines.append(f"{i}. **{place['name']}** ({rating_str}{district_str})")
-            
-            if place.get('address'):
-                lines.append(f"   📍 {place['address']}")
+    Returns:
+        Dict với keys: system, static_context, history, user
+    """
+    recent = []
+    if history:
+        for msg in _recent_history(history):
+            content = msg.get("content", "")
+            if content:
+                recent.append({
+                    "role": "user" if msg.get("role") == "user" else "assistant",
+                    "content": content
+                })
+    
+    return {
+        "system": HANOI_TRAVEL_PROMPT,
+        "static_context": _format_place_context(places) or "",
+        "history": recent,
+        "user": message
+    }
+
+
+def build_prompt_parts(prompt: Dict[str, Any]) -> List[str]:
+    """
+    Convert structured prompt thành danh sách parts cho Gemini `contents`.
+    
+    Parts tĩnh (system, place context) đứng đầu để giữ prefix ổn định
+    giữa các request; nối các parts lại sẽ ra đúng prompt dạng string.
+    
+    Args:
+        prompt: Output của build_structured_prompt()
         
-        lines.append("\n*Ưu tiên gợi ý các địa điểm trên nếu phù hợp với câu hỏi.*")
-        place_context = "\n".join(lines)
+    Returns:
+        List[str] parts
+    """
+    parts = [prompt["system"]]
+    if prompt["static_context"]:
+        parts.append(prompt["static_context"])
+    
+    conversation = io.StringIO()
+    conversation.write(_HISTORY_HEADER)
+    _write_conversation(conversation, prompt["history"], prompt["user"])
+    parts.append(conversation.getvalue())
     
-    return build_conversation_prompt(message, history, place_context)
+    return parts
 
 
 # Quick response prompt for simple answers
@@ -121,11 +238,14 @@ GREETING_RESPONSES = [
 ]
 
 
+# Greeting keywords compiled once - longest first to avoid prefix shadowing
+_GREETING_RE = re.compile(
+    r"(?:xin chào bạn|xin chào|chào bạn|chào|hello|hey|hi|alo)",
+    re.IGNORECASE
+)
+
+
 def is_greeting(message: str) -> bool:
     """Check if message is a greeting."""
-    greetings = [
-        "xin chào", "chào", "hello", "hi", "hey",
-        "chào bạn", "xin chào bạn", "alo"
-    ]
-    message_lower = message.lower().strip()
-    return any(g in message_lower for g in greetings) and len(message_lower) < 30
+    message = message.strip()
+    return len(message) < 30 and _GREETING_RE.search(message) is not None
@@ -9,224 +9,438 @@ FastAPI Application - Main Entry Point
 - Rate limiting & CORS
 """
 
+import asyncio
 import logging
 import os
+import queue
 import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from typing import Optional
 
 # IMPORTANT: Them thu muc cha vao sys.path TRUOC khi import relative modules
-# app/main.py -> parent = src/backend
-backend_dir = Path(__file__).parent.parent.absolute()
-if str(backend_dir) not in sys.path:
-    sys.path.insert(0, str(backend_dir))
+# app/main.py -> parents[1] = src/backend, parents[2] = src
+# Resolve một lần, các path khác suy ra từ _HERE
+_HERE = Path(__file__).resolve()
+BACKEND_DIR = _HERE.parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
 
 # IMPORTANT: Load environment tu root directory TRUOC khi import cac module khac
 # Import centralized environment loader - dùng absolute import sau khi đã thêm sys.path
 from config.load_env import load_environment, is_loaded
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables from src/.env
 if not is_loaded():
     load_success = load_environment()
     if not load_success:
-        print("WARNING: Failed to load .env file. Some features may not work.")
+        logger.warning("Failed to load .env file. Some features may not work.")
 else:
-    print("[OK] Environment already loaded")
+    logger.debug("[OK] Environment already loaded")
 
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+import orjson
+from fastapi import FastAPI, Request, Response, status
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
 
-from config.database import init_db, test_connection
-from app.api.v1.auth import router as auth_router
-from app.api.v1.logs import router as logs_router
-from app.api.v1.places import router as places_router
-from app.api.v1.users import router as users_router
-from app.api.v1.posts import router as posts_router
-from app.api.v1.chatbot import router as chatbot_router
-from app.api.v1.upload import router as upload_router
-from app.api.v1.admin import router as admin_router
+from config.database import ensure_default_roles, ensure_indexes, init_db, test_connection, warm_pool
+from app.services.logging_service import start_log_worker, stop_log_worker
 
 # Import middleware setup
-from middleware.setup import setup_middleware, setup_app
+from middleware.setup import setup_middleware
 from middleware.config import config
+from middleware.static_files import CachedStaticFiles
 
 # Configure logging - only console output (logs are stored in database via audit_log middleware)
+# Request handlers chỉ đẩy record vào queue; QueueListener ghi ra console ở thread riêng
+_log_queue = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler()]
+    handlers=[QueueHandler(_log_queue)]
 )
+_log_listener.start()
 
 # Giảm noise từ các thư viện khác
 for logger_name in ['uvicorn', 'uvicorn.access', 'sqlalchemy.engine', 'httpx', 'pymongo']:
     logging.getLogger(logger_name).setLevel(logging.WARNING)
 
-logger = logging.getLogger(__name__)
+_BANNER_RULE = "=" * 60
 
 
 # ==================== LIFESPAN EVENTS ====================
 
+# True khi khởi tạo nền (MongoDB + sync rating) đã xong - /health trả 503 cho tới lúc đó
+READY = False
+_deferred_init_task: Optional[asyncio.Task] = None
+
+# Key của Postgres advisory lock cho rating sync lúc khởi động
+_RATING_SYNC_LOCK_KEY = 12345
+# Khởi động mặc định chỉ sync places có posts thay đổi từ lần trước;
+# bật để quét lại toàn bộ posts (reconcile)
+_RATING_SYNC_FULL = os.getenv("RATING_SYNC_FULL", "false").lower() == "true"
+
+# Chu kỳ dọn refresh tokens hết hạn (giây)
+_TOKEN_PURGE_INTERVAL = int(os.getenv("TOKEN_PURGE_INTERVAL", "86400"))
+_token_purge_task: Optional[asyncio.Task] = None
+
+# Số lần hash mật khẩu đo lúc khởi động (0 = tắt)
+_PASSWORD_HASH_BENCH_SAMPLES = int(os.getenv("PASSWORD_HASH_BENCH_SAMPLES", "10"))
+
+
+async def _deferred_init() -> None:
+    """
+    Khởi tạo nặng chạy nền sau khi server đã nhận request:
+    1. Kết nối MongoDB (và warm pool)
+    2. Sync rating từ MongoDB posts sang PostgreSQL places
+    """
+    global READY
+
+    try:
+        from middleware.mongodb_client import mongo_client, get_mongodb
+        from app.services.rating_sync import sync_all_place_ratings, sync_place_ratings_incremental
+        from config.database import SessionLocal
+        from sqlalchemy import text
+
+        # Kết nối MongoDB và mở sẵn sockets trong pool
+        await get_mongodb()
+        logger.info("[OK] Da ket noi MongoDB")
+        await mongo_client.warm_pool()
+
+        # Sync rating từ posts
+        db = SessionLocal()
+        try:
+            # Chỉ một replica sync khi rolling deploy - lock giữ trong transaction
+            # của sync_all_place_ratings và tự nhả khi commit/rollback
+            got_lock = await asyncio.to_thread(
+                lambda: db.execute(
+                    text("SELECT pg_try_advisory_xact_lock(:key)"),
+                    {"key": _RATING_SYNC_LOCK_KEY}
+                ).scalar()
+            )
+
+            if got_lock:
+                logger.info("[...] Dang dong bo rating tu MongoDB posts...")
+                if _RATING_SYNC_FULL:
+                    result = await sync_all_place_ratings(db, mongo_client)
+                else:
+                    result = await sync_place_ratings_incremental(db, mongo_client)
+
+                if "error" not in result:
+                    logger.info("[OK] Da dong bo rating: %s places cap nhat", result.get('updated_count', 0))
+                else:
+                    logger.warning("[WARN] Loi dong bo rating: %s", result.get('error'))
+            else:
+                await asyncio.to_thread(db.rollback)
+                logger.info("[SKIP] Replica khac dang dong bo rating")
+        finally:
+            await asyncio.to_thread(db.close)
+
+    except Exception as mongo_err:
+        logger.warning("[WARN] Khong the dong bo rating tu MongoDB: %s", mongo_err)
+        logger.warning("Rating se duoc dong bo khi co post moi duoc approve")
+
+    READY = True
+    logger.info("[OK] Hoan tat khoi tao nen - server READY")
+
+    # Đo chi phí hash mật khẩu để tune BCRYPT_ROUNDS theo phần cứng
+    if _PASSWORD_HASH_BENCH_SAMPLES > 0:
+        from middleware.auth import auth_middleware, PASSWORD_HASH_SCHEME
+
+        try:
+            median_ms = await asyncio.to_thread(auth_middleware.benchmark_hash, _PASSWORD_HASH_BENCH_SAMPLES)
+            logger.info("[INFO] Password hash (%s): median %.1fms/hash", PASSWORD_HASH_SCHEME, median_ms)
+        except Exception as bench_err:
+            logger.warning("[WARN] Khong the do chi phi hash mat khau: %s", bench_err)
+
+
+async def _purge_tokens_periodically() -> None:
+    """Định kỳ xóa refresh tokens hết hạn (chạy nền suốt vòng đời app)"""
+    from app.services.auth_service import purge_expired_refresh_tokens
+    from config.database import SessionLocal
+
+    while True:
+        db = SessionLocal()
+        try:
+            deleted = await asyncio.to_thread(purge_expired_refresh_tokens, db)
+            logger.info("[OK] Da xoa %s refresh tokens het han", deleted)
+        except Exception as purge_err:
+            logger.warning("[WARN] Loi khi xoa refresh tokens het han: %s", purge_err)
+        finally:
+            await asyncio.to_thread(db.close)
+
+        await asyncio.sleep(_TOKEN_PURGE_INTERVAL)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Lifespan context manager cho sự kiện khởi động và tắt
 
-    Khởi động:
-    1. Kết nối database
-    2. Tạo tables (nếu chưa tồn tại)
-    3. Test kết nối
-    4. Kết nối MongoDB
-    5. Sync rating từ MongoDB posts sang PostgreSQL places
-    6. Log thông tin cấu hình
+    Khởi động (chỉ phần nhanh, trước khi nhận request):
+    1. Test kết nối database
+    2. Tạo tables (nếu chưa tồn tại) và roles mặc định
+    3. Warm connection pool PostgreSQL
+    4. Chạy nền _deferred_init (MongoDB + sync rating)
+    5. Chạy nền job dọn refresh tokens hết hạn
+    6. Khởi động worker ghi activity/visit logs theo batch
 
     Tắt:
-    1. Đóng các kết nối database
+    1. Hủy khởi tạo nền nếu chưa xong và job dọn tokens
+    2. Ghi nốt activity/visit logs còn trong queue
     """
+    global READY, _deferred_init_task, _token_purge_task
+
     # Khởi động
-    logger.info("=" * 60)
-    logger.info("KHỞI ĐỘNG MÁY CHỦ Hanoivivu API")
-    logger.info("=" * 60)
+    logger.info("%s\nKHỞI ĐỘNG MÁY CHỦ Hanoivivu API\n%s", _BANNER_RULE, _BANNER_RULE)
 
     try:
-        # Test kết nối database
-        if test_connection():
+        # Test kết nối database (chạy trong thread để không block event loop)
+        if await asyncio.to_thread(test_connection):
             logger.info("[OK] Kiem tra ket noi database: THANH CONG")
 
             # Khởi tạo database tables
-            init_db()
+            await asyncio.to_thread(init_db)
             logger.info("[OK] Da khoi tao database")
-            
-            # Sync rating từ MongoDB posts
-            try:
-                from middleware.mongodb_client import mongo_client, get_mongodb
-                from app.services.rating_sync import sync_all_place_ratings
-                from config.database import SessionLocal
-                
-                # Kết nối MongoDB
-                await get_mongodb()
-                logger.info("[OK] Da ket noi MongoDB")
-                
-                # Sync rating từ posts
-                db = SessionLocal()
-                try:
-                    logger.info("[...] Dang dong bo rating tu MongoDB posts...")
-                    result = await sync_all_place_ratings(db, mongo_client)
-                    
-                    if "error" not in result:
-                        logger.info(f"[OK] Da dong bo rating: {result.get('updated_count', 0)} places cap nhat")
-                    else:
-                        logger.warning(f"[WARN] Loi dong bo rating: {result.get('error')}")
-                finally:
-                    db.close()
-                    
-            except Exception as mongo_err:
-                logger.warning(f"[WARN] Khong the dong bo rating tu MongoDB: {str(mongo_err)}")
-                logger.warning("Rating se duoc dong bo khi co post moi duoc approve")
+
+            # Index mới cho DB đã tồn tại (init_db chỉ tạo bảng thiếu)
+            await asyncio.to_thread(ensure_indexes)
+
+            # Roles mặc định (admin/moderator/user) - một câu INSERT idempotent
+            await asyncio.to_thread(ensure_default_roles)
+
+            # Mở sẵn pool_size connections trước khi nhận request
+            await asyncio.to_thread(warm_pool)
+
+            # MongoDB + sync rating không chặn việc nhận request
+            _deferred_init_task = asyncio.create_task(_deferred_init())
+            _token_purge_task = asyncio.create_task(_purge_tokens_periodically())
+
+            # Activity/visit logs ghi nền theo batch
+            start_log_worker()
         else:
             logger.warning("[FAIL] Kiem tra ket noi database: THAT BAI")
             logger.warning("Máy chủ sẽ khởi động nhưng tính năng database có thể không hoạt động")
+            READY = True
 
-        logger.info("[OK] Hoan tat khoi dong may chu")
-        logger.info("=" * 60)
+        logger.info("[OK] Hoan tat khoi dong may chu\n%s", _BANNER_RULE)
 
     except Exception as e:
-        logger.error(f"[FAIL] Loi khoi dong: {str(e)}")
+        logger.error("[FAIL] Loi khoi dong: %s", e)
+        READY = True
 
     # Chuyển điều khiển cho ứng dụng
     yield
 
     # Tắt
-    logger.info("=" * 60)
-    logger.info("TẮT MÁY CHỦ Hanoivivu API")
-    logger.info("=" * 60)
-    logger.info("[OK] Da tat may chu")
+    logger.info("%s\nTẮT MÁY CHỦ Hanoivivu API\n%s", _BANNER_RULE, _BANNER_RULE)
 
+    for task in (_deferred_init_task, _token_purge_task):
+        if task is not None and not task.done():
+            task.cancel()
 
-# ==================== CREATE FASTAPI APP ====================
+    await stop_log_worker()
 
-app = FastAPI(
-    title="Hanoivivu API",
-    description="""
-    API cho ứng dụng du lịch Hanoivivu với các tính năng:
-    - Authentication với JWT tokens
-    - Email validation sử dụng Hunter.io
-    - User management
-    - Places discovery
-    - Blog posts & comments
-    - AI Chatbot
-    """,
-    version="1.0.0",
-    docs_url="/docs",
-    redoc_url="/redoc",
-    lifespan=lifespan
-)
+    logger.info("[OK] Da tat may chu")
 
-# ==================== MIDDLEWARE SETUP ====================
+    # Flush các log record còn trong queue trước khi thoát
+    _log_listener.stop()
 
-# Setup toàn bộ middleware (Logging, CORS, Rate Limiting, Error Handling)
-# Thứ tự middleware được áp dụng trong setup_middleware()
-setup_middleware(app)
 
-logger.info("Middleware configured successfully")
-logger.info(f"  - Audit Logging: {config.ENABLE_AUDIT_LOG}")
-logger.info(f"  - Rate Limiting: {config.RATE_LIMIT_ENABLED}")
-logger.info(f"  - Search Logging: {config.ENABLE_SEARCH_LOGGING}")
+# ==================== HEALTH ENDPOINTS ====================
 
+# Response của "/" không đổi - serialize một lần khi import
+_ROOT_BODY = orjson.dumps({
+    "success": True,
+    "message": "Hanoivivu API Server",
+    "version": "1.0.0",
+    "status": "running"
+})
 
-# ==================== ROUTERS ====================
 
-# Health check endpoint
-@app.get("/", tags=["Health"])
 async def root():
     """
     Root endpoint - Health check
 
     Returns thông tin cơ bản về API server
     """
-    return {
-        "success": True,
-        "message": "Hanoivivu API Server",
-        "version": "1.0.0",
-        "status": "running"
-    }
+    return Response(content=_ROOT_BODY, media_type="application/json")
+
+
+_LIVE_BODY = orjson.dumps({"success": True, "status": "alive"})
+_HEALTH_STARTING_BODY = orjson.dumps({
+    "success": False,
+    "status": "starting",
+    "services": {"api": "starting"}
+})
+# Body /health đã serialize cho trạng thái services gần nhất
+_HEALTH_BODY_CACHE = {"services": None, "body": b""}
+
+
+# Cache kết quả kiểm tra services để probe liên tục không mở connection mỗi lần
+_HEALTH_TTL = 2.0
+_HEALTH_CACHE = {"ts": 0.0, "services": {"database": "unknown", "mongodb": "unknown"}}
+_health_lock = asyncio.Lock()
+
+
+async def _ping_database() -> bool:
+    """Ping PostgreSQL (sync driver - chạy trong thread)"""
+    return await asyncio.to_thread(test_connection)
+
+
+async def _ping_mongodb() -> bool:
+    """Ping MongoDB"""
+    from middleware.mongodb_client import mongo_client
+    return await mongo_client.ping()
+
+
+async def _check(name: str, probe) -> tuple:
+    """Chạy một probe, không để lỗi của service này ảnh hưởng service khác"""
+    try:
+        return name, "connected" if await probe() else "disconnected"
+    except Exception as e:
+        return name, f"error: {str(e)}"
+
+
+async def _get_services_status() -> dict:
+    """Trả về trạng thái các services, chỉ kiểm tra lại khi cache hết hạn"""
+    if time.monotonic() - _HEALTH_CACHE["ts"] <= _HEALTH_TTL:
+        return _HEALTH_CACHE["services"]
+
+    async with _health_lock:
+        # Request khác có thể đã làm mới cache trong lúc chờ lock
+        now = time.monotonic()
+        if now - _HEALTH_CACHE["ts"] > _HEALTH_TTL:
+            # Các probe chạy song song - latency = max thay vì tổng
+            results = await asyncio.gather(
+                _check("database", _ping_database),
+                _check("mongodb", _ping_mongodb)
+            )
+            _HEALTH_CACHE.update(ts=now, services=dict(results))
+
+    return _HEALTH_CACHE["services"]
 
 
-@app.get("/health", tags=["Health"])
 async def health_check():
     """
     Health check endpoint
 
-    Trả về status của server và các services
+    Trả về status của server và các services.
+    Trạng thái services được cache trong _HEALTH_TTL giây.
+    Trả 503 khi khởi tạo nền chưa xong (liveness dùng "/").
+    """
+    if not READY:
+        return Response(
+            content=_HEALTH_STARTING_BODY,
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            media_type="application/json"
+        )
+
+    services = await _get_services_status()
+
+    # Chỉ serialize lại khi trạng thái services thay đổi
+    if services != _HEALTH_BODY_CACHE["services"]:
+        _HEALTH_BODY_CACHE["body"] = orjson.dumps({
+            "success": True,
+            "status": "healthy",
+            "services": {
+                "api": "running",
+                **services
+            }
+        })
+        _HEALTH_BODY_CACHE["services"] = services
+
+    return Response(content=_HEALTH_BODY_CACHE["body"], media_type="application/json")
+
+
+async def health_live():
+    """
+    Liveness probe - luôn 200, không chạm database
     """
-    health_status = {
-        "success": True,
-        "status": "healthy",
-        "services": {
-            "api": "running",
-            "database": "unknown"
-        }
+    return Response(content=_LIVE_BODY, media_type="application/json")
+
+
+async def health_ready():
+    """
+    Readiness probe - 200 khi khởi tạo xong và database kết nối được
+
+    Kết quả kiểm tra database dùng chung cache với /health
+    (probe đồng thời được gom lại một roundtrip nhờ _health_lock).
+    """
+    services = await _get_services_status() if READY else {}
+    ready = READY and services.get("database") == "connected"
+
+    return ORJSONResponse(
+        {
+            "success": ready,
+            "status": "ready" if ready else "not_ready",
+            "services": services
+        },
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+
+# ==================== ERROR HANDLERS ====================
+
+# Body của lỗi 500 luôn giống nhau - serialize một lần khi import
+_ERR_500_BODY = orjson.dumps({
+    "success": False,
+    "error": {
+        "code": "INTERNAL_ERROR",
+        "message": "Đã có lỗi xảy ra, vui lòng thử lại sau"
     }
+})
 
-    # Check database connection
-    try:
-        db_connected = test_connection()
-        health_status["services"]["database"] = "connected" if db_connected else "disconnected"
-    except Exception as e:
-        health_status["services"]["database"] = f"error: {str(e)}"
 
-    return health_status
+# Traceback đầy đủ chỉ log lần đầu và mỗi _TB_SAMPLE_RATE lần cho cùng một lỗi
+# (QueueHandler vẫn format traceback trên event loop thread)
+_TB_SAMPLE_RATE = 100
+_TB_SAMPLE_MAX_KEYS = 1024
+_tb_counts: dict = {}
+
 
+def _should_log_traceback(exc: Exception) -> bool:
+    """Sampling traceback theo (loại exception, vị trí raise)"""
+    tb = exc.__traceback__
+    while tb is not None and tb.tb_next is not None:
+        tb = tb.tb_next
+    key = (
+        type(exc),
+        tb.tb_frame.f_code.co_filename if tb else None,
+        tb.tb_lineno if tb else None
+    )
+
+    if key not in _tb_counts and len(_tb_counts) >= _TB_SAMPLE_MAX_KEYS:
+        _tb_counts.clear()
+    count = _tb_counts.get(key, 0)
+    _tb_counts[key] = count + 1
+    return count % _TB_SAMPLE_RATE == 0
+
+
+async def global_exception_handler(request: Request, exc: Exception):
+    """
+    Global exception handler cho tất cả các lỗi không được xử lý
+
+    Args:
+        request: FastAPI request
+        exc: Exception
+
+    Returns:
+        Response: Error response (JSON dựng sẵn)
+    """
+    if logger.isEnabledFor(logging.ERROR):
+        logger.error("Unhandled exception: %s", exc, exc_info=_should_log_traceback(exc))
+
+    return Response(
+        content=_ERR_500_BODY,
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        media_type="application/json"
+    )
 
-# Include routers
-app.include_router(auth_router, prefix="/api/v1")
-app.include_router(logs_router, prefix="/api/v1")
-app.include_router(places_router, prefix="/api/v1")
-app.include_router(users_router, prefix="/api/v1")
-app.include_router(posts_router, prefix="/api/v1")
-app.include_router(chatbot_router, prefix="/api/v1")
-app.include_router(upload_router, prefix="/api/v1")
-app.include_router(admin_router, prefix="/api/v1")
 
 # ==================== STATIC FILES ====================
 # Mount static/uploads directory để serve ảnh
@@ -242,56 +456,125 @@ app.include_router(admin_router, prefix="/api/v1")
 
 # Always mount local static files directory for local development
 # For production with S3, files are uploaded to S3 but UPLOADS_BASE_URL points to S3/CloudFront
-src_dir = Path(__file__).resolve().parent.parent.parent  # app/main.py -> app -> src/backend -> src
-uploads_path = src_dir / "static" / "uploads"
+UPLOADS_PATH = _HERE.parents[2] / "static" / "uploads"
+API_V1_PREFIX = "/api/v1"
+_UPLOAD_SUBDIRS = ("places", "avatars", "posts", "misc")
 
-# Create uploads folder and subfolders if not exist
-uploads_path.mkdir(parents=True, exist_ok=True)
-(uploads_path / "places").mkdir(exist_ok=True)
-(uploads_path / "avatars").mkdir(exist_ok=True)
-(uploads_path / "posts").mkdir(exist_ok=True)
-(uploads_path / "misc").mkdir(exist_ok=True)
 
-# Mount static uploads - always mount for local serving
-# When USE_S3=true, UPLOADS_BASE_URL will point to S3/CloudFront instead of localhost
-app.mount("/static/uploads", StaticFiles(directory=str(uploads_path)), name="static_uploads")
+# ==================== CREATE FASTAPI APP ====================
 
-uploads_base_url = os.getenv("UPLOADS_BASE_URL", "http://127.0.0.1:8080/static/uploads")
-logger.info(f"[Static Files] Mounted /static/uploads from: {uploads_path}")
-logger.info(f"[Static Files] UPLOADS_BASE_URL: {uploads_base_url}")
+def create_app(include_chatbot: Optional[bool] = None) -> FastAPI:
+    """
+    Application factory - tạo và cấu hình FastAPI app
 
+    Toàn bộ setup (middleware, routers, static files, error handlers)
+    nằm ở đây để chỉ có một nơi khởi tạo app.
+    Routers được import bên trong hàm để import module main vẫn nhẹ.
 
+    Args:
+        include_chatbot: Có đăng ký chatbot router hay không
+            (mặc định theo ENABLE_CHATBOT_ROUTER)
 
+    Returns:
+        FastAPI: Ứng dụng đã được cấu hình
+    """
+    app = FastAPI(
+        title="Hanoivivu API",
+        description="""
+        API cho ứng dụng du lịch Hanoivivu với các tính năng:
+        - Authentication với JWT tokens
+        - Email validation sử dụng Hunter.io
+        - User management
+        - Places discovery
+        - Blog posts & comments
+        - AI Chatbot
+        """,
+        version="1.0.0",
+        docs_url="/docs",
+        redoc_url="/redoc",
+        # orjson (C extension) thay cho json.dumps của stdlib cho mọi response mặc định
+        default_response_class=ORJSONResponse,
+        lifespan=lifespan
+    )
 
-# ==================== ERROR HANDLERS ====================
+    # ==================== MIDDLEWARE SETUP ====================
 
-from fastapi import Request, status
-from fastapi.responses import JSONResponse
+    # Setup toàn bộ middleware (Logging, CORS, Rate Limiting, Error Handling)
+    # Thứ tự middleware được áp dụng trong setup_middleware()
+    setup_middleware(app)
 
+    logger.info(
+        "Middleware configured successfully\n"
+        "  - Audit Logging: %s\n"
+        "  - Rate Limiting: %s\n"
+        "  - Search Logging: %s",
+        config.ENABLE_AUDIT_LOG,
+        config.RATE_LIMIT_ENABLED,
+        config.ENABLE_SEARCH_LOGGING
+    )
 
-@app.exception_handler(Exception)
-async def global_exception_handler(request: Request, exc: Exception):
-    """
-    Global exception handler cho tất cả các lỗi không được xử lý
+    # ==================== ROUTERS ====================
+
+    # Health check endpoints
+    app.add_api_route("/", root, methods=["GET"], tags=["Health"])
+    app.add_api_route("/health", health_check, methods=["GET"], tags=["Health"])
+    app.add_api_route("/health/live", health_live, methods=["GET"], tags=["Health"])
+    app.add_api_route("/health/ready", health_ready, methods=["GET"], tags=["Health"])
+
+    # Include routers
+    from app.api.v1.auth import router as auth_router
+    from app.api.v1.logs import router as logs_router
+    from app.api.v1.places import router as places_router
+    from app.api.v1.users import router as users_router
+    from app.api.v1.posts import router as posts_router
+    from app.api.v1.upload import router as upload_router
+    from app.api.v1.admin import router as admin_router
+
+    # Starlette match route bằng cách duyệt tuần tự - router được truy cập nhiều
+    # (places, posts) đăng ký trước. Các prefix không giao nhau nên thứ tự
+    # không làm thay đổi route nào được chọn.
+    v1_routers = [places_router, posts_router, auth_router, users_router]
+
+    if include_chatbot is None:
+        include_chatbot = config.ENABLE_CHATBOT_ROUTER
+    if include_chatbot:
+        # Chatbot router kéo theo Gemini client - chỉ import khi cần
+        from app.api.v1.chatbot import router as chatbot_router
+        v1_routers.append(chatbot_router)
+
+    v1_routers += [upload_router, logs_router, admin_router]
+
+    # Include thẳng vào app (không lồng qua một APIRouter trung gian,
+    # vì mỗi lần include_router đều dựng lại route và compile lại path regex)
+    for v1_router in v1_routers:
+        app.include_router(v1_router, prefix=API_V1_PREFIX)
+
+    # ==================== STATIC FILES ====================
+
+    # Create uploads folder and subfolders if not exist
+    # (stat trước - mkdir(exist_ok=True) trên thư mục đã có tốn thêm syscall)
+    for subdir in _UPLOAD_SUBDIRS:
+        subdir_path = UPLOADS_PATH / subdir
+        if not subdir_path.is_dir():
+            subdir_path.mkdir(parents=True, exist_ok=True)
+
+    # Mount static uploads - always mount for local serving
+    # When USE_S3=true, UPLOADS_BASE_URL will point to S3/CloudFront instead of localhost
+    # Ảnh nhỏ được cache trong RAM (xem middleware/static_files.py)
+    app.mount("/static/uploads", CachedStaticFiles(directory=str(UPLOADS_PATH)), name="static_uploads")
+
+    logger.info(
+        "[Static Files] Mounted /static/uploads from: %s\n"
+        "[Static Files] UPLOADS_BASE_URL: %s",
+        UPLOADS_PATH,
+        config.UPLOADS_BASE_URL
+    )
 
-    Args:
-        request: FastAPI request
-        exc: Exception
+    # ==================== ERROR HANDLERS ====================
 
-    Returns:
-        JSONResponse: Error response
-    """
-    logger.error(f"Unhandled exception: {str(exc)}", exc_info=True)
+    app.add_exception_handler(Exception, global_exception_handler)
 
-    return JSONResponse(
-        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-        content={
-            "success": False,
-            "error": {
-                "code": "INTERNAL_ERROR",
-                "message": "Đã có lỗi xảy ra, vui lòng thử lại sau"
-            }
-        }
-    )
+    return app
 
 
+app = create_app()
@@ -11,21 +11,31 @@ Database Schema v3.1 Compatible
 """
 
 from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from app.utils.timezone_helper import utc_now
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, bindparam, func, literal, or_, select, update
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.exc import IntegrityError
+import asyncio
+import hashlib
+import hmac
 import logging
 import os
+import secrets
+import threading
+import time
 
-from config.database import User, Role, TokenRefresh, get_db
-from middleware.auth import auth_middleware
+from config.database import Role, User, TokenRefresh, get_db
+from middleware.auth import auth_middleware, run_password_hashing
+from middleware.email_service import email_service
 from middleware.response import (
     conflict_response,
     invalid_email_response,
     invalid_password_response,
     not_found_response
 )
+from app.utils.content_sanitizer import sanitize_full_name
 from app.utils.email_validator import validate_user_email
 from app.utils.image_helpers import get_avatar_url
 
@@ -34,6 +44,164 @@ logger = logging.getLogger(__name__)
 # Token expiration
 REFRESH_TOKEN_EXPIRATION_DAYS = 7
 
+# Giữ token hết hạn / đã revoke bao lâu trước khi xóa hẳn (để tra cứu, audit)
+EXPIRED_TOKEN_RETENTION_DAYS = int(os.getenv("EXPIRED_TOKEN_RETENTION_DAYS", "30"))
+REVOKED_TOKEN_RETENTION_DAYS = int(os.getenv("REVOKED_TOKEN_RETENTION_DAYS", "7"))
+
+# Cache kết quả verify bcrypt cho các lần login lặp lại gần nhau
+PASSWORD_VERIFY_CACHE_TTL = int(os.getenv("PASSWORD_VERIFY_CACHE_TTL", "60"))  # giây
+PASSWORD_VERIFY_CACHE_SIZE = int(os.getenv("PASSWORD_VERIFY_CACHE_SIZE", "1024"))
+
+# Pepper ngẫu nhiên cho mỗi process - key cache không thể suy ra mật khẩu
+# và mất hiệu lực khi restart
+_VERIFY_PEPPER = secrets.token_bytes(32)
+# key -> (password_hash đã verify, thời điểm hết hạn)
+_verify_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+_verify_cache_lock = threading.Lock()
+
+
+def _verify_cache_key(user_id: int, password: str) -> str:
+    return hmac.new(_VERIFY_PEPPER, f"{user_id}:{password}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def verify_password_cached(user_id: int, password: str, password_hash: str) -> bool:
+    """
+    Verify mật khẩu, bỏ qua bcrypt nếu cùng (user, mật khẩu) vừa verify thành công
+
+    Cache hit chỉ hợp lệ khi password_hash trong DB không đổi, nên đổi mật khẩu
+    sẽ tự động vô hiệu entry cũ.
+
+    Args:
+        user_id: ID của user
+        password: Mật khẩu người dùng nhập
+        password_hash: Mật khẩu đã hash trong database
+
+    Returns:
+        bool: True nếu mật khẩu đúng
+    """
+    key = _verify_cache_key(user_id, password)
+    now = time.monotonic()
+
+    with _verify_cache_lock:
+        cached = _verify_cache.get(key)
+        if cached is not None:
+            cached_hash, expires_at = cached
+            if expires_at > now and secrets.compare_digest(cached_hash, password_hash):
+                _verify_cache.move_to_end(key)
+                return True
+            del _verify_cache[key]
+
+    if not auth_middleware.verify_password(password, password_hash):
+        return False
+
+    with _verify_cache_lock:
+        _verify_cache[key] = (password_hash, now + PASSWORD_VERIFY_CACHE_TTL)
+        _verify_cache.move_to_end(key)
+        while len(_verify_cache) > PASSWORD_VERIFY_CACHE_SIZE:
+            _verify_cache.popitem(last=False)
+
+    return True
+
+
+# Giữ reference tới các task gửi email nền (event loop chỉ giữ weak reference)
+_background_tasks: set = set()
+
+
+async def _send_welcome_email(email: str, full_name: str) -> None:
+    """Gửi email chào mừng - chạy nền, lỗi chỉ log không ảnh hưởng đăng ký"""
+    try:
+        email_sent = await email_service.send_welcome_email(
+            email=email,
+            full_name=full_name
+        )
+        if email_sent:
+            logger.info(f"Welcome email sent to {email}")
+        else:
+            logger.warning(f"Failed to send welcome email to {email}")
+    except Exception as e:
+        logger.warning(f"Failed to send welcome email to {email}: {str(e)}")
+
+
+def hash_refresh_token(refresh_token: str) -> str:
+    """
+    SHA-256 (hex, 64 ký tự) của refresh token - giá trị lưu trong token_refresh.refresh_token
+
+    JWT đã tự xác thực bằng chữ ký, DB chỉ cần theo dõi trạng thái revoke,
+    nên lưu hash ngắn thay cho cả JWT giúp index nhỏ và lookup nhanh hơn.
+    """
+    return hashlib.sha256(refresh_token.encode("utf-8")).hexdigest()
+
+
+def _refresh_token_keys(refresh_token: str) -> Tuple[str, str]:
+    """
+    Giá trị cần match khi lookup: hash (mới) và JWT gốc (các row tạo trước khi
+    chuyển sang lưu hash - còn hiệu lực tối đa REFRESH_TOKEN_EXPIRATION_DAYS)
+    """
+    return hash_refresh_token(refresh_token), refresh_token
+
+
+# Statement dựng sẵn cho các query nóng (login / refresh / me) - tham số qua bindparam
+# nên SQL compile một lần và được SQLAlchemy compiled cache dùng lại
+
+# Login / me chỉ cần vài cột - select column tuple thay vì full ORM User
+# (không qua identity map / attribute instrumentation). Row có cùng tên
+# thuộc tính với User nên dùng chung _token_claims / _user_compact.
+_USER_AUTH_COLUMNS = (
+    User.id,
+    User.full_name,
+    User.email,
+    User.avatar_url,
+    User.role_id,
+    User.is_active,
+    User.ban_reason,
+    func.coalesce(Role.role_name, literal("user")).label("role_name"),
+)
+_USER_BY_EMAIL_STMT = select(*_USER_AUTH_COLUMNS, User.password_hash).outerjoin(
+    Role, Role.id == User.role_id
+).where(
+    func.lower(User.email) == bindparam("email")
+)
+_USER_BY_ID_STMT = select(*_USER_AUTH_COLUMNS).outerjoin(
+    Role, Role.id == User.role_id
+).where(
+    User.id == bindparam("user_id")
+)
+# Register chỉ cần biết email đã tồn tại chưa - SELECT EXISTS, không lấy row
+_EMAIL_EXISTS_STMT = select(
+    select(User.id).where(func.lower(User.email) == bindparam("email")).exists()
+)
+# INNER JOIN nên token của user không còn tồn tại cũng bị coi là không hợp lệ
+_ACTIVE_REFRESH_TOKEN_STMT = select(TokenRefresh, User).join(
+    User, User.id == TokenRefresh.user_id
+).options(
+    joinedload(User.role)
+).where(
+    TokenRefresh.refresh_token.in_(bindparam("token_keys", expanding=True)),
+    TokenRefresh.revoked == False
+)
+
+
+def _token_claims(user: User) -> Dict[str, Any]:
+    """Claims cho access/refresh token (user: User hoặc Row từ _USER_AUTH_COLUMNS)"""
+    return {
+        "id": user.id,
+        "email": user.email,
+        "role": user.role_name,  # Use role_name property
+        "role_id": user.role_id
+    }
+
+
+def _user_compact(user: User) -> Dict[str, Any]:
+    """User theo Swagger UserCompact format (user: User hoặc Row từ _USER_AUTH_COLUMNS)"""
+    return {
+        "id": user.id,  # Swagger spec: integer, không phải string
+        "full_name": user.full_name,
+        "email": user.email,  # Required for frontend User type
+        "avatar_url": get_avatar_url(user.avatar_url, user.id, user.full_name),
+        "role_id": user.role_id,
+        "role": user.role_name  # Frontend checks this field first
+    }
+
 
 class AuthService:
     """
@@ -49,38 +217,6 @@ class AuthService:
         """
         self.db = db
 
-    # Class-level flag để tránh check roles mỗi lần register
-    _roles_checked = False
-
-    def _ensure_roles_exist(self):
-        """
-        Đảm bảo các roles mặc định tồn tại
-        
-        Chỉ check 1 lần per session để tránh duplicate queries
-        """
-        # Skip nếu đã check rồi
-        if AuthService._roles_checked:
-            return
-            
-        default_roles = [
-            {"id": 1, "role_name": "admin"},
-            {"id": 2, "role_name": "moderator"},
-            {"id": 3, "role_name": "user"}
-        ]
-        
-        for role_data in default_roles:
-            existing = self.db.query(Role).filter(Role.id == role_data["id"]).first()
-            if not existing:
-                role = Role(**role_data)
-                self.db.add(role)
-        
-        try:
-            self.db.commit()
-            AuthService._roles_checked = True  # Mark as checked
-        except:
-            self.db.rollback()
-
-
     async def register_user(
         self,
         full_name: str,
@@ -99,45 +235,57 @@ class AuthService:
             Tuple: (success: bool, response: dict, user_data: dict or None)
         """
         try:
-            # Ensure default roles exist
-            self._ensure_roles_exist()
-            
-            # 1. Validate email với Hunter.io
-            is_valid, validation_msg, validation_data = await validate_user_email(
+            # Email lưu và so khớp dạng lowercase (index users_email_lower_idx)
+            email = email.strip().lower()
+
+            # 1. Validate email với Hunter.io (HTTP) - chạy song song với bước 2
+            email_task = asyncio.create_task(validate_user_email(
                 email=email,
                 min_score=50  # Score tối thiểu
-            )
+            ))
 
-            # Nếu email không hợp lệ
-            if not is_valid:
-                logger.warning(f"Email validation failed for {email}: {validation_msg}")
+            # 2. Kiểm tra email đã tồn tại chưa (query chạy trong thread để
+            # request Hunter.io được gửi đi cùng lúc)
+            try:
+                email_exists = await asyncio.to_thread(
+                    lambda: self.db.execute(_EMAIL_EXISTS_STMT, {"email": email}).scalar()
+                )
+            except Exception:
+                email_task.cancel()
+                raise
+
+            if email_exists:
+                # Email trùng - trả lỗi ngay, không chờ Hunter.io
+                email_task.cancel()
+                logger.warning(f"Registration failed: Email already exists - {email}")
                 return False, {
                     "success": False,
                     "error": {
-                        "code": "INVALID_EMAIL",
-                        "message": validation_msg
+                        "code": "EMAIL_EXISTS",
+                        "message": "Email đã được sử dụng"
                     }
                 }, None
 
-            logger.info(f"Email validation passed for {email}: {validation_msg}")
+            is_valid, validation_msg, validation_data = await email_task
 
-            # 2. Kiểm tra email đã tồn tại chưa
-            existing_user = self.db.query(User).filter(User.email == email).first()
-            if existing_user:
-                logger.warning(f"Registration failed: Email already exists - {email}")
+            # Nếu email không hợp lệ
+            if not is_valid:
+                logger.warning(f"Email validation failed for {email}: {validation_msg}")
                 return False, {
                     "success": False,
                     "error": {
-                        "code": "EMAIL_EXISTS",
-                        "message": "Email đã được sử dụng"
+                        "code": "INVALID_EMAIL",
+                        "message": validation_msg
                     }
                 }, None
 
+            logger.info(f"Email validation passed for {email}: {validation_msg}")
+
             # 3. Hash mật khẩu
-            password_hash = auth_middleware.hash_password(password)
+            # Hash tốn CPU (~50-300ms) - chạy trong thread pool, giới hạn số phép đồng thời
+            password_hash = await run_password_hashing(auth_middleware.hash_password, password)
 
             # 3.5. Sanitize user inputs
-            from app.utils.content_sanitizer import sanitize_full_name
             clean_full_name = sanitize_full_name(full_name)
 
             # 4. Tạo user mới với role_id (Schema v3.1)
@@ -153,32 +301,25 @@ class AuthService:
             )
 
             # 5. Lưu vào database
+            # flush lấy id qua INSERT ... RETURNING; các cột khác đã set ở trên nên
+            # đọc user_data trước commit (commit sẽ expire object) - không cần refresh()
             self.db.add(new_user)
+            self.db.flush()
+            user_data = new_user.to_dict()
             self.db.commit()
-            self.db.refresh(new_user)
 
-            logger.info(f"User registered successfully: {email} (ID: {new_user.id})")
+            logger.info(f"User registered successfully: {email} (ID: {user_data['id']})")
 
-            # 6. Gửi email chào mừng
-            try:
-                from middleware.email_service import email_service
-                email_sent = await email_service.send_welcome_email(
-                    email=email,
-                    full_name=full_name
-                )
-                if email_sent:
-                    logger.info(f"Welcome email sent to {email}")
-                else:
-                    logger.warning(f"Failed to send welcome email to {email}")
-            except Exception as e:
-                # Không block registration nếu gửi email thất bại
-                logger.warning(f"Failed to send welcome email to {email}: {str(e)}")
+            # 6. Gửi email chào mừng ở background - response không chờ SMTP
+            task = asyncio.create_task(_send_welcome_email(email, full_name))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
 
             # 7. Return success response
             return True, {
                 "success": True,
                 "message": "Đăng ký thành công! Bạn có thể đăng nhập ngay."
-            }, new_user.to_dict()
+            }, user_data
 
         except IntegrityError as e:
             self.db.rollback()
@@ -218,8 +359,8 @@ class AuthService:
             Tuple: (success: bool, response: dict, user_data: dict or None)
         """
         try:
-            # 1. Tìm user theo email
-            user = self.db.query(User).filter(User.email == email).first()
+            # 1. Tìm user theo email (kèm role trong cùng query)
+            user = self.db.execute(_USER_BY_EMAIL_STMT, {"email": email.strip().lower()}).first()
 
             if not user:
                 logger.warning(f"Login failed: User not found - {email}")
@@ -243,7 +384,7 @@ class AuthService:
                 }, None
 
             # 3. Verify mật khẩu
-            if not auth_middleware.verify_password(password, user.password_hash):
+            if not await run_password_hashing(verify_password_cached, user.id, password, user.password_hash):
                 logger.warning(f"Login failed: Invalid password - {email}")
                 return False, {
                     "success": False,
@@ -253,29 +394,24 @@ class AuthService:
                     }
                 }, None
 
-            # 4. Cập nhật last_login_at
-            user.last_login_at = utc_now()
-            self.db.commit()
+            # 4. Cập nhật last_login_at (commit chung với refresh token ở bước 6)
+            last_login_at = utc_now()
+            self.db.execute(
+                update(User).where(User.id == user.id).values(last_login_at=last_login_at)
+            )
 
             # 5. Tạo tokens
-            access_token = auth_middleware.create_access_token({
-                "id": user.id,
-                "email": user.email,
-                "role": user.role_name,  # Use role_name property
-                "role_id": user.role_id
-            })
-
-            refresh_token = auth_middleware.create_refresh_token({
-                "id": user.id,
-                "email": user.email,
-                "role": user.role_name,
-                "role_id": user.role_id
-            })
+            token_data = _token_claims(user)
+            user_compact = _user_compact(user)
+
+            access_token = auth_middleware.create_access_token(token_data)
+            refresh_token = auth_middleware.create_refresh_token(token_data)
 
             # 6. Lưu refresh token vào database (Schema v3.1)
+            # UPDATE last_login_at + INSERT token trong một transaction, một lần commit
             token_record = TokenRefresh(
                 user_id=user.id,
-                refresh_token=refresh_token,
+                refresh_token=hash_refresh_token(refresh_token),
                 expires_at=utc_now() + timedelta(days=REFRESH_TOKEN_EXPIRATION_DAYS),
                 revoked=False
             )
@@ -289,17 +425,11 @@ class AuthService:
                 "success": True,
                 "message": "Đăng nhập thành công",
                 "access_token": access_token,
-                "user": {
-                    "id": user.id,  # Swagger spec: integer, không phải string
-                    "full_name": user.full_name,
-                    "email": user.email,  # Required for frontend User type
-                    "avatar_url": get_avatar_url(user.avatar_url, user.id, user.full_name),
-                    "role_id": user.role_id,
-                    "role": user.role_name  # Frontend checks this field first
-                }
-            }, user.to_dict(include_sensitive=True)
+                "user": user_compact
+            }, {**user_compact, "is_active": user.is_active, "last_login_at": last_login_at.isoformat()}
 
         except Exception as e:
+            self.db.rollback()
             logger.error(f"Unexpected error during login: {str(e)}")
             return False, {
                 "success": False,
@@ -325,12 +455,13 @@ class AuthService:
         """
         try:
             # 1. Kiểm tra token trong database (Schema v3.1)
-            token_record = self.db.query(TokenRefresh).filter(
-                TokenRefresh.refresh_token == refresh_token,
-                TokenRefresh.revoked == False
+            # Token + user (+ role) trong một query
+            row = self.db.execute(
+                _ACTIVE_REFRESH_TOKEN_STMT,
+                {"token_keys": list(_refresh_token_keys(refresh_token))}
             ).first()
 
-            if not token_record:
+            if not row:
                 logger.warning("Refresh token not found in database or revoked")
                 return False, {
                     "success": False,
@@ -340,6 +471,8 @@ class AuthService:
                     }
                 }
 
+            token_record, user = row
+
             # 2. Kiểm tra token hết hạn
             if token_record.expires_at < utc_now():
                 logger.warning(f"Refresh token expired for user_id={token_record.user_id}")
@@ -357,19 +490,7 @@ class AuthService:
             # 3. Verify JWT token
             payload = await auth_middleware.verify_token(refresh_token, "refresh")
 
-            # 4. Lấy user từ database
-            user = self.db.query(User).filter(User.id == token_record.user_id).first()
-
-            if not user:
-                return False, {
-                    "success": False,
-                    "error": {
-                        "code": "INVALID_TOKEN",
-                        "message": "Refresh token không hợp lệ"
-                    }
-                }
-
-            # 5. Kiểm tra user có bị khóa không
+            # 4. Kiểm tra user có bị khóa không
             if not user.is_active:
                 return False, {
                     "success": False,
@@ -379,47 +500,32 @@ class AuthService:
                     }
                 }
 
-            # 6. Revoke old token (Token Rotation)
+            # 5. Revoke old token (Token Rotation)
             token_record.revoked = True
 
-            # 7. Tạo tokens mới
-            new_access_token = auth_middleware.create_access_token({
-                "id": user.id,
-                "email": user.email,
-                "role": user.role_name,
-                "role_id": user.role_id
-            })
-
-            new_refresh_token = auth_middleware.create_refresh_token({
-                "id": user.id,
-                "email": user.email,
-                "role": user.role_name,
-                "role_id": user.role_id
-            })
-
-            # 8. Lưu new refresh token vào database
+            # 6. Tạo tokens mới (đọc user trước commit - xem login_user)
+            token_data = _token_claims(user)
+            user_compact = _user_compact(user)
+
+            new_access_token = auth_middleware.create_access_token(token_data)
+            new_refresh_token = auth_middleware.create_refresh_token(token_data)
+
+            # 7. Lưu new refresh token vào database
             new_token_record = TokenRefresh(
                 user_id=user.id,
-                refresh_token=new_refresh_token,
+                refresh_token=hash_refresh_token(new_refresh_token),
                 expires_at=utc_now() + timedelta(days=REFRESH_TOKEN_EXPIRATION_DAYS),
                 revoked=False
             )
             self.db.add(new_token_record)
             self.db.commit()
 
-            logger.info(f"Token refreshed for user: {user.email} (ID: {user.id})")
+            logger.info(f"Token refreshed for user: {token_data['email']} (ID: {token_data['id']})")
 
             return True, {
                 "success": True,
                 "access_token": new_access_token,
-                "user": {
-                    "id": user.id,
-                    "full_name": user.full_name,
-                    "email": user.email,  # Required for frontend User type
-                    "avatar_url": get_avatar_url(user.avatar_url, user.id, user.full_name),
-                    "role_id": user.role_id,
-                    "role": user.role_name  # Frontend checks this field first
-                }
+                "user": user_compact
             }
 
         except Exception as e:
@@ -432,6 +538,36 @@ class AuthService:
                 }
             }
 
+    async def revoke_refresh_token(
+        self,
+        refresh_token: str,
+        user_id: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        Thu hồi một refresh token (dùng cho logout - không cần access token).
+        Cột lưu SHA-256 của token; token cũ trước khi hash vẫn khớp qua giá trị raw.
+
+        Args:
+            refresh_token: Refresh token cần thu hồi
+            user_id: Chỉ thu hồi nếu token thuộc user này (optional)
+
+        Returns:
+            Optional[int]: user_id của token đã thu hồi, None nếu không tìm thấy
+        """
+        query = self.db.query(TokenRefresh).filter(
+            TokenRefresh.refresh_token.in_(_refresh_token_keys(refresh_token))
+        )
+        if user_id is not None:
+            query = query.filter(TokenRefresh.user_id == user_id)
+
+        token_record = query.first()
+        if not token_record:
+            return None
+
+        token_record.revoked = True
+        self.db.commit()
+        return token_record.user_id
+
     async def logout_user(self, user_id: int, refresh_token: str = None) -> Tuple[bool, Dict[str, Any]]:
         """
         Đăng xuất user - Revoke tokens trong database
@@ -446,20 +582,13 @@ class AuthService:
         try:
             if refresh_token:
                 # Revoke specific token
-                token_record = self.db.query(TokenRefresh).filter(
-                    TokenRefresh.user_id == user_id,
-                    TokenRefresh.refresh_token == refresh_token
-                ).first()
-                
-                if token_record:
-                    token_record.revoked = True
-                    self.db.commit()
+                await self.revoke_refresh_token(refresh_token, user_id=user_id)
             else:
                 # Revoke all tokens for user
                 self.db.query(TokenRefresh).filter(
                     TokenRefresh.user_id == user_id,
                     TokenRefresh.revoked == False
-                ).update({"revoked": True})
+                ).update({"revoked": True}, synchronize_session=False)
                 self.db.commit()
             
             logger.info(f"User logged out: ID {user_id}")
@@ -490,7 +619,7 @@ class AuthService:
             Tuple: (success: bool, response: dict, user_data: dict or None)
         """
         try:
-            user = self.db.query(User).filter(User.id == user_id).first()
+            user = self.db.execute(_USER_BY_ID_STMT, {"user_id": user_id}).first()
 
             if not user:
                 return False, {
@@ -502,17 +631,11 @@ class AuthService:
                 }, None
 
             # Return success response theo Swagger UserCompact format
+            user_compact = _user_compact(user)
             return True, {
                 "success": True,
-                "user": {
-                    "id": user.id,  # Swagger spec: integer
-                    "full_name": user.full_name,
-                    "email": user.email,  # Required for frontend User type
-                    "avatar_url": get_avatar_url(user.avatar_url, user.id, user.full_name),
-                    "role_id": user.role_id,
-                    "role": user.role_name  # Frontend checks this field first
-                }
-            }, user.to_dict()
+                "user": user_compact
+            }, {**user_compact, "is_active": user.is_active}
 
         except Exception as e:
             logger.error(f"Error getting user profile: {str(e)}")
@@ -527,6 +650,37 @@ class AuthService:
 
 # ==================== UTILITY FUNCTIONS ====================
 
+def purge_expired_refresh_tokens(db: Session) -> int:
+    """
+    Xóa refresh tokens đã hết hạn lâu ngày để bảng token_refresh không phình mãi
+
+    Xóa token hết hạn quá EXPIRED_TOKEN_RETENTION_DAYS, hoặc đã revoke và
+    hết hạn quá REVOKED_TOKEN_RETENTION_DAYS. Hàm sync - gọi qua asyncio.to_thread.
+
+    Args:
+        db: Database session
+
+    Returns:
+        int: Số token đã xóa
+    """
+    now = utc_now()
+    try:
+        deleted = db.query(TokenRefresh).filter(
+            or_(
+                TokenRefresh.expires_at < now - timedelta(days=EXPIRED_TOKEN_RETENTION_DAYS),
+                and_(
+                    TokenRefresh.revoked == True,
+                    TokenRefresh.expires_at < now - timedelta(days=REVOKED_TOKEN_RETENTION_DAYS)
+                )
+            )
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    except Exception:
+        db.rollback()
+        raise
+
+
 def get_auth_service(db: Session) -> AuthService:
     """
     Factory function để lấy Auth Service instance
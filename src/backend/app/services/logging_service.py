@@ -9,19 +9,207 @@ Author: System
 Date: 2024-12-31
 """
 
+import asyncio
 import logging
-from typing import Optional, Dict, Any, List
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple, Type
 from datetime import datetime, timedelta
 from app.utils.timezone_helper import utc_now
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, text
+from sqlalchemy import and_, case, desc, func, insert, text
 from fastapi import Request
 
-from config.database import ActivityLog, VisitLog, User, Place
+from config.database import ActivityLog, VisitLog, User, Place, SessionLocal
 
 logger = logging.getLogger(__name__)
 
 
+# ==================== LOG QUEUE ====================
+# log_activity / log_visit chỉ đưa record vào queue, worker nền gom batch
+# và ghi một lần - request không phải chờ INSERT + commit
+
+LOG_QUEUE_MAXSIZE = int(os.getenv("LOG_QUEUE_MAXSIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.1"))  # giây
+
+# Sampling visit logs của khách (chưa đăng nhập) - visit của user đăng nhập luôn được ghi
+# Mặc định ghi đủ; khi queue gần đầy (bot/spike) chỉ ghi VISIT_SAMPLE_RATE_ANON_OVERLOAD
+VISIT_SAMPLE_RATE_ANON = float(os.getenv("VISIT_SAMPLE_RATE_ANON", "1.0"))
+VISIT_SAMPLE_RATE_ANON_OVERLOAD = float(os.getenv("VISIT_SAMPLE_RATE_ANON_OVERLOAD", "0.01"))
+_LOG_QUEUE_OVERLOAD_SIZE = int(LOG_QUEUE_MAXSIZE * 0.8)
+
+# Bỏ qua visit lặp lại (refresh trang) của cùng IP vào cùng place/post trong
+# VISIT_DEDUPE_TTL giây. Cache theo process, chỉ truy cập từ event loop.
+VISIT_DEDUPE_TTL = int(os.getenv("VISIT_DEDUPE_TTL", "60"))  # giây
+VISIT_DEDUPE_MAX_SIZE = int(os.getenv("VISIT_DEDUPE_MAX_SIZE", "100000"))
+# (ip, place_id, post_id) -> thời điểm hết hạn
+_recent_visits: "OrderedDict[Tuple[str, Optional[int], Optional[str]], float]" = OrderedDict()
+
+# (model, dict cột) - ActivityLog hoặc VisitLog
+_log_queue: "asyncio.Queue[Tuple[Type, Dict[str, Any]]]" = asyncio.Queue(maxsize=LOG_QUEUE_MAXSIZE)
+_log_worker_task: Optional[asyncio.Task] = None
+_dropped_logs = 0
+
+# Cột thời gian của mỗi bảng log - record trong queue chưa có timestamp,
+# worker gán một timestamp chung cho cả batch lúc ghi
+_LOG_TIMESTAMP_COLUMNS = {ActivityLog: "created_at", VisitLog: "visited_at"}
+
+
+def _enqueue_log(model: Type, row: Dict[str, Any]) -> None:
+    """Đưa record vào queue; queue đầy thì bỏ record cũ nhất (drop oldest)"""
+    global _dropped_logs
+
+    try:
+        _log_queue.put_nowait((model, row))
+    except asyncio.QueueFull:
+        try:
+            _log_queue.get_nowait()
+            _log_queue.task_done()
+        except asyncio.QueueEmpty:
+            pass
+        _log_queue.put_nowait((model, row))
+
+        _dropped_logs += 1
+        if _dropped_logs % 1000 == 1:
+            logger.warning("Log queue full - dropped %s oldest log records", _dropped_logs)
+
+
+def _write_log_batch(batch: List[Tuple[Type, Dict[str, Any]]]) -> None:
+    """Ghi một batch log vào database trong một transaction (hàm sync - chạy trong thread)"""
+    now = utc_now()
+    rows_by_model: Dict[Type, List[Dict[str, Any]]] = {}
+    for model, row in batch:
+        row[_LOG_TIMESTAMP_COLUMNS[model]] = now
+        rows_by_model.setdefault(model, []).append(row)
+
+    db = SessionLocal()
+    try:
+        # Một INSERT cho mỗi bảng, executemany với cả batch (insertmanyvalues trên PostgreSQL)
+        for model, rows in rows_by_model.items():
+            db.execute(insert(model), rows)
+        db.commit()
+        logger.debug("Log batch written: %s records", len(batch))
+    except Exception:
+        logger.exception("Error writing log batch (%s records)", len(batch))
+        db.rollback()
+    finally:
+        db.close()
+
+
+async def _log_worker() -> None:
+    """Worker nền: gom tối đa LOG_BATCH_SIZE record hoặc chờ LOG_FLUSH_INTERVAL rồi ghi"""
+    loop = asyncio.get_running_loop()
+
+    while True:
+        batch = []
+        try:
+            batch.append(await _log_queue.get())
+            deadline = loop.time() + LOG_FLUSH_INTERVAL
+
+            while len(batch) < LOG_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(_log_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            # Bị cancel lúc đang gom (shutdown): các record đã lấy khỏi queue
+            # không còn ở đâu khác -> ghi nốt rồi mới dừng
+            if batch:
+                try:
+                    await asyncio.to_thread(_write_log_batch, batch)
+                finally:
+                    for _ in batch:
+                        _log_queue.task_done()
+            raise
+
+        write = asyncio.ensure_future(asyncio.to_thread(_write_log_batch, batch))
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            # Thread ghi vẫn chạy tiếp - chờ xong để shutdown không đóng engine giữa chừng
+            await write
+            raise
+        finally:
+            for _ in batch:
+                _log_queue.task_done()
+
+
+def start_log_worker() -> None:
+    """Khởi động worker ghi log (gọi trong lifespan startup)"""
+    global _log_worker_task
+
+    if _log_worker_task is None or _log_worker_task.done():
+        _log_worker_task = asyncio.create_task(_log_worker())
+
+
+async def stop_log_worker() -> None:
+    """
+    Dừng worker và ghi nốt log chưa ghi (gọi trong lifespan shutdown):
+    worker tự ghi batch đang gom khi bị cancel, phần còn trong queue ghi ở đây
+    """
+    global _log_worker_task
+
+    if _log_worker_task is not None:
+        _log_worker_task.cancel()
+        try:
+            await _log_worker_task
+        except asyncio.CancelledError:
+            pass
+        _log_worker_task = None
+
+    remaining = []
+    while not _log_queue.empty():
+        remaining.append(_log_queue.get_nowait())
+        _log_queue.task_done()
+
+    if remaining:
+        await asyncio.to_thread(_write_log_batch, remaining)
+
+
+def _log_worker_running() -> bool:
+    return _log_worker_task is not None and not _log_worker_task.done()
+
+
+def _is_duplicate_visit(ip_address: str, place_id: Optional[int], post_id: Optional[str]) -> bool:
+    """True nếu cùng (ip, place, post) vừa được log trong VISIT_DEDUPE_TTL giây"""
+    key = (ip_address, place_id, post_id)
+    now = time.monotonic()
+
+    expires_at = _recent_visits.get(key)
+    if expires_at is not None and expires_at > now:
+        return True
+
+    _recent_visits[key] = now + VISIT_DEDUPE_TTL
+    _recent_visits.move_to_end(key)
+    while len(_recent_visits) > VISIT_DEDUPE_MAX_SIZE:
+        _recent_visits.popitem(last=False)
+    return False
+
+
+def _insert_log(db: Session, record) -> int:
+    """
+    Ghi trực tiếp một log record (hàm sync - từ async gọi qua asyncio.to_thread)
+
+    id có ngay sau flush (INSERT ... RETURNING) - đọc trước commit để
+    không phải refresh/reload object bị expire sau commit.
+    """
+    try:
+        db.add(record)
+        db.flush()
+        record_id = record.id
+        db.commit()
+        return record_id
+    except Exception:
+        db.rollback()
+        raise
+
+
 # ==================== HELPER FUNCTIONS ====================
 
 def get_client_ip(request: Request) -> str:
@@ -32,32 +220,65 @@ def get_client_ip(request: Request) -> str:
     - Direct connection
     - Behind proxy (X-Forwarded-For)
     - Behind load balancer (X-Real-IP)
+
+    Kết quả được cache trên request.state cho các lần gọi sau trong cùng request.
     """
+    cached = getattr(request.state, "client_ip", None)
+    if cached is not None:
+        return cached
+
     # Check X-Forwarded-For header (behind proxy/load balancer)
     forwarded_for = request.headers.get("X-Forwarded-For")
     if forwarded_for:
         # X-Forwarded-For có thể chứa nhiều IP, lấy IP đầu tiên (client gốc)
-        return forwarded_for.split(",")[0].strip()
-    
+        ip = forwarded_for.partition(",")[0].strip()
     # Check X-Real-IP header
-    real_ip = request.headers.get("X-Real-IP")
-    if real_ip:
-        return real_ip.strip()
-    
+    elif request.headers.get("X-Real-IP"):
+        ip = request.headers["X-Real-IP"].strip()
     # Fallback to direct client IP
-    if request.client:
-        return request.client.host
-    
-    return "unknown"
+    elif request.client:
+        ip = request.client.host
+    else:
+        ip = "unknown"
+
+    request.state.client_ip = ip
+    return ip
 
 
 def get_user_agent(request: Request) -> str:
-    """Lấy User-Agent từ request headers"""
-    return request.headers.get("User-Agent", "unknown")
+    """Lấy User-Agent từ request headers (cache trên request.state)"""
+    cached = getattr(request.state, "client_ua", None)
+    if cached is None:
+        cached = request.state.client_ua = request.headers.get("User-Agent", "unknown")
+    return cached
 
 
 # ==================== ACTIVITY LOGGING ====================
 
+# Các action hợp lệ cho activity_logs - action lạ bị bỏ qua (không ghi vào DB)
+ACTIVITY_ACTIONS = frozenset({
+    "login",
+    "logout",
+    "register",
+    "password_change",
+    "password_reset",
+    "profile_update",
+    "avatar_update",
+    "avatar_delete",
+    "favorite_place",
+    "unfavorite_place",
+    "favorite_post",
+    "unfavorite_post",
+    "create_post",
+    "delete_own_post",
+    "create_comment",
+    "delete_comment",
+    "like_post",
+    "unlike_post",
+    "report_content",
+})
+
+
 async def log_activity(
     db: Session,
     user_id: int,
@@ -68,9 +289,12 @@ async def log_activity(
 ) -> Optional[int]:
     """
     Log hoạt động của user vào bảng activity_logs
+
+    Khi log worker đang chạy, record được đưa vào queue và ghi nền theo batch
+    (không chờ DB). Ngược lại ghi trực tiếp bằng db session.
     
     Args:
-        db: Database session
+        db: Database session (chỉ dùng khi log worker không chạy)
         user_id: ID của user thực hiện action
         action: Loại action (login, register, profile_update, etc.)
         details: Chi tiết bổ sung (optional)
@@ -78,7 +302,7 @@ async def log_activity(
         request: FastAPI Request object (optional)
         
     Returns:
-        int: ID của activity log record, None nếu lỗi
+        int: ID của activity log record (ghi trực tiếp), None nếu ghi nền hoặc lỗi
         
     Actions được hỗ trợ:
         - login: Đăng nhập thành công
@@ -88,40 +312,52 @@ async def log_activity(
         - password_reset: Reset mật khẩu
         - profile_update: Cập nhật thông tin profile
         - avatar_update: Thay đổi avatar
+        - avatar_delete: Xóa avatar
         - favorite_place: Thêm địa điểm yêu thích
         - unfavorite_place: Bỏ địa điểm yêu thích
         - favorite_post: Thêm bài viết yêu thích
         - unfavorite_post: Bỏ bài viết yêu thích
         - create_post: Tạo bài viết mới
+        - delete_own_post: Xóa bài viết của mình
         - create_comment: Tạo comment
+        - delete_comment: Xóa comment
         - like_post: Like bài viết
         - unlike_post: Unlike bài viết
         - report_content: Báo cáo nội dung vi phạm
+
+        Action khác danh sách trên (ACTIVITY_ACTIONS) bị bỏ qua.
     """
+    if action not in ACTIVITY_ACTIONS:
+        logger.warning("Unknown activity action ignored: %r (user=%s)", action, user_id)
+        return None
+
     try:
         # Lấy IP từ request nếu không được cung cấp
         if not ip_address and request:
             ip_address = get_client_ip(request)
-        
-        # Tạo activity log record
-        activity = ActivityLog(
-            user_id=user_id,
-            action=action,
-            details=details,
-            ip_address=ip_address,
-            created_at=utc_now()
+
+        row = {
+            "user_id": user_id,
+            "action": action,
+            "details": details,
+            "ip_address": ip_address
+        }
+
+        if _log_worker_running():
+            _enqueue_log(ActivityLog, row)
+            logger.debug("Activity queued: user=%s, action=%s", user_id, action)
+            return None
+        
+        # Ghi trực tiếp - session sync nên chạy trong thread, không block event loop
+        activity_id = await asyncio.to_thread(
+            _insert_log, db, ActivityLog(**row, created_at=utc_now())
         )
         
-        db.add(activity)
-        db.commit()
-        db.refresh(activity)
-        
-        logger.debug(f"Activity logged: user={user_id}, action={action}")
-        return activity.id
+        logger.debug("Activity logged: user=%s, action=%s", user_id, action)
+        return activity_id
         
-    except Exception as e:
-        logger.error(f"Error logging activity: {str(e)}")
-        db.rollback()
+    except Exception:
+        logger.exception("Error logging activity")
         return None
 
 
@@ -136,25 +372,24 @@ def log_activity_sync(
     Synchronous version của log_activity
     Sử dụng khi không cần async
     """
+    if action not in ACTIVITY_ACTIONS:
+        logger.warning("Unknown activity action ignored: %r (user=%s)", action, user_id)
+        return None
+
     try:
-        activity = ActivityLog(
+        activity_id = _insert_log(db, ActivityLog(
             user_id=user_id,
             action=action,
             details=details,
             ip_address=ip_address,
             created_at=utc_now()
-        )
+        ))
         
-        db.add(activity)
-        db.commit()
-        db.refresh(activity)
-        
-        logger.debug(f"Activity logged (sync): user={user_id}, action={action}")
-        return activity.id
+        logger.debug("Activity logged (sync): user=%s, action=%s", user_id, action)
+        return activity_id
         
-    except Exception as e:
-        logger.error(f"Error logging activity (sync): {str(e)}")
-        db.rollback()
+    except Exception:
+        logger.exception("Error logging activity (sync)")
         return None
 
 
@@ -170,9 +405,11 @@ async def log_visit(
 ) -> Optional[int]:
     """
     Log lượt truy cập vào bảng visit_logs
+
+    Ghi nền qua log queue như log_activity.
     
     Args:
-        db: Database session
+        db: Database session (chỉ dùng khi log worker không chạy)
         request: FastAPI Request object
         user_id: ID của user (None nếu guest)
         place_id: ID địa điểm được xem (optional)
@@ -180,43 +417,80 @@ async def log_visit(
         page_url: URL trang được truy cập (optional)
         
     Returns:
-        int: ID của visit log record, None nếu lỗi
+        int: ID của visit log record (ghi trực tiếp), None nếu ghi nền, bị sample bỏ qua hoặc lỗi
     """
+    if user_id is None:
+        sample_rate = (
+            VISIT_SAMPLE_RATE_ANON_OVERLOAD
+            if _log_queue.qsize() > _LOG_QUEUE_OVERLOAD_SIZE
+            else VISIT_SAMPLE_RATE_ANON
+        )
+        if sample_rate < 1.0 and random.random() >= sample_rate:
+            return None
+
     try:
         # Lấy thông tin từ request
         ip_address = get_client_ip(request)
+        if _is_duplicate_visit(ip_address, place_id, post_id):
+            return None
+
         user_agent = get_user_agent(request)
         
         # Lấy page_url từ request nếu không được cung cấp
         if not page_url:
             page_url = str(request.url)
         
-        # Tạo visit log record
-        visit = VisitLog(
-            user_id=user_id,
-            place_id=place_id,
-            post_id=post_id,
-            page_url=page_url,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            visited_at=utc_now()
+        row = {
+            "user_id": user_id,
+            "place_id": place_id,
+            "post_id": post_id,
+            "page_url": page_url,
+            "ip_address": ip_address,
+            "user_agent": user_agent
+        }
+
+        if _log_worker_running():
+            _enqueue_log(VisitLog, row)
+            logger.debug("Visit queued: place=%s, post=%s, user=%s", place_id, post_id, user_id)
+            return None
+
+        visit_id = await asyncio.to_thread(
+            _insert_log, db, VisitLog(**row, visited_at=utc_now())
         )
         
-        db.add(visit)
-        db.commit()
-        db.refresh(visit)
-        
-        logger.debug(f"Visit logged: place={place_id}, post={post_id}, user={user_id}")
-        return visit.id
+        logger.debug("Visit logged: place=%s, post=%s, user=%s", place_id, post_id, user_id)
+        return visit_id
         
-    except Exception as e:
-        logger.error(f"Error logging visit: {str(e)}")
-        db.rollback()
+    except Exception:
+        logger.exception("Error logging visit")
         return None
 
 
 # ==================== QUERY FUNCTIONS ====================
 
+def _paginate_with_total(query, order_by, offset: int, limit: int) -> Tuple[List[Any], int]:
+    """
+    Lấy một trang kết quả kèm tổng số record trong cùng một query
+
+    COUNT(*) OVER () tính tổng trên cùng lần quét với trang dữ liệu, thay cho
+    query.count() + query.all() riêng.
+
+    Returns:
+        Tuple: (items, total)
+    """
+    rows = query.add_columns(func.count().over().label('total'))\
+                .order_by(order_by)\
+                .offset(offset)\
+                .limit(limit)\
+                .all()
+
+    if rows:
+        return [row[0] for row in rows], rows[0].total
+
+    # Trang vượt quá số record - không có row để đọc total
+    return [], query.count() if offset else 0
+
+
 def get_user_activities(
     db: Session,
     user_id: int,
@@ -243,12 +517,7 @@ def get_user_activities(
         if action_filter:
             query = query.filter(ActivityLog.action == action_filter)
         
-        total = query.count()
-        
-        activities = query.order_by(desc(ActivityLog.created_at))\
-                         .offset(offset)\
-                         .limit(limit)\
-                         .all()
+        activities, total = _paginate_with_total(query, desc(ActivityLog.created_at), offset, limit)
         
         return {
             "success": True,
@@ -266,7 +535,7 @@ def get_user_activities(
         }
         
     except Exception as e:
-        logger.error(f"Error getting user activities: {str(e)}")
+        logger.exception("Error getting user activities")
         return {"success": False, "error": str(e), "logs": []}
 
 
@@ -298,12 +567,7 @@ def get_place_visits(
             VisitLog.visited_at >= since_date
         )
         
-        total = query.count()
-        
-        visits = query.order_by(desc(VisitLog.visited_at))\
-                     .offset(offset)\
-                     .limit(limit)\
-                     .all()
+        visits, total = _paginate_with_total(query, desc(VisitLog.visited_at), offset, limit)
         
         return {
             "success": True,
@@ -322,7 +586,7 @@ def get_place_visits(
         }
         
     except Exception as e:
-        logger.error(f"Error getting place visits: {str(e)}")
+        logger.exception("Error getting place visits")
         return {"success": False, "error": str(e), "visits": []}
 
 
@@ -344,12 +608,7 @@ def get_post_visits(
             VisitLog.visited_at >= since_date
         )
         
-        total = query.count()
-        
-        visits = query.order_by(desc(VisitLog.visited_at))\
-                     .offset(offset)\
-                     .limit(limit)\
-                     .all()
+        visits, total = _paginate_with_total(query, desc(VisitLog.visited_at), offset, limit)
         
         return {
             "success": True,
@@ -368,7 +627,7 @@ def get_post_visits(
         }
         
     except Exception as e:
-        logger.error(f"Error getting post visits: {str(e)}")
+        logger.exception("Error getting post visits")
         return {"success": False, "error": str(e), "visits": []}
 
 
@@ -388,45 +647,41 @@ def get_visit_analytics(db: Session, days: int = 30) -> Dict[str, Any]:
     try:
         since_date = utc_now() - timedelta(days=days)
         
-        # Tổng visits
-        total_visits = db.query(VisitLog).filter(
+        # Summary trong một lần quét visit_logs:
+        # - total_visits: tổng visits
+        # - unique_visitors: số tài khoản đăng nhập unique (COUNT DISTINCT bỏ qua NULL)
+        # - guest_visitors: khách không đăng nhập, đếm theo IP
+        total_visits, unique_visitors, guest_visitors = db.query(
+            func.count(VisitLog.id),
+            func.count(func.distinct(VisitLog.user_id)),
+            func.count(func.distinct(case((VisitLog.user_id.is_(None), VisitLog.ip_address))))
+        ).filter(
             VisitLog.visited_at >= since_date
-        ).count()
-        
-        # Unique visitors (theo user_id - số tài khoản đăng nhập)
-        # Đếm số user unique đã đăng nhập thay vì đếm IP
-        unique_visitors = db.query(func.count(func.distinct(VisitLog.user_id))).filter(
-            VisitLog.visited_at >= since_date,
-            VisitLog.user_id.isnot(None)
-        ).scalar() or 0
-        
-        # Guest visitors (không đăng nhập - đếm theo IP)
-        guest_visitors = db.query(func.count(func.distinct(VisitLog.ip_address))).filter(
-            VisitLog.visited_at >= since_date,
-            VisitLog.user_id.is_(None)
-        ).scalar() or 0
+        ).one()
         
-        # Top places (by visits)
+        # Top places (by visits) - lấy tên place trong cùng query
         top_places = db.query(
             VisitLog.place_id,
+            Place.name,
             func.count(VisitLog.id).label('visit_count')
+        ).outerjoin(
+            Place, Place.id == VisitLog.place_id
         ).filter(
             VisitLog.visited_at >= since_date,
             VisitLog.place_id.isnot(None)
-        ).group_by(VisitLog.place_id)\
+        ).group_by(VisitLog.place_id, Place.name)\
          .order_by(desc('visit_count'))\
          .limit(10)\
          .all()
         
-        # Get place names
-        top_places_data = []
-        for place_id, visit_count in top_places:
-            place = db.query(Place).filter(Place.id == place_id).first()
-            top_places_data.append({
+        top_places_data = [
+            {
                 "place_id": place_id,
-                "place_name": place.name if place else "Unknown",
+                "place_name": place_name or "Unknown",
                 "visit_count": visit_count
-            })
+            }
+            for place_id, place_name, visit_count in top_places
+        ]
         
         # Top posts (by visits)
         top_posts = db.query(
@@ -445,7 +700,8 @@ def get_visit_analytics(db: Session, days: int = 30) -> Dict[str, Any]:
             for post_id, visit_count in top_posts
         ]
         
-        # Visits per day
+        # Visits per day - một row mỗi ngày, stream qua server-side cursor
+        # thay vì .all() (period dài như 365 ngày)
         visits_per_day = db.query(
             func.date(VisitLog.visited_at).label('date'),
             func.count(VisitLog.id).label('count')
@@ -453,7 +709,7 @@ def get_visit_analytics(db: Session, days: int = 30) -> Dict[str, Any]:
             VisitLog.visited_at >= since_date
         ).group_by(func.date(VisitLog.visited_at))\
          .order_by('date')\
-         .all()
+         .yield_per(500)
         
         visits_trend = [
             {"date": str(date), "count": count}
@@ -474,7 +730,7 @@ def get_visit_analytics(db: Session, days: int = 30) -> Dict[str, Any]:
         }
         
     except Exception as e:
-        logger.error(f"Error getting visit analytics: {str(e)}")
+        logger.exception("Error getting visit analytics")
         return {"success": False, "error": str(e)}
 
 
@@ -483,7 +739,10 @@ def get_activity_analytics(db: Session, days: int = 30) -> Dict[str, Any]:
     Lấy thống kê hoạt động tổng hợp
     """
     try:
-        since_date = utc_now() - timedelta(days=days)
+        # Một mốc thời gian cho cả request để since_date và today_start nhất quán
+        now = utc_now()
+        since_date = now - timedelta(days=days)
+        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
         
         # Activities per action type
         activities_by_type = db.query(
@@ -493,45 +752,48 @@ def get_activity_analytics(db: Session, days: int = 30) -> Dict[str, Any]:
             ActivityLog.created_at >= since_date
         ).group_by(ActivityLog.action)\
          .order_by(desc('count'))\
-         .all()
+         .yield_per(500)
         
         activities_breakdown = [
             {"action": action, "count": count}
             for action, count in activities_by_type
         ]
         
-        # Most active users
+        # Most active users - lấy tên user trong cùng query
         active_users = db.query(
             ActivityLog.user_id,
+            User.full_name,
             func.count(ActivityLog.id).label('activity_count')
+        ).outerjoin(
+            User, User.id == ActivityLog.user_id
         ).filter(
             ActivityLog.created_at >= since_date
-        ).group_by(ActivityLog.user_id)\
+        ).group_by(ActivityLog.user_id, User.full_name)\
          .order_by(desc('activity_count'))\
          .limit(10)\
          .all()
         
-        active_users_data = []
-        for user_id, activity_count in active_users:
-            user = db.query(User).filter(User.id == user_id).first()
-            active_users_data.append({
+        active_users_data = [
+            {
                 "user_id": user_id,
-                "full_name": user.full_name if user else "Unknown",
+                "full_name": full_name or "Unknown",
                 "activity_count": activity_count
-            })
-        
-        # Logins today
-        today_start = utc_now().replace(hour=0, minute=0, second=0, microsecond=0)
-        logins_today = db.query(ActivityLog).filter(
-            ActivityLog.action == "login",
-            ActivityLog.created_at >= today_start
-        ).count()
-        
-        # New registrations this period
-        new_registrations = db.query(ActivityLog).filter(
-            ActivityLog.action == "register",
-            ActivityLog.created_at >= since_date
-        ).count()
+            }
+            for user_id, full_name, activity_count in active_users
+        ]
+        
+        # Logins today + new registrations this period trong một query
+        logins_today, new_registrations = db.query(
+            func.count(case((
+                and_(ActivityLog.action == "login", ActivityLog.created_at >= today_start), 1
+            ))),
+            func.count(case((
+                and_(ActivityLog.action == "register", ActivityLog.created_at >= since_date), 1
+            )))
+        ).filter(
+            ActivityLog.action.in_(("login", "register")),
+            ActivityLog.created_at >= min(today_start, since_date)
+        ).one()
         
         return {
             "success": True,
@@ -545,5 +807,5 @@ def get_activity_analytics(db: Session, days: int = 30) -> Dict[str, Any]:
         }
         
     except Exception as e:
-        logger.error(f"Error getting activity analytics: {str(e)}")
+        logger.exception("Error getting activity analytics")
         return {"success": False, "error": str(e)}
@@ -17,13 +17,19 @@ Author: System
 Date: 2024-12-31
 """
 
+import asyncio
 import logging
 from typing import Dict, Any, List
 from bson import ObjectId
 from bson.errors import InvalidId
+from pymongo import UpdateOne
+from app.utils.timezone_helper import utc_now
 
 logger = logging.getLogger(__name__)
 
+# Số posts mỗi batch khi sync toàn bộ
+SYNC_ALL_CHUNK_SIZE = 500
+
 
 # ==================== USER REPUTATION SCORE ====================
 
@@ -44,28 +50,23 @@ async def calculate_user_reputation(
         int: reputation_score
     """
     try:
-        logger.info(f"[REPUTATION] Starting calculation for user {user_id}")
-        
-        # Đếm số posts của user (đã approved)
-        post_count = await mongo_client.count("posts", {
-            "author_id": user_id,
-            "status": "approved"
-        })
+        logger.info("[REPUTATION] Starting calculation for user %s", user_id)
+        
+        # Lấy IDs các posts đã approved của user (chỉ _id) - số posts là len(post_ids),
+        # không cần count riêng
+        post_ids = [
+            post["_id"]
+            async for post in mongo_client.iter_many("posts", {
+                "author_id": user_id,
+                "status": "approved"
+            }, projection={"_id": 1})
+        ]
+        post_count = len(post_ids)
         
-        logger.info(f"[REPUTATION] user_id={user_id}: approved posts={post_count}")
+        logger.info("[REPUTATION] user_id=%s: approved posts=%s", user_id, post_count)
         
         if post_count == 0:
-            logger.info(f"[REPUTATION] user_id={user_id}: no approved posts, score=0")
-            return 0
-        
-        # Lấy tất cả post IDs của user
-        user_posts = await mongo_client.find_many("posts", {
-            "author_id": user_id,
-            "status": "approved"
-        })
-        post_ids = [str(post.get("_id")) for post in user_posts]
-        
-        if not post_ids:
+            logger.info("[REPUTATION] user_id=%s: no approved posts, score=0", user_id)
             return 0
         
         # Đếm tổng likes cho tất cả posts của user
@@ -81,14 +82,15 @@ async def calculate_user_reputation(
         # Tính reputation_score
         reputation_score = round((total_likes + total_comments) / post_count)
         
-        logger.info(f"[REPUTATION] user_id={user_id}: posts={post_count}, likes={total_likes}, comments={total_comments}, score={reputation_score}")
+        logger.info(
+            "[REPUTATION] user_id=%s: posts=%s, likes=%s, comments=%s, score=%s",
+            user_id, post_count, total_likes, total_comments, reputation_score
+        )
         
         return reputation_score
         
-    except Exception as e:
-        logger.error(f"[REPUTATION] Error calculating reputation for user {user_id}: {e}")
-        import traceback
-        logger.error(f"[REPUTATION] Traceback: {traceback.format_exc()}")
+    except Exception:
+        logger.exception("[REPUTATION] Error calculating reputation for user %s", user_id)
         return 0
 
 
@@ -128,18 +130,18 @@ async def update_user_reputation(
                 old_score = user.reputation_score
                 user.reputation_score = new_score
                 db_session.commit()
-                logger.info(f"[REPUTATION] Updated user {user_id}: {old_score} -> {new_score}")
+                logger.info("[REPUTATION] Updated user %s: %s -> %s", user_id, old_score, new_score)
                 return True
             else:
-                logger.warning(f"[REPUTATION] User {user_id} not found in PostgreSQL")
+                logger.warning("[REPUTATION] User %s not found in PostgreSQL", user_id)
                 return False
                 
         finally:
             if should_close:
                 db_session.close()
                 
-    except Exception as e:
-        logger.error(f"[REPUTATION] Error updating reputation for user {user_id}: {e}")
+    except Exception:
+        logger.exception("[REPUTATION] Error updating reputation for user %s", user_id)
         return False
 
 
@@ -155,23 +157,15 @@ async def get_post_author_id(post_id: str, mongo_client) -> int:
         int: author_id hoặc None nếu không tìm thấy
     """
     try:
-        # Tìm post - handle both ObjectId and string _id
-        post = None
-        try:
-            post = await mongo_client.find_one("posts", {"_id": ObjectId(post_id)})
-        except InvalidId:
-            pass
-        
-        if not post:
-            post = await mongo_client.find_one("posts", {"_id": post_id})
+        post = await mongo_client.find_one("posts", _post_id_query(post_id))
         
         if post:
             return post.get("author_id")
         
         return None
         
-    except Exception as e:
-        logger.error(f"[REPUTATION] Error getting author_id for post {post_id}: {e}")
+    except Exception:
+        logger.exception("[REPUTATION] Error getting author_id for post %s", post_id)
         return None
 
 
@@ -190,40 +184,52 @@ async def calculate_post_stats(
         Dict với likes_count và comments_count
     """
     try:
-        # Đếm likes từ post_likes collection
-        likes_count = await mongo_client.count("post_likes", {"post_id": post_id})
-        
-        # Đếm comments từ post_comments collection
-        comments_count = await mongo_client.count("post_comments", {"post_id": post_id})
+        # Đếm likes (post_likes) và comments (post_comments) song song
+        likes_count, comments_count = await asyncio.gather(
+            mongo_client.count("post_likes", {"post_id": post_id}),
+            mongo_client.count("post_comments", {"post_id": post_id})
+        )
         
-        logger.debug(f"[POST_STATS] post_id={post_id}: likes={likes_count}, comments={comments_count}")
+        logger.debug("[POST_STATS] post_id=%s: likes=%s, comments=%s", post_id, likes_count, comments_count)
         
         return {
             "likes_count": likes_count,
             "comments_count": comments_count
         }
         
-    except Exception as e:
-        logger.error(f"[POST_STATS] Error calculating stats for post {post_id}: {e}")
+    except Exception:
+        logger.exception("[POST_STATS] Error calculating stats for post %s", post_id)
         return {
             "likes_count": 0,
             "comments_count": 0
         }
 
 
-async def _get_post_query(post_id: str, mongo_client):
-    """Helper để tìm post và trả về query dict chính xác."""
+def _post_changed_query(post_id: str, field: str, value: int) -> Dict[str, Any]:
+    """
+    Query match post chỉ khi field khác value - update trùng giá trị (retry,
+    toggle lặp) không match nên không ghi
+    """
+    return {**_post_id_query(post_id), field: {"$ne": value}}
+
+
+def _post_id_query(post_id: str) -> Dict[str, Any]:
+    """
+    Query match post theo _id - handle cả ObjectId và string _id trong một query
+    (không cần find trước để dò kiểu _id)
+    """
     try:
-        post_query = {"_id": ObjectId(post_id)}
-        post = await mongo_client.find_one("posts", post_query)
-        if post:
-            return post_query, post
+        return {"_id": {"$in": [ObjectId(post_id), post_id]}}
     except InvalidId:
-        pass
-    
-    post_query = {"_id": post_id}
-    post = await mongo_client.find_one("posts", post_query)
-    return post_query if post else None, post
+        return {"_id": post_id}
+
+
+async def _post_exists(post_id: str, mongo_client) -> bool:
+    """
+    Kiểm tra post tồn tại - chỉ dùng khi find_one_and_update có guard $ne trả về None
+    để phân biệt "không tìm thấy post" với "giá trị đã đúng" (lookup theo _id, có index)
+    """
+    return await mongo_client.count("posts", _post_id_query(post_id)) > 0
 
 
 async def sync_post_stats(
@@ -244,24 +250,21 @@ async def sync_post_stats(
         # Tính toán stats từ collections thực tế
         stats = await calculate_post_stats(post_id, mongo_client)
         
-        # Tìm post
-        post_query, post = await _get_post_query(post_id, mongo_client)
+        # Cập nhật MongoDB (không tìm post trước - None nghĩa là không có post)
+        post = await mongo_client.find_one_and_update("posts", _post_id_query(post_id), {
+            "likes_count": stats["likes_count"],
+            "comments_count": stats["comments_count"]
+        }, projection={"_id": 1})
         
         if not post:
-            logger.warning(f"[POST_STATS] Post {post_id} not found")
+            logger.warning("[POST_STATS] Post %s not found", post_id)
             return stats
         
-        # Cập nhật MongoDB
-        await mongo_client.update_one("posts", post_query, {
-            "likes_count": stats["likes_count"],
-            "comments_count": stats["comments_count"]
-        })
-        
-        logger.info(f"[POST_STATS] Synced post {post_id}: likes={stats['likes_count']}, comments={stats['comments_count']}")
+        logger.info("[POST_STATS] Synced post %s: likes=%s, comments=%s", post_id, stats['likes_count'], stats['comments_count'])
         return stats
         
-    except Exception as e:
-        logger.error(f"[POST_STATS] Error syncing post {post_id}: {e}")
+    except Exception:
+        logger.exception("[POST_STATS] Error syncing post %s", post_id)
         return {"likes_count": 0, "comments_count": 0}
 
 
@@ -286,23 +289,22 @@ async def sync_posts_stats_batch(
     results = {}
     
     try:
-        # Aggregation để đếm likes cho tất cả posts
-        likes_pipeline = [
+        # Aggregation để đếm likes và comments cho tất cả posts - hai collection
+        # độc lập nên chạy song song
+        count_pipeline = [
             {"$match": {"post_id": {"$in": post_ids}}},
             {"$group": {"_id": "$post_id", "count": {"$sum": 1}}}
         ]
-        likes_results = await mongo_client.aggregate("post_likes", likes_pipeline)
+        likes_results, comments_results = await asyncio.gather(
+            mongo_client.aggregate("post_likes", count_pipeline),
+            mongo_client.aggregate("post_comments", count_pipeline)
+        )
         likes_map = {doc["_id"]: doc["count"] for doc in likes_results}
-        
-        # Aggregation để đếm comments cho tất cả posts
-        comments_pipeline = [
-            {"$match": {"post_id": {"$in": post_ids}}},
-            {"$group": {"_id": "$post_id", "count": {"$sum": 1}}}
-        ]
-        comments_results = await mongo_client.aggregate("post_comments", comments_pipeline)
         comments_map = {doc["_id"]: doc["count"] for doc in comments_results}
         
-        # Build results và update từng post
+        # Build results và một UpdateOne cho mỗi post - gửi tất cả trong một bulk_write
+        operations = []
+        now = utc_now()
         for post_id in post_ids:
             likes_count = likes_map.get(post_id, 0)
             comments_count = comments_map.get(post_id, 0)
@@ -312,26 +314,28 @@ async def sync_posts_stats_batch(
                 "comments_count": comments_count
             }
             
-            # Update post document
-            post_query, post = await _get_post_query(post_id, mongo_client)
-            
-            if post:
-                # Chỉ update nếu giá trị khác
-                current_likes = post.get("likes_count", 0)
-                current_comments = post.get("comments_count", 0)
-                
-                if current_likes != likes_count or current_comments != comments_count:
-                    await mongo_client.update_one("posts", post_query, {
-                        "likes_count": likes_count,
-                        "comments_count": comments_count
-                    })
-        
-        logger.info(f"[POST_STATS] Batch synced {len(post_ids)} posts")
-        
-    except Exception as e:
-        logger.error(f"[POST_STATS] Batch sync error: {e}")
-        import traceback
-        logger.error(f"[POST_STATS] Traceback: {traceback.format_exc()}")
+            # Chỉ update nếu giá trị khác (điều kiện nằm trong filter, không cần đọc post trước)
+            operations.append(UpdateOne(
+                {
+                    **_post_id_query(post_id),
+                    "$or": [
+                        {"likes_count": {"$ne": likes_count}},
+                        {"comments_count": {"$ne": comments_count}}
+                    ]
+                },
+                {"$set": {
+                    "likes_count": likes_count,
+                    "comments_count": comments_count,
+                    "updated_at": now
+                }}
+            ))
+        
+        modified_count = await mongo_client.bulk_write("posts", operations, ordered=False)
+        
+        logger.info("[POST_STATS] Batch synced %s posts (%s updated)", len(post_ids), modified_count)
+        
+    except Exception:
+        logger.exception("[POST_STATS] Batch sync error")
     
     return results
 
@@ -358,17 +362,21 @@ async def on_like_toggled(
         bool: True nếu cập nhật thành công
     """
     try:
-        post_query, post = await _get_post_query(post_id, mongo_client)
+        # Update và lấy author_id trong một round-trip
+        post = await mongo_client.find_one_and_update(
+            "posts", _post_changed_query(post_id, "likes_count", total_likes),
+            {"likes_count": total_likes}, projection={"author_id": 1}
+        )
         
         if not post:
-            logger.warning(f"[POST_STATS] Post {post_id} not found for like update")
-            return False
-        
-        await mongo_client.update_one("posts", post_query, {
-            "likes_count": total_likes
-        })
+            if not await _post_exists(post_id, mongo_client):
+                logger.warning("[POST_STATS] Post %s not found for like update", post_id)
+                return False
+            # likes_count đã đúng - không có gì để ghi
+            logger.debug("[POST_STATS] likes_count unchanged for post %s", post_id)
+            return True
         
-        logger.info(f"[POST_STATS] Updated likes_count for post {post_id}: {total_likes}")
+        logger.info("[POST_STATS] Updated likes_count for post %s: %s", post_id, total_likes)
         
         # Cập nhật reputation_score của author
         author_id = post.get("author_id")
@@ -377,8 +385,8 @@ async def on_like_toggled(
         
         return True
         
-    except Exception as e:
-        logger.error(f"[POST_STATS] Error updating likes for post {post_id}: {e}")
+    except Exception:
+        logger.exception("[POST_STATS] Error updating likes for post %s", post_id)
         return False
 
 
@@ -401,17 +409,19 @@ async def on_comment_added(
         # Đếm lại từ database để đảm bảo chính xác
         comments_count = await mongo_client.count("post_comments", {"post_id": post_id})
         
-        post_query, post = await _get_post_query(post_id, mongo_client)
+        post = await mongo_client.find_one_and_update(
+            "posts", _post_changed_query(post_id, "comments_count", comments_count),
+            {"comments_count": comments_count}, projection={"author_id": 1}
+        )
         
         if not post:
-            logger.warning(f"[POST_STATS] Post {post_id} not found for comment update")
-            return False
-        
-        await mongo_client.update_one("posts", post_query, {
-            "comments_count": comments_count
-        })
+            if not await _post_exists(post_id, mongo_client):
+                logger.warning("[POST_STATS] Post %s not found for comment update", post_id)
+                return False
+            logger.debug("[POST_STATS] comments_count unchanged for post %s", post_id)
+            return True
         
-        logger.info(f"[POST_STATS] Updated comments_count for post {post_id}: {comments_count}")
+        logger.info("[POST_STATS] Updated comments_count for post %s: %s", post_id, comments_count)
         
         # Cập nhật reputation_score của author
         author_id = post.get("author_id")
@@ -420,8 +430,8 @@ async def on_comment_added(
         
         return True
         
-    except Exception as e:
-        logger.error(f"[POST_STATS] Error updating comments for post {post_id}: {e}")
+    except Exception:
+        logger.exception("[POST_STATS] Error updating comments for post %s", post_id)
         return False
 
 
@@ -444,17 +454,19 @@ async def on_comment_deleted(
         # Đếm lại từ database để đảm bảo chính xác
         comments_count = await mongo_client.count("post_comments", {"post_id": post_id})
         
-        post_query, post = await _get_post_query(post_id, mongo_client)
+        post = await mongo_client.find_one_and_update(
+            "posts", _post_changed_query(post_id, "comments_count", comments_count),
+            {"comments_count": comments_count}, projection={"author_id": 1}
+        )
         
         if not post:
-            logger.warning(f"[POST_STATS] Post {post_id} not found for comment delete update")
-            return False
-        
-        await mongo_client.update_one("posts", post_query, {
-            "comments_count": comments_count
-        })
+            if not await _post_exists(post_id, mongo_client):
+                logger.warning("[POST_STATS] Post %s not found for comment delete update", post_id)
+                return False
+            logger.debug("[POST_STATS] comments_count unchanged for post %s", post_id)
+            return True
         
-        logger.info(f"[POST_STATS] Updated comments_count after delete for post {post_id}: {comments_count}")
+        logger.info("[POST_STATS] Updated comments_count after delete for post %s: %s", post_id, comments_count)
         
         # Cập nhật reputation_score của author
         author_id = post.get("author_id")
@@ -463,8 +475,8 @@ async def on_comment_deleted(
         
         return True
         
-    except Exception as e:
-        logger.error(f"[POST_STATS] Error updating comments after delete for post {post_id}: {e}")
+    except Exception:
+        logger.exception("[POST_STATS] Error updating comments after delete for post %s", post_id)
         return False
 
 
@@ -481,27 +493,47 @@ async def sync_all_posts_stats(
     Returns:
         Dict với thống kê kết quả sync
     """
+    total_posts = 0
+    synced_count = 0
+    pending = None
+
     try:
-        # Lấy tất cả post IDs
-        all_posts = await mongo_client.find_many("posts", {})
-        post_ids = [str(post.get("_id")) for post in all_posts]
-        
-        logger.info(f"[POST_STATS] Starting batch sync for {len(post_ids)} posts")
-        
-        # Sync batch
-        results = await sync_posts_stats_batch(post_ids, mongo_client)
-        
+        logger.info("[POST_STATS] Starting batch sync for all posts")
+
+        # Duyệt post IDs qua cursor (chỉ lấy _id) và sync theo chunk - bộ nhớ
+        # không phụ thuộc số posts. Chunk K đang sync trong khi đọc chunk K+1.
+        chunk = []
+        async for post in mongo_client.iter_many("posts", {}, projection={"_id": 1}):
+            chunk.append(post["_id"])
+            if len(chunk) < SYNC_ALL_CHUNK_SIZE:
+                continue
+
+            if pending is not None:
+                synced_count += len(await pending)
+            pending = asyncio.create_task(sync_posts_stats_batch(chunk, mongo_client))
+            total_posts += len(chunk)
+            chunk = []
+
+        if pending is not None:
+            synced_count += len(await pending)
+            pending = None
+        if chunk:
+            synced_count += len(await sync_posts_stats_batch(chunk, mongo_client))
+            total_posts += len(chunk)
+
         summary = {
-            "total_posts": len(post_ids),
-            "synced_count": len(results),
+            "total_posts": total_posts,
+            "synced_count": synced_count,
             "success": True
         }
         
-        logger.info(f"[POST_STATS] Batch sync completed: {summary}")
+        logger.info("[POST_STATS] Batch sync completed: %s", summary)
         return summary
         
     except Exception as e:
-        logger.error(f"[POST_STATS] Batch sync all failed: {e}")
+        if pending is not None:
+            pending.cancel()
+        logger.exception("[POST_STATS] Batch sync all failed")
         return {
             "total_posts": 0,
             "synced_count": 0,
@@ -11,13 +11,57 @@ Author: System
 Date: 2024-12-30
 """
 
+import asyncio
 import logging
-from typing import Optional, Dict, Any, List
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.utils.timezone_helper import utc_now
 
 logger = logging.getLogger(__name__)
 
+# Rating hợp lệ trong aggregation: có giá trị và nằm trong [0, 5] (bao gồm cả 0)
+_VALID_RATING_EXPR = {"$and": [
+    {"$ne": ["$rating", None]},
+    {"$gte": ["$rating", 0]},
+    {"$lte": ["$rating", 5]}
+]}
+
+# related_place_id chuẩn hóa về int ngay trong pipeline (string không parse được -> null)
+_PLACE_ID_AS_INT = {"$convert": {
+    "input": "$related_place_id", "to": "int", "onError": None, "onNull": None
+}}
+
+# Cache rating tính từ MongoDB cho đường đọc (trang chi tiết place).
+# Cache theo process: tính lại / invalidate chỉ cập nhật cache của worker xử lý
+# request đó - các worker khác (WEB_CONCURRENCY > 1) có thể trả rating cũ
+# tối đa PLACE_RATING_CACHE_TTL giây sau mỗi thay đổi.
+PLACE_RATING_CACHE_TTL = int(os.getenv("PLACE_RATING_CACHE_TTL", "30"))  # giây
+PLACE_RATING_CACHE_SIZE = int(os.getenv("PLACE_RATING_CACHE_SIZE", "10000"))
+# place_id -> (thời điểm hết hạn, rating_data)
+_place_rating_cache: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+# place_id -> Future của lần tính đang chạy (gộp các request đồng thời cùng place)
+_place_rating_inflight: Dict[int, asyncio.Future] = {}
+
+
+def _store_place_rating(place_id: int, rating_data: Dict[str, Any]) -> None:
+    """Ghi rating vào cache và evict LRU nếu vượt giới hạn"""
+    _place_rating_cache[place_id] = (time.monotonic() + PLACE_RATING_CACHE_TTL, rating_data)
+    _place_rating_cache.move_to_end(place_id)
+    while len(_place_rating_cache) > PLACE_RATING_CACHE_SIZE:
+        _place_rating_cache.popitem(last=False)
+
+
+def invalidate_place_rating(place_id: int) -> None:
+    """Xóa rating đã cache của place trong process hiện tại (gọi khi posts của place thay đổi)"""
+    _place_rating_cache.pop(place_id, None)
+
 
 async def calculate_place_rating_from_mongodb(
     place_id: int,
@@ -39,60 +83,46 @@ async def calculate_place_rating_from_mongodb(
         Dict với rating_average, rating_count, rating_total, review_count
     """
     try:
-        # Query 1: Đếm TẤT CẢ posts approved cho place này (review_count)
-        all_posts = await mongo_client.find_many(
-            "posts",
+        # Một aggregation trả về cả review_count (tất cả posts approved)
+        # và tổng/số lượng rating hợp lệ để tính trung bình
+        pipeline = [
             {
-                "$or": [
-                    {"related_place_id": place_id},
-                    {"related_place_id": str(place_id)}
-                ],
-                "status": "approved"
-            }
-        )
-        review_count = len(all_posts) if all_posts else 0
-        
-        # Query 2: Lấy posts CÓ rating để tính trung bình
-        posts_with_rating = await mongo_client.find_many(
-            "posts",
+                "$match": {
+                    "status": "approved",
+                    "related_place_id": place_id
+                }
+            },
             {
-                "$or": [
-                    {"related_place_id": place_id},
-                    {"related_place_id": str(place_id)}
-                ],
-                "status": "approved",
-                "rating": {"$exists": True, "$ne": None}
+                "$group": {
+                    "_id": None,
+                    "review_count": {"$sum": 1},
+                    "rating_total": {"$sum": {"$cond": [_VALID_RATING_EXPR, "$rating", 0]}},
+                    "rating_count": {"$sum": {"$cond": [_VALID_RATING_EXPR, 1, 0]}}
+                }
             }
-        )
-        
-        # Tính toán rating từ những posts có rating
-        ratings = []
-        for post in posts_with_rating:
-            rating = post.get("rating")
-            if rating is not None:
-                try:
-                    rating_val = float(rating)
-                    # Validate range (bao gồm cả 0)
-                    if 0 <= rating_val <= 5:
-                        ratings.append(rating_val)
-                except (TypeError, ValueError):
-                    continue
+        ]
+        groups = await mongo_client.aggregate("posts", pipeline)
+        stats = groups[0] if groups else {}
         
-        rating_count = len(ratings)
-        rating_total = sum(ratings)
+        review_count = stats.get("review_count", 0)
+        rating_count = stats.get("rating_count", 0)
+        rating_total = float(stats.get("rating_total", 0))
         rating_average = round(rating_total / rating_count, 2) if rating_count > 0 else 0.0
         
         logger.info(f"[RATING_SYNC] place_id={place_id}: review_count={review_count}, rating_count={rating_count}, avg={rating_average}")
         
-        return {
+        rating_data = {
             "rating_average": rating_average,
             "rating_count": rating_count,  # Số posts có rating
             "rating_total": rating_total,
             "review_count": review_count   # Tổng số posts (bao gồm cả không có rating)
         }
+        # Kết quả mới nhất luôn ghi đè cache (không cache khi lỗi)
+        _store_place_rating(place_id, rating_data)
+        return dict(rating_data)
         
-    except Exception as e:
-        logger.error(f"[RATING_SYNC] Error calculating rating for place {place_id}: {e}")
+    except Exception:
+        logger.exception("[RATING_SYNC] Error calculating rating for place %s", place_id)
         return {
             "rating_average": 0.0,
             "rating_count": 0,
@@ -102,6 +132,46 @@ async def calculate_place_rating_from_mongodb(
 
 
 
+async def get_place_rating_cached(
+    place_id: int,
+    mongo_client
+) -> Dict[str, Any]:
+    """
+    Như calculate_place_rating_from_mongodb nhưng trả kết quả từ cache nếu còn hạn.
+    Nhiều request đồng thời cho cùng place chỉ chạy một aggregation.
+    
+    Args:
+        place_id: ID của place trong PostgreSQL
+        mongo_client: MongoDB client instance
+        
+    Returns:
+        Dict với rating_average, rating_count, rating_total, review_count
+    """
+    entry = _place_rating_cache.get(place_id)
+    if entry is not None and entry[0] > time.monotonic():
+        _place_rating_cache.move_to_end(place_id)
+        return dict(entry[1])
+    
+    pending = _place_rating_inflight.get(place_id)
+    if pending is not None:
+        # Chờ lần tính đang chạy; nếu nó bị cancel thì tự tính
+        await asyncio.wait((pending,))
+        if not pending.cancelled():
+            return dict(pending.result())
+    
+    future = asyncio.get_running_loop().create_future()
+    _place_rating_inflight[place_id] = future
+    try:
+        rating_data = await calculate_place_rating_from_mongodb(place_id, mongo_client)
+        future.set_result(rating_data)
+        return rating_data
+    finally:
+        if not future.done():
+            future.cancel()
+        if _place_rating_inflight.get(place_id) is future:
+            del _place_rating_inflight[place_id]
+
+
 async def sync_places_ratings_batch(
     place_ids: List[int],
     db: Session,
@@ -128,140 +198,149 @@ async def sync_places_ratings_batch(
     results = {}
     
     try:
-        # Convert place_ids to include both int and string versions
-        place_id_conditions = []
-        for pid in place_ids:
-            place_id_conditions.append(pid)
-            place_id_conditions.append(str(pid))
-        
-        # Single aggregation query for ALL places
-        pipeline = [
-            {
-                "$match": {
-                    "related_place_id": {"$in": place_id_conditions},
-                    "status": "approved"
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$related_place_id",
-                    "review_count": {"$sum": 1},
-                    "ratings": {
-                        "$push": {
-                            "$cond": [
-                                {"$and": [
-                                    {"$ne": ["$rating", None]},
-                                    {"$gte": ["$rating", 0]},
-                                    {"$lte": ["$rating", 5]}
-                                ]},
-                                "$rating",
-                                "$$REMOVE"
-                            ]
-                        }
-                    }
-                }
-            },
-            {
-                "$project": {
-                    "_id": 1,
-                    "review_count": 1,
-                    "rating_total": {"$sum": "$ratings"},
-                    "rating_count_for_avg": {"$size": "$ratings"},
-                    "rating_average": {
-                        "$cond": [
-                            {"$gt": [{"$size": "$ratings"}, 0]},
-                            {"$round": [{"$divide": [{"$sum": "$ratings"}, {"$size": "$ratings"}]}, 2]},
-                            0
-                        ]
-                    }
-                }
+        await _sync_places_ratings(place_ids, db, mongo_client, results)
+    except Exception:
+        logger.exception("[RATING_SYNC] Batch sync error")
+        await asyncio.to_thread(db.rollback)
+    
+    return results
+
+
+async def _sync_places_ratings(
+    place_ids: List[int],
+    db: Session,
+    mongo_client,
+    results: Dict[int, Dict[str, Any]]
+) -> int:
+    """
+    Thân của sync_places_ratings_batch: tính rating từ MongoDB, điền vào results
+    và ghi PostgreSQL. Lỗi được raise cho caller xử lý.
+    
+    Returns:
+        Số places thực sự thay đổi trong PostgreSQL
+    """
+    # Single aggregation query for ALL places
+    # $match dùng index (status, related_place_id); group key ép về int
+    # để mỗi place đúng một document, không phải gộp int/string ở Python
+    pipeline = [
+        {
+            "$match": {
+                "status": "approved",
+                "related_place_id": {"$in": place_ids}
             }
-        ]
-        
-        # Execute aggregation
-        aggregation_results = await mongo_client.aggregate("posts", pipeline)
-        
-        # Process results - ACCUMULATE data from both int and string place_id groups
-        # MongoDB may group related_place_id=48 (int) and related_place_id="48" (string) separately
-        place_data_map = {}
-        for doc in aggregation_results:
-            place_id = doc["_id"]
-            # Convert string place_id to int
-            if isinstance(place_id, str):
-                try:
-                    place_id = int(place_id)
-                except ValueError:
-                    continue
-            
-            # If place_id already exists, ACCUMULATE instead of overwrite
-            if place_id in place_data_map:
-                existing = place_data_map[place_id]
-                new_review_count = existing["review_count"] + doc.get("review_count", 0)
-                new_rating_total = existing["rating_total"] + doc.get("rating_total", 0.0)
-                new_rating_count_for_avg = existing.get("rating_count_for_avg", 0) + doc.get("rating_count_for_avg", 0)
-                
-                # Recalculate average from accumulated totals
-                new_rating_average = round(new_rating_total / new_rating_count_for_avg, 2) if new_rating_count_for_avg > 0 else 0.0
-                
-                place_data_map[place_id] = {
-                    "rating_average": new_rating_average,
-                    "review_count": new_review_count,
-                    "rating_total": new_rating_total,
-                    "rating_count": new_review_count,  # For compatibility
-                    "rating_count_for_avg": new_rating_count_for_avg  # Keep track for future accumulation
-                }
-                logger.info(f"[RATING_SYNC] Accumulated data for place_id={place_id}: review_count={new_review_count}, avg={new_rating_average}")
-            else:
-                place_data_map[place_id] = {
-                    "rating_average": doc.get("rating_average", 0.0),
-                    "review_count": doc.get("review_count", 0),
-                    "rating_total": doc.get("rating_total", 0.0),
-                    "rating_count": doc.get("review_count", 0),  # For compatibility
-                    "rating_count_for_avg": doc.get("rating_count_for_avg", 0)  # Store for potential accumulation
-                }
-        
-        # Build results for all requested place_ids
-        for place_id in place_ids:
-            if place_id in place_data_map:
-                results[place_id] = place_data_map[place_id]
-            else:
-                # Place has no posts
-                results[place_id] = {
-                    "rating_average": 0.0,
-                    "rating_count": 0,
-                    "rating_total": 0.0,
-                    "review_count": 0
-                }
-            
-            # Update PostgreSQL
-            try:
-                rating_data = results[place_id]
-                update_query = text("""
-                    UPDATE places 
-                    SET rating_average = :rating_average,
-                        rating_count = :review_count,
-                        rating_total = :rating_total,
-                        updated_at = NOW()
-                    WHERE id = :place_id
-                """)
-                
-                db.execute(update_query, {
-                    "place_id": place_id,
-                    "rating_average": rating_data["rating_average"],
-                    "review_count": rating_data["review_count"],
-                    "rating_total": rating_data["rating_total"]
-                })
-            except Exception as e:
-                logger.warning(f"[RATING_SYNC] Failed to update place {place_id}: {e}")
-        
+        },
+        {
+            "$group": {
+                "_id": _PLACE_ID_AS_INT,
+                "review_count": {"$sum": 1},
+                "rating_total": {"$sum": {"$cond": [_VALID_RATING_EXPR, "$rating", 0]}},
+                "rating_n": {"$sum": {"$cond": [_VALID_RATING_EXPR, 1, 0]}}
+            }
+        }
+    ]
+    
+    aggregation_results = await mongo_client.aggregate("posts", pipeline)
+    
+    place_data_map = {}
+    for doc in aggregation_results:
+        review_count = doc["review_count"]
+        rating_total = doc["rating_total"]
+        rating_n = doc["rating_n"]
+        place_data_map[doc["_id"]] = {
+            "rating_average": round(rating_total / rating_n, 2) if rating_n > 0 else 0.0,
+            "review_count": review_count,
+            "rating_total": rating_total,
+            "rating_count": review_count  # For compatibility
+        }
+    
+    # Build results for all requested place_ids
+    empty_rating = {
+        "rating_average": 0.0,
+        "rating_count": 0,
+        "rating_total": 0.0,
+        "review_count": 0
+    }
+    rows = []
+    for place_id in place_ids:
+        # Place không có posts -> rating về 0
+        rating_data = place_data_map.get(place_id) or dict(empty_rating)
+        results[place_id] = rating_data
+        rows.append((
+            place_id,
+            rating_data["rating_average"],
+            rating_data["review_count"],
+            rating_data["rating_total"]
+        ))
+    
+    # Update PostgreSQL: một câu UPDATE ... FROM (VALUES ...) cho cả batch,
+    # chạy trong thread để không block event loop
+    def _write_ratings() -> int:
+        changed = _bulk_update_place_ratings(db, rows)
         db.commit()
-        logger.info(f"[RATING_SYNC] Batch synced {len(place_ids)} places (optimized)")
+        return changed
+    
+    changed_count = await asyncio.to_thread(_write_ratings)
+    logger.info(f"[RATING_SYNC] Batch synced {len(place_ids)} places ({changed_count} changed)")
+    return changed_count
+
+
+_ACTIVE_PLACE_IDS = text("SELECT id FROM places WHERE deleted_at IS NULL")
+
+
+_PLACE_RATING_UPDATE = text("""
+    UPDATE places 
+    SET rating_average = :rating_average,
+        rating_count = :review_count,
+        rating_total = :rating_total,
+        updated_at = NOW()
+    WHERE id = :place_id
+""")
+
+
+async def update_place_rating_no_commit(
+    place_id: int,
+    db: Session,
+    mongo_client
+) -> Dict[str, Any]:
+    """
+    Tính rating từ MongoDB và ghi UPDATE vào transaction hiện tại, KHÔNG commit.
+    Dùng khi xử lý nhiều events liên tiếp (vd backfill approve hàng loạt):
+    gọi hàm này cho từng place rồi flush_rating_updates() một lần.
+    
+    Args:
+        place_id: ID của place
+        db: PostgreSQL session
+        mongo_client: MongoDB client instance
         
-    except Exception as e:
-        logger.error(f"[RATING_SYNC] Batch sync error: {e}")
-        db.rollback()
+    Returns:
+        Dict rating_data đã ghi
+    """
+    rating_data = await calculate_place_rating_from_mongodb(place_id, mongo_client)
     
-    return results
+    # NOTE: rating_count in PostgreSQL = review_count (total posts), not just posts with ratings
+    await asyncio.to_thread(db.execute, _PLACE_RATING_UPDATE, {
+        "place_id": place_id,
+        "rating_average": rating_data["rating_average"],
+        "review_count": rating_data["review_count"],  # Use review_count (total posts) for consistency
+        "rating_total": rating_data["rating_total"]
+    })
+    return rating_data
+
+
+async def flush_rating_updates(db: Session) -> bool:
+    """
+    Commit các UPDATE đã ghi bởi update_place_rating_no_commit (một lần fsync cho cả loạt).
+    
+    Returns:
+        bool: True nếu commit thành công
+    """
+    try:
+        await asyncio.to_thread(db.commit)
+        return True
+    except Exception:
+        logger.exception("[RATING_SYNC] Error committing rating updates")
+        await asyncio.to_thread(db.rollback)
+        return False
 
 
 async def update_place_rating(
@@ -270,7 +349,7 @@ async def update_place_rating(
     mongo_client
 ) -> bool:
     """
-    Cập nhật rating cho một place trong PostgreSQL từ MongoDB.
+    Cập nhật rating cho một place trong PostgreSQL từ MongoDB và commit ngay.
     
     Args:
         place_id: ID của place
@@ -281,37 +360,175 @@ async def update_place_rating(
         bool: True nếu cập nhật thành công
     """
     try:
-        # Tính toán rating từ MongoDB
-        rating_data = await calculate_place_rating_from_mongodb(place_id, mongo_client)
-        
-        # Cập nhật PostgreSQL
-        # NOTE: rating_count in PostgreSQL = review_count (total posts), not just posts with ratings
-        update_query = text("""
-            UPDATE places 
-            SET rating_average = :rating_average,
-                rating_count = :review_count,
-                rating_total = :rating_total,
-                updated_at = NOW()
-            WHERE id = :place_id
-        """)
+        rating_data = await update_place_rating_no_commit(place_id, db, mongo_client)
+    except Exception:
+        logger.exception("[RATING_SYNC] Error updating place %s rating", place_id)
+        await asyncio.to_thread(db.rollback)
+        return False
+    
+    if not await flush_rating_updates(db):
+        return False
+    
+    logger.info(f"[RATING_SYNC] Updated place {place_id}: avg={rating_data['rating_average']}, review_count={rating_data['review_count']}")
+    return True
+
+
+# Key trong bảng sync_state cho mốc đồng bộ rating gần nhất
+RATING_SYNC_STATE_KEY = "posts_rating"
+
+# Số place tối đa trong một câu UPDATE ... FROM (VALUES ...)
+# (Postgres không nhanh hơn đáng kể khi vượt vài nghìn dòng mỗi câu)
+RATING_UPDATE_CHUNK_SIZE = 5000
+
+
+def _bulk_update_place_ratings(
+    db: Session,
+    rows: List[Tuple[int, float, int, float]]
+) -> int:
+    """
+    Ghi rating cho nhiều place bằng UPDATE ... FROM (VALUES ...),
+    mỗi chunk một round-trip thay vì một UPDATE cho từng place.
+    Chỉ ghi những place có giá trị khác hiện tại (giống REFRESH ... CONCURRENTLY
+    chỉ áp dụng phần diff) - sync lặp lại không tạo dead tuple/WAL cho dòng không đổi.
+    Không commit - caller tự commit.
+    
+    Args:
+        db: PostgreSQL session
+        rows: List (place_id, rating_average, review_count, rating_total)
         
-        db.execute(update_query, {
-            "place_id": place_id,
-            "rating_average": rating_data["rating_average"],
-            "review_count": rating_data["review_count"],  # Use review_count (total posts) for consistency
-            "rating_total": rating_data["rating_total"]
-        })
-        db.commit()
+    Returns:
+        Số places thực sự thay đổi
+    """
+    updated = 0
+    for start in range(0, len(rows), RATING_UPDATE_CHUNK_SIZE):
+        chunk = rows[start:start + RATING_UPDATE_CHUNK_SIZE]
         
-        logger.info(f"[RATING_SYNC] Updated place {place_id}: avg={rating_data['rating_average']}, review_count={rating_data['review_count']}")
+        values_sql = ", ".join(
+            f"(:id{i}, :avg{i}, :cnt{i}, :tot{i})" for i in range(len(chunk))
+        )
+        params = {}
+        for i, (place_id, rating_average, review_count, rating_total) in enumerate(chunk):
+            params[f"id{i}"] = place_id
+            params[f"avg{i}"] = rating_average
+            params[f"cnt{i}"] = review_count
+            params[f"tot{i}"] = rating_total
+        
+        # NOTE: rating_count in PostgreSQL = review_count (total posts)
+        result = db.execute(text(f"""
+            UPDATE places
+            SET rating_average = v.rating_average,
+                rating_count = v.review_count,
+                rating_total = v.rating_total,
+                updated_at = NOW()
+            FROM (
+                SELECT place_id::integer AS place_id,
+                       rating_average::numeric AS rating_average,
+                       review_count::integer AS review_count,
+                       ROUND(rating_total::numeric, 2) AS rating_total
+                FROM (VALUES {values_sql}) AS raw(place_id, rating_average, review_count, rating_total)
+            ) AS v
+            WHERE places.id = v.place_id
+              AND (places.rating_average, places.rating_count, places.rating_total)
+                  IS DISTINCT FROM (v.rating_average, v.review_count, v.rating_total)
+        """), params)
+        updated += result.rowcount
+    
+    return updated
+
+
+def _get_sync_state(db: Session, key: str) -> Optional[datetime]:
+    """
+    Đọc mốc đồng bộ gần nhất (None nếu chưa sync lần nào).
+    Chạy trong SAVEPOINT: nếu bảng sync_state chưa có thì transaction
+    ngoài (vd advisory lock lúc khởi động) không bị abort.
+    """
+    from config.database import SyncState
+    
+    try:
+        with db.begin_nested():
+            state = db.get(SyncState, key)
+            return state.value if state else None
+    except SQLAlchemyError as e:
+        logger.warning(f"[RATING_SYNC] Cannot read sync_state '{key}': {e}")
+        return None
+
+
+def _set_sync_state(db: Session, key: str, value: datetime) -> bool:
+    """
+    Ghi mốc đồng bộ (không commit - caller tự commit).
+    Lỗi (vd thiếu bảng sync_state) chỉ rollback SAVEPOINT, không làm hỏng
+    các UPDATE rating trong cùng transaction.
+    
+    Returns:
+        bool: True nếu ghi được
+    """
+    from config.database import SyncState
+    
+    try:
+        with db.begin_nested():
+            db.merge(SyncState(key=key, value=value))
+            db.flush()
         return True
-        
-    except Exception as e:
-        db.rollback()
-        logger.error(f"[RATING_SYNC] Error updating place {place_id} rating: {e}")
+    except SQLAlchemyError as e:
+        logger.warning(f"[RATING_SYNC] Cannot write sync_state '{key}': {e}")
         return False
 
 
+def _apply_place_ratings(
+    db: Session,
+    all_place_ids: set,
+    place_stats: Dict[int, Tuple[int, float, int]],
+    synced_at: Optional[datetime] = None
+) -> Tuple[int, int, int, set]:
+    """
+    Ghi rating đã tính vào PostgreSQL và commit (chạy trong thread qua asyncio.to_thread).
+    
+    Args:
+        db: PostgreSQL session
+        all_place_ids: Tất cả place IDs chưa bị xóa
+        place_stats: place_id -> (review_count, rating_total, số posts có rating hợp lệ)
+        synced_at: Nếu có, ghi làm mốc cho lần sync incremental tiếp theo
+        
+    Returns:
+        Tuple (updated_count, reset_count, failed_count, places_without_reviews)
+    """
+    # Cập nhật places có reviews - rating_average chỉ từ posts có rating
+    rows = []
+    for place_id, (review_count, rating_total, rating_n) in place_stats.items():
+        rating_average = round(rating_total / rating_n, 2) if rating_n else 0.0
+        rows.append((place_id, rating_average, review_count, rating_total))
+    
+    updated_count = _bulk_update_place_ratings(db, rows)
+    # Place có posts nhưng không còn (hoặc đã bị xóa) trong PostgreSQL
+    failed_count = len(place_stats.keys() - all_place_ids)
+    if failed_count:
+        logger.warning(f"[RATING_SYNC] {failed_count} places with reviews not found in database")
+    
+    # Reset places không có reviews trong một câu UPDATE
+    places_without_reviews = all_place_ids - place_stats.keys()
+    reset_count = 0
+    
+    if places_without_reviews:
+        logger.info(f"[RATING_SYNC] Resetting {len(places_without_reviews)} places without reviews")
+        result = db.execute(text("""
+            UPDATE places 
+            SET rating_average = 0,
+                rating_count = 0,
+                rating_total = 0,
+                updated_at = NOW()
+            WHERE id = ANY(:place_ids)
+              AND (rating_average <> 0 OR rating_count <> 0 OR rating_total <> 0)
+        """), {"place_ids": list(places_without_reviews)})
+        reset_count = result.rowcount
+    
+    if synced_at is not None:
+        _set_sync_state(db, RATING_SYNC_STATE_KEY, synced_at)
+    
+    db.commit()
+    
+    return updated_count, reset_count, failed_count, places_without_reviews
+
+
 async def sync_all_place_ratings(
     db: Session,
     mongo_client
@@ -333,126 +550,56 @@ async def sync_all_place_ratings(
         Dict với thống kê kết quả sync
     """
     try:
-        from config.database import Place
-        
-        # Lấy tất cả place IDs từ PostgreSQL
-        all_places = db.query(Place.id).filter(Place.deleted_at == None).all()
-        all_place_ids = set(p.id for p in all_places)
-        logger.info(f"[RATING_SYNC] Total places in database: {len(all_place_ids)}")
-        
-        # Query 1: Lấy TẤT CẢ posts approved (để đếm review_count)
-        all_approved_posts = await mongo_client.find_many(
-            "posts",
-            {"status": "approved"}
+        # Mốc cho sync incremental: lấy TRƯỚC khi đọc MongoDB để không bỏ sót
+        # posts thay đổi trong lúc đang sync
+        started_at = utc_now()
+        
+        # Lấy tất cả place IDs từ PostgreSQL - chỉ cần set các int,
+        # scalars() bỏ qua việc dựng Row cho từng place
+        all_place_ids = await asyncio.to_thread(
+            lambda: set(db.execute(_ACTIVE_PLACE_IDS).scalars())
         )
+        logger.info(f"[RATING_SYNC] Total places in database: {len(all_place_ids)}")
         
-        logger.info(f"[RATING_SYNC] Found {len(all_approved_posts)} total approved posts")
-        
-        # Group TẤT CẢ posts by place_id (để đếm review_count)
-        place_review_counts: Dict[int, int] = {}
-        place_ratings: Dict[int, List[float]] = {}
-        
-        for post in all_approved_posts:
-            place_id = post.get("related_place_id")
-            
-            # Skip nếu không có place_id
-            if not place_id:
-                continue
-            
-            # Convert place_id to int
-            if isinstance(place_id, str):
-                try:
-                    place_id = int(place_id)
-                except ValueError:
-                    continue
-            
-            # Đếm review_count (tất cả posts)
-            place_review_counts[place_id] = place_review_counts.get(place_id, 0) + 1
-            
-            # Thu thập ratings (chỉ từ posts có rating)
-            rating = post.get("rating")
-            if rating is not None:
-                try:
-                    rating_val = float(rating)
-                    if 0 <= rating_val <= 5:
-                        if place_id not in place_ratings:
-                            place_ratings[place_id] = []
-                        place_ratings[place_id].append(rating_val)
-                except (TypeError, ValueError):
-                    pass
-        
-        logger.info(f"[RATING_SYNC] Found reviews for {len(place_review_counts)} places")
-        logger.info(f"[RATING_SYNC] Found ratings for {len(place_ratings)} places")
-        
-        updated_count = 0
-        reset_count = 0
-        failed_count = 0
-        
-        # Cập nhật places có reviews
-        for place_id, review_count in place_review_counts.items():
-            # Tính rating_average chỉ từ posts có rating
-            ratings = place_ratings.get(place_id, [])
-            rating_total = sum(ratings)
-            rating_average = round(rating_total / len(ratings), 2) if ratings else 0.0
-            
-            # Cập nhật PostgreSQL - rating_count = review_count (tổng số posts)
-            try:
-                update_query = text("""
-                    UPDATE places 
-                    SET rating_average = :rating_average,
-                        rating_count = :review_count,
-                        rating_total = :rating_total,
-                        updated_at = NOW()
-                    WHERE id = :place_id
-                """)
-                
-                result = db.execute(update_query, {
-                    "place_id": place_id,
-                    "rating_average": rating_average,
-                    "review_count": review_count,  # Tổng số posts
-                    "rating_total": rating_total
-                })
-                
-                if result.rowcount > 0:
-                    updated_count += 1
-                    logger.info(f"[RATING_SYNC] Updated place {place_id}: avg={rating_average}, review_count={review_count}")
-                else:
-                    logger.warning(f"[RATING_SYNC] Place {place_id} not found in database")
-                    failed_count += 1
-                
-            except Exception as e:
-                logger.error(f"[RATING_SYNC] Failed to update place {place_id}: {e}")
-                failed_count += 1
-        
-        # Reset places không có reviews
-        places_with_reviews = set(place_review_counts.keys())
-        places_without_reviews = all_place_ids - places_with_reviews
+        # Group posts approved theo place ngay trên MongoDB server:
+        # mỗi place một document thay vì kéo toàn bộ posts về Python
+        pipeline = [
+            {
+                "$match": {
+                    "status": "approved",
+                    "related_place_id": {"$nin": [None, "", 0]}
+                }
+            },
+            {
+                # Group theo place_id đã ép về int -> "48" và 48 chung một nhóm,
+                # Python không phải gộp lại
+                "$group": {
+                    "_id": _PLACE_ID_AS_INT,
+                    "review_count": {"$sum": 1},
+                    "rating_total": {"$sum": {"$cond": [_VALID_RATING_EXPR, "$rating", 0]}},
+                    "rating_n": {"$sum": {"$cond": [_VALID_RATING_EXPR, 1, 0]}}
+                }
+            },
+            {"$match": {"_id": {"$ne": None}}}
+        ]
+        # Đọc kết quả qua cursor - chỉ giữ place_stats, không buffer list kết quả
+        place_stats: Dict[int, Tuple[int, float, int]] = {
+            doc["_id"]: (doc["review_count"], doc["rating_total"], doc["rating_n"])
+            async for doc in mongo_client.iter_aggregate("posts", pipeline, allow_disk_use=True)
+        }
+        total_posts = sum(review_count for review_count, _, _ in place_stats.values())
         
-        if places_without_reviews:
-            logger.info(f"[RATING_SYNC] Resetting {len(places_without_reviews)} places without reviews")
-            for place_id in places_without_reviews:
-                try:
-                    reset_query = text("""
-                        UPDATE places 
-                        SET rating_average = 0,
-                            rating_count = 0,
-                            rating_total = 0,
-                            updated_at = NOW()
-                        WHERE id = :place_id
-                    """)
-                    
-                    result = db.execute(reset_query, {"place_id": place_id})
-                    if result.rowcount > 0:
-                        reset_count += 1
-                except Exception as e:
-                    logger.warning(f"[RATING_SYNC] Failed to reset place {place_id}: {e}")
+        logger.info(f"[RATING_SYNC] Found {total_posts} approved posts for {len(place_stats)} places")
         
-        db.commit()
+        # Ghi PostgreSQL (sync driver) trong thread riêng để không block event loop
+        updated_count, reset_count, failed_count, places_without_reviews = await asyncio.to_thread(
+            _apply_place_ratings, db, all_place_ids, place_stats, started_at
+        )
         
         summary = {
             "total_places": len(all_place_ids),
-            "total_posts": len(all_approved_posts),
-            "places_with_reviews": len(place_review_counts),
+            "total_posts": total_posts,
+            "places_with_reviews": len(place_stats),
             "places_without_reviews": len(places_without_reviews),
             "updated_count": updated_count,
             "reset_count": reset_count,
@@ -463,10 +610,8 @@ async def sync_all_place_ratings(
         return summary
         
     except Exception as e:
-        db.rollback()
-        logger.error(f"[RATING_SYNC] Batch sync failed: {e}")
-        import traceback
-        logger.error(f"[RATING_SYNC] Traceback: {traceback.format_exc()}")
+        logger.exception("[RATING_SYNC] Batch sync failed")
+        await asyncio.to_thread(db.rollback)
         return {
             "error": str(e),
             "total_places_with_reviews": 0,
@@ -476,6 +621,69 @@ async def sync_all_place_ratings(
 
 
 
+async def sync_place_ratings_incremental(
+    db: Session,
+    mongo_client
+) -> Dict[str, Any]:
+    """
+    Đồng bộ rating chỉ cho places có posts thay đổi (updated_at) từ lần sync trước.
+    Lần đầu (chưa có mốc) chạy full sync_all_place_ratings.
+    
+    Posts bị xóa hẳn không còn updated_at nên không được phát hiện ở đây -
+    đã có on_post_rejected_or_deleted xử lý ngay, và sync_all_place_ratings
+    (admin sync / RATING_SYNC_FULL) vẫn là đường reconcile đầy đủ.
+    
+    Args:
+        db: PostgreSQL session
+        mongo_client: MongoDB client instance
+        
+    Returns:
+        Dict với thống kê kết quả sync
+    """
+    try:
+        last_synced_at = await asyncio.to_thread(_get_sync_state, db, RATING_SYNC_STATE_KEY)
+        if last_synced_at is None:
+            logger.info("[RATING_SYNC] No previous sync state, running full sync")
+            return await sync_all_place_ratings(db, mongo_client)
+        
+        started_at = utc_now()
+        
+        changed_place_ids = await mongo_client.distinct(
+            "posts",
+            "related_place_id",
+            {"updated_at": {"$gte": last_synced_at}}
+        )
+        place_ids = [pid for pid in changed_place_ids if isinstance(pid, int) and pid]
+        
+        # Lỗi ghi rating raise ra ngoài -> rollback, không tiến mốc sync
+        updated_count = 0
+        if place_ids:
+            updated_count = await _sync_places_ratings(place_ids, db, mongo_client, {})
+        
+        def _save_state():
+            _set_sync_state(db, RATING_SYNC_STATE_KEY, started_at)
+            db.commit()
+        
+        await asyncio.to_thread(_save_state)
+        
+        summary = {
+            "since": last_synced_at.isoformat(),
+            "changed_places": len(place_ids),
+            "updated_count": updated_count
+        }
+        logger.info(f"[RATING_SYNC] Incremental sync completed: {summary}")
+        return summary
+        
+    except Exception as e:
+        logger.exception("[RATING_SYNC] Incremental sync failed")
+        await asyncio.to_thread(db.rollback)
+        return {
+            "error": str(e),
+            "changed_places": 0,
+            "updated_count": 0
+        }
+
+
 async def on_post_approved(
     post: Dict[str, Any],
     db: Session,
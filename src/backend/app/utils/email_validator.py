@@ -8,11 +8,17 @@ Module này cung cấp chức năng xác thực email sử dụng Hunter.io API
 import httpx
 import logging
 import os
-from typing import Dict, Any, Optional
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
 from enum import Enum
 
 logger = logging.getLogger(__name__)
 
+# Cache kết quả Hunter.io theo email (lowercase)
+EMAIL_VALIDATION_CACHE_TTL = int(os.getenv("EMAIL_VALIDATION_CACHE_TTL", "3600"))  # giây
+EMAIL_VALIDATION_CACHE_SIZE = int(os.getenv("EMAIL_VALIDATION_CACHE_SIZE", "10000"))
+
 
 class EmailStatus(Enum):
     """Enum cho trạng thái email"""
@@ -22,6 +28,39 @@ class EmailStatus(Enum):
     UNKNOWN = "unknown"       # Không thể xác định
 
 
+class ValidationCache:
+    """
+    TTL + LRU cache cho kết quả validate email
+
+    Chỉ dùng trong event loop (không cần lock).
+    """
+
+    def __init__(self, max_size: int = EMAIL_VALIDATION_CACHE_SIZE, ttl: int = EMAIL_VALIDATION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
 class HunterIOValidator:
     """
     Class xác thực email sử dụng Hunter.io API
@@ -41,6 +80,7 @@ class HunterIOValidator:
         """
         self.api_key = api_key
         self.base_url = "https://api.hunter.io/v2"
+        self.cache = ValidationCache()
 
     def _get_api_key(self) -> str:
         """Lấy API key từ tham số hoặc environment variable"""
@@ -93,6 +133,14 @@ class HunterIOValidator:
                 "api_error": False
             }
 
+        # Kết quả đã có từ lần gọi trước (chỉ cache response thành công của API)
+        cache_key = email.lower()
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            if debug_mode:
+                logger.info(f"Hunter.io cache hit for email: {email}")
+            return dict(cached)
+
         try:
             # Gọi Hunter.io Email Verifier API
             async with httpx.AsyncClient(timeout=10.0) as client:
@@ -115,8 +163,11 @@ class HunterIOValidator:
                 if response.status_code == 200:
                     data = response.json()
                     result = self._parse_hunter_response(data)
-                    result["api_error"] = False
-                    return result
+                    # Parse lỗi đã set api_error=True - không cache
+                    result.setdefault("api_error", False)
+                    if not result["api_error"]:
+                        self.cache.set(cache_key, result)
+                    return dict(result)
                     
                 elif response.status_code == 401:
                     logger.error("Hunter.io: Invalid API key - BLOCKING registration")
@@ -14,7 +14,7 @@ Security Features:
 
 from sqlalchemy import (
     create_engine, Column, Integer, String, Boolean, DateTime,
-    Text, Float, Numeric, Time, ForeignKey, UniqueConstraint, Index, event
+    Text, Float, Numeric, Time, ForeignKey, UniqueConstraint, Index, event, func, text
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session, relationship
@@ -237,6 +237,12 @@ class User(Base):
     created_at = Column(DateTime, default=utc_now, nullable=False)
     updated_at = Column(DateTime, default=utc_now, onupdate=utc_now, nullable=False)
 
+    __table_args__ = (
+        # Lookup email không phân biệt hoa thường: func.lower(User.email) == email.lower()
+        # Unique để chặn trùng email khác hoa thường (race khi đăng ký đồng thời)
+        Index('users_email_lower_idx', func.lower(email), unique=True),
+    )
+
     # Relationships
     role = relationship("Role", back_populates="users")
     refresh_tokens = relationship("TokenRefresh", back_populates="user")
@@ -287,6 +293,8 @@ class TokenRefresh(Base):
     __tablename__ = "token_refresh"
     __table_args__ = (
         Index('idx_token_refresh_expires_at', 'expires_at'),
+        # Partial index cho token còn hiệu lực (logout-all chỉ UPDATE các dòng này)
+        Index('idx_token_refresh_user_active', 'user_id', postgresql_where=text('revoked = false')),
     )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
@@ -448,7 +456,10 @@ class ActivityLog(Base):
     """Model ActivityLog - Log hoạt động"""
     __tablename__ = "activity_logs"
     __table_args__ = (
-        Index('idx_activity_logs_user', 'user_id'),
+        # (user_id, created_at) phục vụ cả lookup theo user lẫn ORDER BY created_at DESC
+        # (btree scan ngược) - thay index đơn idx_activity_logs_user
+        Index('idx_activity_logs_user_created', 'user_id', 'created_at'),
+        Index('idx_activity_logs_action_created', 'action', 'created_at'),
     )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
@@ -533,7 +544,9 @@ class VisitLog(Base):
     __tablename__ = "visit_logs"
     __table_args__ = (
         Index('idx_visit_logs_user', 'user_id'),
-        Index('idx_visit_logs_place', 'place_id'),
+        Index('idx_visit_logs_place_visited', 'place_id', 'visited_at'),
+        Index('idx_visit_logs_post_visited', 'post_id', 'visited_at'),
+        Index('idx_visit_logs_visited_at', 'visited_at'),
     )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
@@ -553,6 +566,17 @@ class VisitLog(Base):
         return f"<VisitLog(id={self.id}, visited_at={self.visited_at})>"
 
 
+class SyncState(Base):
+    """Model SyncState - Mốc thời gian lần đồng bộ gần nhất (theo key)"""
+    __tablename__ = "sync_state"
+
+    key = Column(String(100), primary_key=True)
+    value = Column(DateTime(timezone=True), nullable=False)  # timestamptz: mốc so với updated_at (UTC) bên MongoDB
+
+    def __repr__(self):
+        return f"<SyncState(key={self.key}, value={self.value})>"
+
+
 # ==================== DATABASE DEPENDENCIES ====================
 
 def get_db() -> Session:
@@ -586,86 +610,89 @@ def init_db():
         # Kiểm tra tables hiện có
         inspector = inspect(engine)
         existing_tables = set(inspector.get_table_names())
-        logger.info(f"Các bảng hiện có trong database: {list(existing_tables)}")
+        logger.debug(f"Các bảng hiện có trong database: {list(existing_tables)}")
 
         # Lấy danh sách bảng được định nghĩa trong code
         defined_tables = set(Base.metadata.tables.keys())
         missing_tables = defined_tables - existing_tables
 
-        if missing_tables:
-            logger.info(f"[WARN] Phat hien cac bang thieu: {list(missing_tables)}")
-            
-            # Xóa các orphan indexes (index tồn tại nhưng bảng không có)
-            # Điều này xảy ra khi tạo bảng bị fail giữa chừng
-            logger.info("Kiểm tra và xóa orphan indexes...")
-            with engine.connect() as conn:
-                for table_name in missing_tables:
-                    # Các index patterns có thể tồn tại mà không có bảng
-                    orphan_indexes = [
-                        f"ix_{table_name}_id",
-                        f"ix_{table_name}_email",
-                        f"idx_{table_name}_user",
-                        f"idx_{table_name}_place",
-                    ]
-                    for idx_name in orphan_indexes:
-                        try:
-                            conn.execute(text(f"DROP INDEX IF EXISTS {idx_name}"))
-                            conn.commit()
-                        except Exception:
-                            pass  # Index không tồn tại hoặc không thể xóa
-            
-            logger.info("Đang tạo các bảng thiếu...")
-            
-            # Tạo tables theo đúng thứ tự FK dependency
-            # Thứ tự: roles → users → các bảng phụ thuộc users
-            # place_types, districts → places → subtypes
-            table_order = [
-                'roles', 'place_types', 'districts',
-                'users',
-                'token_refresh', 'activity_logs',
-                'places',
-                'place_images', 'restaurants', 'hotels', 'tourist_attractions',  # FK: places
-                'user_place_favorites', 'user_post_favorites', 'visit_logs'  # FK: users, places
-            ]
-            
-            created_count = 0
-            for table_name in table_order:
-                if table_name in missing_tables:
-                    table = Base.metadata.tables.get(table_name)
-                    if table is not None:
-                        try:
-                            table.create(bind=engine, checkfirst=True)
-                            logger.info(f"  [OK] Da tao bang: {table_name}")
-                            created_count += 1
-                        except ProgrammingError as e:
-                            error_msg = str(e)
-                            if "already exists" in error_msg:
-                                # Vẫn còn index/object trùng - thử xóa và tạo lại
-                                logger.warning(f"Đang xóa object cũ và thử tạo lại: {table_name}")
-                                try:
-                                    with engine.connect() as conn:
-                                        # Xóa tất cả objects liên quan
-                                        conn.execute(text(f"DROP INDEX IF EXISTS ix_{table_name}_id CASCADE"))
-                                        conn.execute(text(f"DROP INDEX IF EXISTS ix_{table_name}_email CASCADE"))
-                                        conn.commit()
-                                    # Thử tạo lại
-                                    table.create(bind=engine, checkfirst=True)
-                                    logger.info(f"  [OK] Da tao bang: {table_name} (sau khi xoa orphan objects)")
-                                    created_count += 1
-                                except Exception as retry_err:
-                                    logger.error(f"  [FAIL] Khong the tao bang {table_name}: {str(retry_err)}")
-                            elif "UndefinedTable" in error_msg:
-                                # FK reference chưa tồn tại - sẽ thử lại sau
-                                logger.warning(f"  [WAIT] Cho FK dependency: {table_name}")
-                            else:
-                                logger.error(f"  [FAIL] Loi tao bang {table_name}: {error_msg}")
-            
-            if created_count > 0:
-                logger.info(f"[OK] Da tao thanh cong {created_count} bang moi")
-            else:
-                logger.info("[OK] Khong co bang moi nao duoc tao (co the da ton tai)")
-        else:
+        # Fast path: schema đã đủ - không cần tạo bảng hay inspect lại lần nữa
+        if not missing_tables:
             logger.info("[OK] Tat ca bang da ton tai, khong tao bang moi")
+            return True
+
+        logger.info(f"[WARN] Phat hien cac bang thieu: {list(missing_tables)}")
+        
+        # Xóa các orphan indexes (index tồn tại nhưng bảng không có)
+        # Điều này xảy ra khi tạo bảng bị fail giữa chừng
+        logger.info("Kiểm tra và xóa orphan indexes...")
+        with engine.connect() as conn:
+            for table_name in missing_tables:
+                # Các index patterns có thể tồn tại mà không có bảng
+                orphan_indexes = [
+                    f"ix_{table_name}_id",
+                    f"ix_{table_name}_email",
+                    f"idx_{table_name}_user",
+                    f"idx_{table_name}_place",
+                ]
+                for idx_name in orphan_indexes:
+                    try:
+                        conn.execute(text(f"DROP INDEX IF EXISTS {idx_name}"))
+                        conn.commit()
+                    except Exception:
+                        pass  # Index không tồn tại hoặc không thể xóa
+        
+        logger.info("Đang tạo các bảng thiếu...")
+        
+        # Tạo tables theo đúng thứ tự FK dependency
+        # Thứ tự: roles → users → các bảng phụ thuộc users
+        # place_types, districts → places → subtypes
+        table_order = [
+            'roles', 'place_types', 'districts',
+            'users',
+            'token_refresh', 'activity_logs',
+            'places',
+            'place_images', 'restaurants', 'hotels', 'tourist_attractions',  # FK: places
+            'user_place_favorites', 'user_post_favorites', 'visit_logs',  # FK: users, places
+            'sync_state'
+        ]
+        
+        created_count = 0
+        for table_name in table_order:
+            if table_name in missing_tables:
+                table = Base.metadata.tables.get(table_name)
+                if table is not None:
+                    try:
+                        table.create(bind=engine, checkfirst=True)
+                        logger.info(f"  [OK] Da tao bang: {table_name}")
+                        created_count += 1
+                    except ProgrammingError as e:
+                        error_msg = str(e)
+                        if "already exists" in error_msg:
+                            # Vẫn còn index/object trùng - thử xóa và tạo lại
+                            logger.warning(f"Đang xóa object cũ và thử tạo lại: {table_name}")
+                            try:
+                                with engine.connect() as conn:
+                                    # Xóa tất cả objects liên quan
+                                    conn.execute(text(f"DROP INDEX IF EXISTS ix_{table_name}_id CASCADE"))
+                                    conn.execute(text(f"DROP INDEX IF EXISTS ix_{table_name}_email CASCADE"))
+                                    conn.commit()
+                                # Thử tạo lại
+                                table.create(bind=engine, checkfirst=True)
+                                logger.info(f"  [OK] Da tao bang: {table_name} (sau khi xoa orphan objects)")
+                                created_count += 1
+                            except Exception as retry_err:
+                                logger.error(f"  [FAIL] Khong the tao bang {table_name}: {str(retry_err)}")
+                        elif "UndefinedTable" in error_msg:
+                            # FK reference chưa tồn tại - sẽ thử lại sau
+                            logger.warning(f"  [WAIT] Cho FK dependency: {table_name}")
+                        else:
+                            logger.error(f"  [FAIL] Loi tao bang {table_name}: {error_msg}")
+        
+        if created_count > 0:
+            logger.info(f"[OK] Da tao thanh cong {created_count} bang moi")
+        else:
+            logger.info("[OK] Khong co bang moi nao duoc tao (co the da ton tai)")
 
         # Verify kết quả
         inspector = inspect(engine)
@@ -690,6 +717,168 @@ def init_db():
         return False
 
 
+# Index khai báo trên model nhưng init_db chỉ tạo bảng MỚI - DB đã có sẵn
+# (từ init.sql cũ) không tự nhận index mới. Tạo bù lúc khởi động, idempotent.
+# CONCURRENTLY: bảng log lớn vẫn INSERT được trong lúc build index.
+_STARTUP_INDEX_DDL = [
+    (
+        "idx_token_refresh_user_active",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_token_refresh_user_active "
+        "ON token_refresh (user_id) WHERE revoked = false"
+    ),
+    (
+        "idx_activity_logs_user_created",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_activity_logs_user_created "
+        "ON activity_logs (user_id, created_at)"
+    ),
+    (
+        "idx_activity_logs_action_created",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_activity_logs_action_created "
+        "ON activity_logs (action, created_at)"
+    ),
+    (
+        "idx_visit_logs_place_visited",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_visit_logs_place_visited "
+        "ON visit_logs (place_id, visited_at)"
+    ),
+    (
+        "idx_visit_logs_post_visited",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_visit_logs_post_visited "
+        "ON visit_logs (post_id, visited_at)"
+    ),
+    (
+        "idx_visit_logs_visited_at",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_visit_logs_visited_at "
+        "ON visit_logs (visited_at)"
+    ),
+]
+
+# Index cũ đã được thay bằng index composite cùng cột đầu: (index cũ, index thay thế).
+# Chỉ drop khi index thay thế đã được tạo thành công.
+_SUPERSEDED_INDEXES = [
+    ("idx_activity_logs_user", "idx_activity_logs_user_created"),
+    ("idx_visit_logs_place", "idx_visit_logs_place_visited"),
+]
+
+
+# Key của Postgres advisory lock cho ensure_indexes - chỉ một worker build index
+_INDEX_LOCK_KEY = 12346
+
+
+def _run_index_ddl(name: str, ddl: str) -> bool:
+    """
+    Chạy một câu DDL index ở chế độ autocommit (CONCURRENTLY không chạy được
+    trong transaction) - lỗi không ảnh hưởng index khác
+    """
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(ddl))
+        return True
+    except Exception as e:
+        logger.warning(f"[WARN] Khong the tao/cap nhat index {name}: {str(e)}")
+        return False
+
+
+def _existing_indexes():
+    """
+    Tên các index hợp lệ (indisvalid) trong schema hiện tại - một query catalog,
+    để lúc khởi động bỏ qua DDL/scan khi index đã có. None nếu không đọc được.
+    """
+    try:
+        with engine.connect() as conn:
+            return set(conn.execute(text(
+                "SELECT c.relname FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE n.nspname = current_schema() AND i.indisvalid"
+            )).scalars().all())
+    except Exception as e:
+        logger.warning(f"[WARN] Khong the doc danh sach index: {str(e)}")
+        return None
+
+
+def _ensure_email_lower_index():
+    """
+    Unique index trên lower(email) - login/register/forgot-password tra theo
+    lower(email) và email không phân biệt hoa thường.
+    Bỏ qua (cảnh báo) nếu đã có email trùng khi không phân biệt hoa thường,
+    vì CREATE UNIQUE INDEX sẽ fail - cần gộp tài khoản thủ công trước.
+    """
+    try:
+        with engine.connect() as conn:
+            duplicates = conn.execute(text(
+                "SELECT lower(email) FROM users "
+                "GROUP BY lower(email) HAVING COUNT(*) > 1 LIMIT 5"
+            )).scalars().all()
+    except Exception as e:
+        logger.warning(f"[WARN] Khong the kiem tra email trung: {str(e)}")
+        return
+
+    if duplicates:
+        logger.warning(
+            f"[WARN] Bo qua users_email_lower_idx - email trung (khong phan biet hoa thuong): {duplicates}"
+        )
+        return
+
+    _run_index_ddl(
+        "users_email_lower_idx",
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS users_email_lower_idx ON users (lower(email))"
+    )
+
+
+def ensure_indexes():
+    """
+    Đảm bảo các index trong _STARTUP_INDEX_DDL tồn tại trên database hiện có
+    và bỏ các index đã bị thay thế (_SUPERSEDED_INDEXES).
+    Index đã có thì bỏ qua - khi DB đã đủ index chỉ tốn một query catalog.
+    Build giữ advisory lock: worker khác khởi động cùng lúc bỏ qua thay vì
+    chạy trùng DDL (worker đang giữ lock sẽ tạo xong).
+    """
+    existing = _existing_indexes()
+    if existing is None:
+        return
+
+    missing = [(name, ddl) for name, ddl in _STARTUP_INDEX_DDL if name not in existing]
+    stale = [(old, new) for old, new in _SUPERSEDED_INDEXES if old in existing]
+    need_email_index = "users_email_lower_idx" not in existing
+    if not missing and not stale and not need_email_index:
+        logger.info("[OK] Da kiem tra indexes")
+        return
+
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+            got_lock = lock_conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": _INDEX_LOCK_KEY}
+            ).scalar()
+            if not got_lock:
+                logger.info("[SKIP] Worker khac dang tao indexes")
+                return
+
+            try:
+                # CONCURRENTLY bị gián đoạn để lại index INVALID (không có trong existing)
+                # mà IF NOT EXISTS sẽ bỏ qua -> drop trước rồi build lại
+                if need_email_index:
+                    _run_index_ddl("users_email_lower_idx", "DROP INDEX CONCURRENTLY IF EXISTS users_email_lower_idx")
+                    _ensure_email_lower_index()
+
+                ensured = set(existing)
+                for name, ddl in missing:
+                    _run_index_ddl(name, f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                    if _run_index_ddl(name, ddl):
+                        ensured.add(name)
+
+                for old_name, replacement in stale:
+                    if replacement in ensured:
+                        _run_index_ddl(old_name, f"DROP INDEX CONCURRENTLY IF EXISTS {old_name}")
+            finally:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _INDEX_LOCK_KEY})
+    except Exception as e:
+        logger.warning(f"[WARN] Khong the tao indexes: {str(e)}")
+        return
+
+    logger.info("[OK] Da kiem tra indexes")
+
+
 def test_connection():
     """Test kết nối database"""
     from sqlalchemy import text
@@ -704,17 +893,66 @@ def test_connection():
         return False
 
 
+def warm_pool(size: int = None) -> int:
+    """
+    Mở sẵn connections cho pool để request đầu tiên không phải trả chi phí TCP/TLS/auth
+
+    Giữ đồng thời `size` connections rồi trả lại pool
+    (connect/close tuần tự sẽ chỉ tái sử dụng một connection).
+
+    Args:
+        size: Số connections cần mở (mặc định = pool_size của engine)
+
+    Returns:
+        int: Số connections đã mở thành công
+    """
+    size = size or engine.pool.size()
+    connections = []
+    try:
+        for _ in range(size):
+            connections.append(engine.connect())
+    except Exception as e:
+        logger.warning(f"Database pool warm-up stopped early: {str(e)}")
+    finally:
+        for conn in connections:
+            conn.close()
+
+    logger.info(f"Database pool warmed: {len(connections)}/{size} connections")
+    return len(connections)
+
+
 # ==================== UTILITY FUNCTIONS ====================
 
+DEFAULT_ROLES = [
+    {"id": 1, "role_name": "admin"},
+    {"id": 2, "role_name": "moderator"},
+    {"id": 3, "role_name": "user"}
+]
+
+
+def ensure_default_roles() -> bool:
+    """
+    Tạo các roles mặc định (chạy một lần lúc khởi động)
+
+    Một câu INSERT ... ON CONFLICT DO NOTHING - idempotent và an toàn
+    khi nhiều worker khởi động cùng lúc.
+    """
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+    try:
+        stmt = pg_insert(Role).values(DEFAULT_ROLES).on_conflict_do_nothing(index_elements=["id"])
+        with engine.begin() as conn:
+            conn.execute(stmt)
+        logger.info("Default roles ensured")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to ensure default roles: {str(e)}")
+        return False
+
+
 def get_or_create_default_roles(db: Session):
     """Tạo các roles mặc định nếu chưa có"""
-    default_roles = [
-        {"id": 1, "role_name": "admin"},
-        {"id": 2, "role_name": "moderator"},
-        {"id": 3, "role_name": "user"}
-    ]
-    
-    for role_data in default_roles:
+    for role_data in DEFAULT_ROLES:
         existing = db.query(Role).filter(Role.id == role_data["id"]).first()
         if not existing:
             role = Role(**role_data)
@@ -728,13 +966,14 @@ def create_admin_user(email: str, password: str, full_name: str = "Admin"):
     """Tạo admin user mặc định (nếu chưa có)"""
     from middleware.auth import auth_middleware
 
+    email = email.strip().lower()
     db = SessionLocal()
     try:
         # Ensure default roles exist
         get_or_create_default_roles(db)
         
         # Kiểm tra admin đã tồn tại chưa
-        existing_admin = db.query(User).filter(User.email == email).first()
+        existing_admin = db.query(User).filter(func.lower(User.email) == email).first()
         if existing_admin:
             logger.info(f"Admin user already exists: {email}")
             return existing_admin
@@ -9,13 +9,18 @@ IMPORTANT: Đây là module đầu tiên phải được import trong toàn bộ
 
 import os
 import sys
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 import logging
 
 logger = logging.getLogger(__name__)
 
+# True sau lần load .env thành công đầu tiên - các lần gọi sau là no-op
+_env_loaded = False
+
 
+@lru_cache(maxsize=1)
 def find_src_dir() -> Path:
     """
     Tìm src directory của project
@@ -72,6 +77,11 @@ def load_environment(force_reload: bool = False) -> bool:
     Returns:
         bool: True nếu load thành công, False nếu fail
     """
+    global _env_loaded
+
+    if _env_loaded and not force_reload:
+        return True
+
     try:
         # Tìm src directory
         src_dir = find_src_dir()
@@ -121,6 +131,7 @@ def load_environment(force_reload: bool = False) -> bool:
             safe_url = db_url.split("@")[-1] if "@" in db_url else db_url
             logger.info(f"[OK] DATABASE_URL: ...@{safe_url}")
 
+        _env_loaded = True
         return True
 
     except Exception as e:
@@ -150,17 +161,14 @@ def is_loaded() -> bool:
     Returns:
         bool: True nếu đã load, False nếu chưa
     """
-    # Kiểm tra một key quan trọng
-    return os.getenv("HUNTER_IO_API_KEY") is not None
+    # Đã load trong process này, hoặc env đã được set từ bên ngoài
+    return _env_loaded or os.getenv("HUNTER_IO_API_KEY") is not None
 
 
 # ==================== AUTO-LOAD ON IMPORT ====================
 # Tự động load environment khi module này được import đầu tiên
-# Nhưng chỉ load 1 lần (tránh reload nhiều lần)
-_env_loaded = False
-
-if not _env_loaded:
-    _env_loaded = load_environment()
+# Nhưng chỉ load 1 lần (load_environment tự bỏ qua nếu đã load)
+load_environment()
 
 # Export cho các module khác sử dụng
 __all__ = [
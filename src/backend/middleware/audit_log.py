@@ -12,10 +12,13 @@ import uuid
 from datetime import datetime
 from app.utils.timezone_helper import utc_now
 from typing import Dict, Any, Optional, List
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import Request
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import logging
+import threading
 import traceback
+from logging.handlers import MemoryHandler
 import os
 from enum import Enum
 from sqlalchemy.orm import Session
@@ -161,7 +164,8 @@ class AuditConfig:
     """Configuration class for audit logging"""
     def __init__(self):
         self.log_file = None
-        self.buffer_size = 100
+        self.buffer_size = 100  # Số records gom lại trước khi ghi file
+        self.flush_interval = 30.0  # Giây - flush định kỳ dù buffer chưa đầy
         self.format = "json"
         self.rotate_logs = True
         self.max_file_size = 10 * 1024 * 1024  # 10MB
@@ -191,11 +195,29 @@ class AuditLogger:
     def setup_file_logger(self):
         """Setup file logger nếu có log_file"""
         if self.log_file:
-            file_handler = logging.FileHandler(self.log_file)
+            file_handler = logging.FileHandler(self.log_file, encoding="utf-8")
             file_handler.setFormatter(
                 logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
             )
-            logger.addHandler(file_handler)
+            # Gom records trong RAM, chỉ ghi file khi đầy buffer hoặc gặp ERROR
+            # thay vì write + flush cho mỗi record
+            buffered_handler = MemoryHandler(
+                capacity=self.config.buffer_size,
+                flushLevel=logging.ERROR,
+                target=file_handler
+            )
+            logger.addHandler(buffered_handler)
+            self._schedule_flush(buffered_handler)
+
+    def _schedule_flush(self, handler: MemoryHandler):
+        """Flush buffer định kỳ (daemon timer) để log không nằm trong RAM quá lâu"""
+        def _flush():
+            handler.flush()
+            self._schedule_flush(handler)
+
+        timer = threading.Timer(self.config.flush_interval, _flush)
+        timer.daemon = True
+        timer.start()
 
     def log_action(
         self,
@@ -566,7 +588,7 @@ class AuditLogger:
             if ip:
                 # X-Forwarded-For có thể chứa nhiều IPs
                 if "," in ip:
-                    ip = ip.split(",")[0].strip()
+                    ip = ip.partition(",")[0].strip()
                 return ip
 
         return request.client.host if request.client else None
@@ -621,36 +643,40 @@ class AuditLogger:
             logger.error(f"Failed to flush audit log buffer: {str(e)}")
 
 
-class AuditMiddleware(BaseHTTPMiddleware):
+class AuditMiddleware:
     """
     Middleware để tự động log tất cả requests
 
     Tự động log request/response cho mục đích audit.
+    Pure ASGI - status code được lấy từ message `http.response.start` thay vì call_next.
     """
 
-    def __init__(self, app, audit_logger: AuditLogger):
+    def __init__(self, app: ASGIApp, audit_logger: AuditLogger):
         """
         Khởi tạo middleware
 
         Args:
-            app: FastAPI application
+            app: ASGI application
             audit_logger: Audit logger instance
         """
-        super().__init__(app)
+        self.app = app
         self.audit_logger = audit_logger
 
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
         """
         Xử lý request và log
 
         Args:
-            request: FastAPI request
-            call_next: Next middleware/handler
-
-        Returns:
-            Response: Response với log đã được ghi
+            scope: ASGI scope
+            receive: ASGI receive channel
+            send: ASGI send channel
         """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         start_time = time.time()
+        request = Request(scope)
 
         # Tạo request ID nếu chưa có
         if not hasattr(request.state, "request_id"):
@@ -659,17 +685,19 @@ class AuditMiddleware(BaseHTTPMiddleware):
         # Log request bắt đầu
         self._log_request_start(request)
 
-        try:
-            # Process request
-            response = await call_next(request)
+        status_code = 500
+        content_length = None
 
-            # Tính response time
-            response_time = (time.time() - start_time) * 1000  # Convert to milliseconds
-
-            # Log request hoàn thành
-            self._log_request_complete(request, response, response_time)
+        async def send_wrapper(message: Message):
+            nonlocal status_code, content_length
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                content_length = Headers(raw=message.get("headers", [])).get("content-length")
+            await send(message)
 
-            return response
+        try:
+            # Process request
+            await self.app(scope, receive, send_wrapper)
 
         except Exception as e:
             # Tính response time
@@ -688,6 +716,12 @@ class AuditMiddleware(BaseHTTPMiddleware):
 
             raise
 
+        # Tính response time
+        response_time = (time.time() - start_time) * 1000  # Convert to milliseconds
+
+        # Log request hoàn thành
+        self._log_request_complete(request, status_code, content_length, response_time)
+
     def _log_request_start(self, request: Request):
         """Log khi request bắt đầu"""
         self.audit_logger.log_action(
@@ -703,28 +737,34 @@ class AuditMiddleware(BaseHTTPMiddleware):
             }
         )
 
-    def _log_request_complete(self, request: Request, response: Response, response_time: float):
+    def _log_request_complete(
+        self,
+        request: Request,
+        status_code: int,
+        content_length: Optional[str],
+        response_time: float
+    ):
         """Log khi request hoàn thành"""
         # Xác định level based on status code
-        if response.status_code >= 500:
+        if status_code >= 500:
             level = LogLevel.ERROR
-        elif response.status_code >= 400:
+        elif status_code >= 400:
             level = LogLevel.WARNING
         else:
             level = LogLevel.INFO
 
         self.audit_logger.log_action(
             action_type=ActionType.API_CALL,
-            message=f"Request completed: {request.method} {request.url.path} - {response.status_code}",
+            message=f"Request completed: {request.method} {request.url.path} - {status_code}",
             level=level,
             request=request,
-            status_code=response.status_code,
+            status_code=status_code,
             response_time=response_time,
             details={
                 "method": request.method,
                 "path": request.url.path,
-                "status_code": response.status_code,
-                "content_length": response.headers.get("Content-Length")
+                "status_code": status_code,
+                "content_length": content_length
             }
         )
 
@@ -6,6 +6,7 @@ quản lý phiên đăng nhập và phân quyền người dùng.
 Logic giữ ổn định qua các phiên bản.
 """
 
+import asyncio
 import jwt
 import bcrypt
 from datetime import datetime, timedelta, timezone
@@ -15,6 +16,14 @@ from fastapi import Request, HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import logging
 import os
+import statistics
+import time
+
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import InvalidHashError, VerificationError
+except ImportError:
+    PasswordHasher = None
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +33,44 @@ JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION = 3600  # 1 giờ
 REFRESH_TOKEN_EXPIRATION = 7 * 24 * 3600  # 7 ngày
 
+# Cost factor của bcrypt (mỗi +1 gấp đôi thời gian hash) - tune theo phần cứng,
+# mục tiêu ~50-100ms/hash. Hash cũ vẫn verify được vì cost lưu trong chính hash.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Thuật toán hash mật khẩu mới: "argon2" (argon2-cffi) hoặc "bcrypt"
+# Hash bcrypt cũ vẫn verify được sau khi chuyển sang argon2 (nhận diện theo prefix)
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "argon2").lower()
+if PASSWORD_HASH_SCHEME == "argon2" and PasswordHasher is None:
+    logger.warning("argon2-cffi chua duoc cai dat - dung bcrypt de hash mat khau")
+    PASSWORD_HASH_SCHEME = "bcrypt"
+
+# Tham số argon2id - mặc định profile OWASP (19 MiB, t=2, p=1)
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "2"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "19456"))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+
+_argon2_hasher = PasswordHasher(
+    time_cost=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST,
+    parallelism=ARGON2_PARALLELISM
+) if PasswordHasher is not None else None
+
+# Số phép hash/verify mật khẩu chạy đồng thời tối đa - mỗi phép chiếm trọn một core,
+# vượt quá số core chỉ làm tăng tail latency
+PASSWORD_HASH_CONCURRENCY = int(os.getenv("PASSWORD_HASH_CONCURRENCY", str(os.cpu_count() or 2)))
+_password_hash_semaphore = asyncio.Semaphore(PASSWORD_HASH_CONCURRENCY)
+
+
+async def run_password_hashing(func, *args):
+    """
+    Chạy hàm hash/verify mật khẩu trong thread pool, giới hạn bởi PASSWORD_HASH_CONCURRENCY
+
+    Usage:
+        password_hash = await run_password_hashing(auth_middleware.hash_password, password)
+    """
+    async with _password_hash_semaphore:
+        return await asyncio.to_thread(func, *args)
+
 security = HTTPBearer()
 
 
@@ -57,11 +104,31 @@ class JWTAuthMiddleware:
             password: Mật khẩu gốc
 
         Returns:
-            str: Mật khẩu đã mã hóa bằng bcrypt
+            str: Mật khẩu đã mã hóa (PHC string argon2id hoặc bcrypt)
         """
-        salt = bcrypt.gensalt()
+        if PASSWORD_HASH_SCHEME == "argon2":
+            return _argon2_hasher.hash(password)
+
+        salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
         return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
+    def benchmark_hash(self, samples: int = 10) -> float:
+        """
+        Đo thời gian hash mật khẩu với cấu hình hiện tại
+
+        Args:
+            samples: Số lần hash
+
+        Returns:
+            float: Thời gian median (ms)
+        """
+        timings = []
+        for i in range(samples):
+            start = time.perf_counter()
+            self.hash_password(f"benchmark-password-{i}")
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
+
     def verify_password(self, password: str, hashed_password: str) -> bool:
         """
         Kiểm tra mật khẩu
@@ -73,6 +140,15 @@ class JWTAuthMiddleware:
         Returns:
             bool: True nếu mật khẩu đúng
         """
+        if hashed_password.startswith("$argon2"):
+            if _argon2_hasher is None:
+                logger.error("Hash argon2 nhung argon2-cffi chua duoc cai dat")
+                return False
+            try:
+                return _argon2_hasher.verify(hashed_password, password)
+            except (VerificationError, InvalidHashError):
+                return False
+
         return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
 
     def create_access_token(self, user_data: Dict[str, Any], expires_delta: int = None) -> str:
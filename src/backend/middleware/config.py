@@ -10,6 +10,11 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def _env_list(name: str, default: str) -> List[str]:
+    """Đọc biến môi trường dạng "a,b,c" thành list, strip khoảng trắng một lần khi import"""
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
+
+
 class MiddlewareConfig:
     """
     Cấu hình chung cho tất cả middleware
@@ -54,9 +59,9 @@ class MiddlewareConfig:
     FROM_NAME = os.getenv("FROM_NAME", "Hanoivivu")
 
     # CORS - Include all localhost variants (IPv4, IPv6, localhost alias)
-    CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:5173,http://127.0.0.1:3000,http://127.0.0.1:5173,http://[::1]:3000,http://[::1]:5173").split(",")
-    CORS_METHODS = os.getenv("CORS_METHODS", "GET,POST,PUT,PATCH,DELETE,OPTIONS").split(",")
-    CORS_HEADERS = os.getenv("CORS_HEADERS", "*").split(",")
+    CORS_ORIGINS = _env_list("CORS_ORIGINS", "http://localhost:3000,http://localhost:5173,http://127.0.0.1:3000,http://127.0.0.1:5173,http://[::1]:3000,http://[::1]:5173")
+    CORS_METHODS = _env_list("CORS_METHODS", "GET,POST,PUT,PATCH,DELETE,OPTIONS")
+    CORS_HEADERS = _env_list("CORS_HEADERS", "*")
     CORS_CREDENTIALS = os.getenv("CORS_CREDENTIALS", "true").lower() == "true"
     CORS_MAX_AGE = int(os.getenv("CORS_MAX_AGE", "86400"))
 
@@ -99,6 +104,8 @@ class MiddlewareConfig:
     ENABLE_EMAIL_VERIFICATION = os.getenv("ENABLE_EMAIL_VERIFICATION", "false").lower() == "true"
     ENABLE_SOCIAL_LOGIN = os.getenv("ENABLE_SOCIAL_LOGIN", "false").lower() == "true"
     ENABLE_CONTENT_MODERATION = os.getenv("ENABLE_CONTENT_MODERATION", "true").lower() == "true"
+    # Tắt để worker không cần phục vụ chatbot bỏ qua import Gemini client
+    ENABLE_CHATBOT_ROUTER = os.getenv("ENABLE_CHATBOT_ROUTER", "true").lower() == "true"
 
     @classmethod
     def validate_config(cls) -> List[str]:
@@ -120,7 +127,7 @@ class MiddlewareConfig:
             if cls.SESSION_SECRET == "session-secret-change-in-production":
                 warnings.append("[WARN] Production: Please change SESSION_SECRET")
 
-            if "localhost" in cls.CORS_ORIGINS[0]:
+            if cls.CORS_ORIGINS and "localhost" in cls.CORS_ORIGINS[0]:
                 warnings.append("[WARN] Production: CORS_ORIGINS contains localhost")
 
         # Check optional but recommended configs
@@ -9,7 +9,9 @@ from typing import List, Dict, Any, Optional
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI, Request
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
 from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import logging
 import os
 
@@ -387,6 +389,40 @@ def is_cors_enabled_for_origin(origin: str) -> bool:
 
 
 # Security headers bổ sung
+# Ngăn cache thông tin nhạy cảm cho API responses
+_API_NO_CACHE_HEADERS = {
+    "Cache-Control": "no-store, no-cache, must-revalidate, private",
+    "Pragma": "no-cache",
+}
+
+
+class SecurityHeadersMiddleware:
+    """
+    Pure ASGI middleware gắn security headers (đã tính sẵn) vào mọi response
+    """
+
+    def __init__(self, app: ASGIApp, headers: Dict[str, str]):
+        self.app = app
+        self.headers = headers
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        is_api = scope["path"].startswith("/api/")
+
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                response_headers = MutableHeaders(scope=message)
+                response_headers.update(self.headers)
+                if is_api:
+                    response_headers.update(_API_NO_CACHE_HEADERS)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
 def add_security_headers(app: FastAPI) -> None:
     """
     Add security headers cho production
@@ -413,88 +449,82 @@ def add_security_headers(app: FastAPI) -> None:
     hsts_include_subdomains = os.getenv("HSTS_INCLUDE_SUBDOMAINS", "true").lower() == "true"
     hsts_preload = os.getenv("HSTS_PRELOAD", "true").lower() == "true"
     
-    @app.middleware("http")
-    async def add_security_headers_middleware(request: Request, call_next):
-        response = await call_next(request)
+    # Headers được tính sẵn một lần thay vì mỗi request
+    headers: Dict[str, str] = {}
 
-        # ==============================================
-        # BASIC SECURITY HEADERS (ALL ENVIRONMENTS)
-        # ==============================================
-        
-        # Ngăn MIME type sniffing
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        
-        # Ngăn clickjacking bằng cách không cho nhúng trong iframe
-        response.headers["X-Frame-Options"] = "DENY"
-        
-        # Bật XSS filter của browser (deprecated but still useful for older browsers)
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        
-        # Kiểm soát thông tin referrer được gửi
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        
-        # Ngăn cache thông tin nhạy cảm
-        if request.url.path.startswith("/api/"):
-            response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, private"
-            response.headers["Pragma"] = "no-cache"
-
-        # ==============================================
-        # HTTPS/SSL SECURITY HEADERS (PRODUCTION/STAGING)
-        # ==============================================
-        
-        if is_production or is_staging:
-            # HTTP Strict Transport Security (HSTS)
-            # Bắt buộc trình duyệt sử dụng HTTPS
-            hsts_value = f"max-age={hsts_max_age}"
-            if hsts_include_subdomains:
-                hsts_value += "; includeSubDomains"
-            if hsts_preload and is_production:
-                hsts_value += "; preload"
-            response.headers["Strict-Transport-Security"] = hsts_value
-            
-            # Ngăn certificate transparency bypass
-            response.headers["Expect-CT"] = f"max-age={hsts_max_age}, enforce"
-        
-        # ==============================================
-        # PERMISSIONS POLICY (ALL ENVIRONMENTS)
-        # ==============================================
+    # ==============================================
+    # BASIC SECURITY HEADERS (ALL ENVIRONMENTS)
+    # ==============================================
+    
+    # Ngăn MIME type sniffing
+    headers["X-Content-Type-Options"] = "nosniff"
+    
+    # Ngăn clickjacking bằng cách không cho nhúng trong iframe
+    headers["X-Frame-Options"] = "DENY"
+    
+    # Bật XSS filter của browser (deprecated but still useful for older browsers)
+    headers["X-XSS-Protection"] = "1; mode=block"
+    
+    # Kiểm soát thông tin referrer được gửi
+    headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+
+    # ==============================================
+    # HTTPS/SSL SECURITY HEADERS (PRODUCTION/STAGING)
+    # ==============================================
+    
+    if is_production or is_staging:
+        # HTTP Strict Transport Security (HSTS)
+        # Bắt buộc trình duyệt sử dụng HTTPS
+        hsts_value = f"max-age={hsts_max_age}"
+        if hsts_include_subdomains:
+            hsts_value += "; includeSubDomains"
+        if hsts_preload and is_production:
+            hsts_value += "; preload"
+        headers["Strict-Transport-Security"] = hsts_value
         
-        # Kiểm soát quyền truy cập các API của browser
-        permissions_policy = (
-            "accelerometer=(), "
-            "camera=(), "
-            "geolocation=(self), "  # Cho phép geolocation cho bản thân site
-            "gyroscope=(), "
-            "magnetometer=(), "
-            "microphone=(), "
-            "payment=(), "
-            "usb=()"
-        )
-        response.headers["Permissions-Policy"] = permissions_policy
+        # Ngăn certificate transparency bypass
+        headers["Expect-CT"] = f"max-age={hsts_max_age}, enforce"
+    
+    # ==============================================
+    # PERMISSIONS POLICY (ALL ENVIRONMENTS)
+    # ==============================================
+    
+    # Kiểm soát quyền truy cập các API của browser
+    permissions_policy = (
+        "accelerometer=(), "
+        "camera=(), "
+        "geolocation=(self), "  # Cho phép geolocation cho bản thân site
+        "gyroscope=(), "
+        "magnetometer=(), "
+        "microphone=(), "
+        "payment=(), "
+        "usb=()"
+    )
+    headers["Permissions-Policy"] = permissions_policy
 
-        # ==============================================
-        # CONTENT SECURITY POLICY (PRODUCTION ONLY)
-        # ==============================================
+    # ==============================================
+    # CONTENT SECURITY POLICY (PRODUCTION ONLY)
+    # ==============================================
+    
+    if is_production:
+        # CSP để kiểm soát nguồn tài nguyên được phép
+        csp = (
+            "default-src 'self'; "
+            "script-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
+            "style-src 'self' 'unsafe-inline' https://fonts.googleapis.com; "
+            "font-src 'self' https://fonts.gstatic.com; "
+            "img-src 'self' data: https:; "
+            "connect-src 'self' https://api.hanoivivu.com; "
+            "frame-ancestors 'none'; "
+            "base-uri 'self'; "
+            "form-action 'self'"
+        )
+        headers["Content-Security-Policy"] = csp
         
-        if is_production:
-            # CSP để kiểm soát nguồn tài nguyên được phép
-            csp = (
-                "default-src 'self'; "
-                "script-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
-                "style-src 'self' 'unsafe-inline' https://fonts.googleapis.com; "
-                "font-src 'self' https://fonts.gstatic.com; "
-                "img-src 'self' data: https:; "
-                "connect-src 'self' https://api.hanoivivu.com; "
-                "frame-ancestors 'none'; "
-                "base-uri 'self'; "
-                "form-action 'self'"
-            )
-            response.headers["Content-Security-Policy"] = csp
-            
-            # Report-only CSP cho testing (uncomment khi cần test)
-            # response.headers["Content-Security-Policy-Report-Only"] = csp
+        # Report-only CSP cho testing (uncomment khi cần test)
+        # headers["Content-Security-Policy-Report-Only"] = csp
 
-        return response
+    app.add_middleware(SecurityHeadersMiddleware, headers=headers)
 
     logger.info(f"Security headers middleware added (Environment: {environment})")
     if is_production or is_staging:
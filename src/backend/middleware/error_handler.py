@@ -14,7 +14,7 @@ from enum import Enum
 from typing import Dict, Any, Optional, List, Union
 from fastapi import Request, Response, HTTPException
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from pydantic import ValidationError
 import logging
@@ -392,47 +392,62 @@ class ErrorHandler:
         )
 
 
-class ErrorMiddleware(BaseHTTPMiddleware):
+class ErrorMiddleware:
     """
     Middleware để xử lý errors tập trung
 
     Tự động bắt và xử lý tất cả exceptions trong requests.
+    Pure ASGI middleware - không tạo thêm task cho mỗi request như BaseHTTPMiddleware.
     """
 
-    def __init__(self, app):
+    def __init__(self, app: ASGIApp):
         """
         Khởi tạo middleware
 
         Args:
-            app: FastAPI application
+            app: ASGI application
         """
-        super().__init__(app)
+        self.app = app
         self.error_handler = ErrorHandler()
 
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
         """
         Xử lý request và bắt exceptions
 
         Args:
-            request: FastAPI request
-            call_next: Next middleware/handler
-
-        Returns:
-            Response: Response với error handling
+            scope: ASGI scope
+            receive: ASGI receive channel
+            send: ASGI send channel
         """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
         try:
-            response = await call_next(request)
-            return response
+            await self.app(scope, receive, send_wrapper)
 
         except Exception as exception:
+            # Response đã gửi một phần - không thể thay bằng error response
+            if response_started:
+                raise
+
             # Convert exception thành APIError
             api_error = self.error_handler.handle_exception(exception)
 
             # Log error
-            self._log_error(api_error, request, exception)
+            self._log_error(api_error, Request(scope), exception)
 
             # Return JSON response
-            return self._create_error_response(api_error)
+            response = self._create_error_response(api_error)
+            await response(scope, receive, send)
 
     def _log_error(self, api_error: APIError, request: Request, original_exception: Exception):
         """
@@ -470,7 +485,7 @@ class ErrorMiddleware(BaseHTTPMiddleware):
         for header in headers:
             ip = request.headers.get(header)
             if ip:
-                return ip.split(",")[0].strip()
+                return ip.partition(",")[0].strip()
 
         return request.client.host if request.client else "unknown"
 
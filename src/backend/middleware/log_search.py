@@ -202,7 +202,7 @@ class LogSearchService:
             if ip:
                 # X-Forwarded-For có thể chứa nhiều IPs
                 if "," in ip:
-                    ip = ip.split(",")[0].strip()
+                    ip = ip.partition(",")[0].strip()
                 return ip.strip()
 
         return request.client.host if request.client else "unknown"
@@ -6,7 +6,8 @@ cho các collections: posts_mongo, post_likes_mongo, post_comments_mongo,
 chatbot_logs_mongo, reports_mongo.
 """
 
-from typing import Dict, Any, List, Optional, Union
+import asyncio
+from typing import Dict, Any, AsyncIterator, List, Optional, Union
 from datetime import datetime
 from app.utils.timezone_helper import utc_now
 import logging
@@ -26,6 +27,8 @@ class MongoConfig:
     MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
     MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "hanoivivu_mongo")
     MONGO_TIMEOUT = int(os.getenv("MONGO_TIMEOUT", "5000"))  # ms
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))  # Số sockets mở sẵn lúc khởi động
 
     # Collections
     COLLECTIONS = {
@@ -33,7 +36,8 @@ class MongoConfig:
         "post_likes": "post_likes_mongo",
         "post_comments": "post_comments_mongo",
         "chatbot_logs": "chatbot_logs_mongo",
-        "reports": "reports_mongo"
+        "reports": "reports_mongo",
+        "migrations": "migrations_mongo"  # Đánh dấu migration một lần đã chạy
     }
 
     # Index configurations
@@ -42,6 +46,7 @@ class MongoConfig:
             [("author_id", ASCENDING)],
             [("related_place_id", ASCENDING)],
             [("created_at", DESCENDING)],
+            [("updated_at", DESCENDING)],  # Incremental rating sync
             [("tags", ASCENDING)],
             [("status", ASCENDING)],
             [("title", "text"), ("content", "text")]  # Text search
@@ -71,6 +76,16 @@ class MongoConfig:
         ]
     }
 
+    # Partial indexes: (collection, keys, partialFilterExpression)
+    # posts approved theo place - dùng cho rating sync (chỉ index posts đã duyệt nên nhỏ, vừa RAM)
+    PARTIAL_INDEXES = [
+        (
+            "posts_mongo",
+            [("status", ASCENDING), ("related_place_id", ASCENDING)],
+            {"status": "approved"}
+        ),
+    ]
+
 
 class MongoDBClient:
     """
@@ -107,7 +122,9 @@ class MongoDBClient:
             # Create MongoDB client
             self.client = AsyncIOMotorClient(
                 self.mongo_uri,
-                serverSelectionTimeoutMS=self.config.MONGO_TIMEOUT
+                serverSelectionTimeoutMS=self.config.MONGO_TIMEOUT,
+                maxPoolSize=self.config.MONGO_MAX_POOL_SIZE,
+                minPoolSize=self.config.MONGO_MIN_POOL_SIZE
             )
 
             # Test connection
@@ -118,6 +135,7 @@ class MongoDBClient:
 
             # Setup indexes
             await self._setup_indexes()
+            await self._normalize_related_place_ids()
 
             self.is_connected = True
             logger.info(f"Connected to MongoDB: {self.mongo_uri}")
@@ -139,6 +157,45 @@ class MongoDBClient:
             self.is_connected = False
             logger.info("Disconnected from MongoDB")
 
+    async def ping(self) -> bool:
+        """
+        Kiểm tra kết nối MongoDB (dùng cho health check)
+
+        Returns:
+            bool: True nếu server phản hồi ping
+        """
+        if not self.is_connected or self.client is None:
+            return False
+
+        try:
+            await self.client.admin.command('ping')
+            return True
+        except Exception as e:
+            logger.warning(f"MongoDB ping failed: {str(e)}")
+            return False
+
+    async def warm_pool(self, size: int = None) -> int:
+        """
+        Mở sẵn sockets trong pool bằng các ping chạy song song
+
+        Args:
+            size: Số sockets cần mở (mặc định MONGO_MIN_POOL_SIZE)
+
+        Returns:
+            int: Số ping thành công
+        """
+        if not self.is_connected or self.client is None:
+            return 0
+
+        size = size or self.config.MONGO_MIN_POOL_SIZE
+        results = await asyncio.gather(
+            *(self.client.admin.command('ping') for _ in range(size)),
+            return_exceptions=True
+        )
+        warmed = sum(1 for r in results if not isinstance(r, Exception))
+        logger.info(f"MongoDB pool warmed: {warmed}/{size} sockets")
+        return warmed
+
     async def _setup_indexes(self):
         """Setup indexes cho collections"""
         if self.db is None:
@@ -156,11 +213,50 @@ class MongoDBClient:
                         # Single index
                         await collection.create_index(index_spec)
 
+            for collection_name, keys, partial_filter in self.config.PARTIAL_INDEXES:
+                await self.db[collection_name].create_index(
+                    keys, partialFilterExpression=partial_filter
+                )
+
             logger.info("MongoDB indexes setup completed")
 
         except Exception as e:
             logger.error(f"Failed to setup MongoDB indexes: {str(e)}")
 
+    async def _normalize_related_place_ids(self):
+        """
+        Migration một lần: posts cũ lưu related_place_id dạng string ("48")
+        -> chuyển về int để query chỉ cần {"related_place_id": place_id}.
+        Chỉ đụng tới string toàn chữ số (tối đa 9 chữ số, vừa int32) - giá trị lạ giữ nguyên, không bị ghi đè thành null.
+        $regex không có prefix cố định nên phải quét cả index related_place_id ->
+        chạy xong thì ghi marker vào migrations, các lần connect sau chỉ đọc marker.
+        """
+        if self.db is None:
+            return
+
+        marker_id = "normalize_related_place_id"
+        migrations = self.db[self.config.COLLECTIONS["migrations"]]
+
+        try:
+            if await migrations.find_one({"_id": marker_id}):
+                return
+
+            result = await self.db[self.config.COLLECTIONS["posts"]].update_many(
+                {"related_place_id": {"$type": "string", "$regex": r"^\d{1,9}$"}},
+                [{"$set": {"related_place_id": {"$toInt": "$related_place_id"}}}]
+            )
+            if result.modified_count:
+                logger.info(f"Normalized related_place_id to int for {result.modified_count} posts")
+
+            await migrations.update_one(
+                {"_id": marker_id},
+                {"$set": {"applied_at": utc_now(), "modified_count": result.modified_count}},
+                upsert=True
+            )
+
+        except Exception as e:
+            logger.error(f"Failed to normalize related_place_id: {str(e)}")
+
     # Generic CRUD operations
     async def insert_one(self, collection: str, document: Dict[str, Any]) -> str:
         """
@@ -279,6 +375,36 @@ class MongoDBClient:
 
         return documents
 
+    async def iter_many(
+        self,
+        collection: str,
+        query: Dict[str, Any] = None,
+        projection: Dict[str, Any] = None,
+        batch_size: int = 500
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Duyệt documents qua cursor thay vì load tất cả vào list
+
+        Args:
+            collection: Tên collection
+            query: Query conditions
+            projection: Các field cần lấy (vd {"_id": 1})
+            batch_size: Số documents mỗi lần fetch từ server
+
+        Yields:
+            Dict: Từng document
+        """
+        if not self.is_connected:
+            raise Exception("MongoDB not connected")
+
+        collection_name = self.config.COLLECTIONS.get(collection, collection)
+        coll = self.db[collection_name]
+
+        async for doc in coll.find(query or {}, projection).batch_size(batch_size):
+            if "_id" in doc:
+                doc["_id"] = str(doc["_id"])
+            yield doc
+
     async def update_one(
         self,
         collection: str,
@@ -336,6 +462,69 @@ class MongoDBClient:
         result = await coll.update_one(query, {"$set": update})
         return result.modified_count > 0
 
+    async def find_one_and_update(
+        self,
+        collection: str,
+        query: Dict[str, Any],
+        update: Dict[str, Any],
+        projection: Dict[str, Any] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Update một document và trả về document (trước khi update) trong một round-trip
+
+        Args:
+            collection: Tên collection
+            query: Query conditions
+            update: Update data
+            projection: Các field cần trả về
+
+        Returns:
+            Dict: Document trước khi update, None nếu không tìm thấy
+        """
+        if not self.is_connected:
+            raise Exception("MongoDB not connected")
+
+        collection_name = self.config.COLLECTIONS.get(collection, collection)
+        coll = self.db[collection_name]
+
+        # Add updated_at timestamp
+        update["updated_at"] = utc_now()
+
+        document = await coll.find_one_and_update(query, {"$set": update}, projection=projection)
+        if document and "_id" in document:
+            document["_id"] = str(document["_id"])
+
+        return document
+
+    async def bulk_write(
+        self,
+        collection: str,
+        operations: List[Any],
+        ordered: bool = False
+    ) -> int:
+        """
+        Thực hiện nhiều write operations (UpdateOne, InsertOne, ...) trong một request
+
+        Args:
+            collection: Tên collection
+            operations: Danh sách pymongo write operations
+            ordered: Dừng ở lỗi đầu tiên nếu True
+
+        Returns:
+            int: Số documents được modify
+        """
+        if not self.is_connected:
+            raise Exception("MongoDB not connected")
+
+        if not operations:
+            return 0
+
+        collection_name = self.config.COLLECTIONS.get(collection, collection)
+        coll = self.db[collection_name]
+
+        result = await coll.bulk_write(operations, ordered=ordered)
+        return result.modified_count
+
     async def delete_one(self, collection: str, query: Dict[str, Any]) -> bool:
         """
         Xóa một document
@@ -375,10 +564,34 @@ class MongoDBClient:
 
         return await coll.count_documents(query or {})
 
+    async def distinct(
+        self,
+        collection: str,
+        key: str,
+        query: Dict[str, Any] = None
+    ) -> List[Any]:
+        """
+        Lấy các giá trị khác nhau của một field
+
+        Args:
+            collection: Tên collection
+            key: Tên field
+            query: Query conditions
+
+        Returns:
+            List: Các giá trị distinct
+        """
+        if not self.is_connected:
+            raise Exception("MongoDB not connected")
+
+        collection_name = self.config.COLLECTIONS.get(collection, collection)
+        return await self.db[collection_name].distinct(key, query or {})
+
     async def aggregate(
         self,
         collection: str,
-        pipeline: List[Dict[str, Any]]
+        pipeline: List[Dict[str, Any]],
+        allow_disk_use: bool = False
     ) -> List[Dict[str, Any]]:
         """
         Run aggregation pipeline
@@ -386,6 +599,7 @@ class MongoDBClient:
         Args:
             collection: Tên collection
             pipeline: Aggregation pipeline stages
+            allow_disk_use: Cho phép $group/$sort dùng disk khi vượt giới hạn RAM
 
         Returns:
             List: Aggregation results
@@ -397,7 +611,7 @@ class MongoDBClient:
         coll = self.db[collection_name]
 
         results = []
-        async for doc in coll.aggregate(pipeline):
+        async for doc in coll.aggregate(pipeline, allowDiskUse=allow_disk_use):
             if "_id" in doc and hasattr(doc["_id"], '__str__'):
                 # Don't convert _id if it's used as a grouping key
                 pass
@@ -405,6 +619,34 @@ class MongoDBClient:
 
         return results
 
+    async def iter_aggregate(
+        self,
+        collection: str,
+        pipeline: List[Dict[str, Any]],
+        allow_disk_use: bool = False,
+        batch_size: int = 500
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Duyệt kết quả aggregation qua cursor thay vì load tất cả vào list
+
+        Args:
+            collection: Tên collection
+            pipeline: Aggregation pipeline stages
+            allow_disk_use: Cho phép $group/$sort dùng disk khi vượt giới hạn RAM
+            batch_size: Số documents mỗi lần fetch từ server
+
+        Yields:
+            Dict: Từng document kết quả
+        """
+        if not self.is_connected:
+            raise Exception("MongoDB not connected")
+
+        collection_name = self.config.COLLECTIONS.get(collection, collection)
+        coll = self.db[collection_name]
+
+        async for doc in coll.aggregate(pipeline, allowDiskUse=allow_disk_use, batchSize=batch_size):
+            yield doc
+
     # Specialized methods for posts
     async def create_post(self, post_data: Dict[str, Any]) -> str:
         """
@@ -373,7 +373,7 @@ class RateLimitMiddleware:
         # Kiểm tra các header phổ biến
         forwarded_for = request.headers.get("X-Forwarded-For")
         if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
+            return forwarded_for.partition(",")[0].strip()
 
         real_ip = request.headers.get("X-Real-IP")
         if real_ip:
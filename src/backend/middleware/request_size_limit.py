@@ -15,8 +15,7 @@ Cấu hình mặc định:
 import os
 import logging
 from fastapi import Request, HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 logger = logging.getLogger(__name__)
 
@@ -52,7 +51,7 @@ class RequestSizeConfig:
 # MIDDLEWARE
 # ==============================================
 
-class RequestSizeLimitMiddleware(BaseHTTPMiddleware):
+class RequestSizeLimitMiddleware:
     """
     Middleware giới hạn kích thước request body
     
@@ -63,25 +62,31 @@ class RequestSizeLimitMiddleware(BaseHTTPMiddleware):
     - Log requests bị reject
     """
     
-    def __init__(self, app, config: RequestSizeConfig = None):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp, config: RequestSizeConfig = None):
+        self.app = app
         self.config = config or RequestSizeConfig()
     
-    async def dispatch(self, request: Request, call_next) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
         """
-        Kiểm tra kích thước request trước khi xử lý
+        Kiểm tra kích thước request trước khi xử lý (pure ASGI)
         """
-        if not RequestSizeConfig.ENABLED:
-            return await call_next(request)
+        if scope["type"] == "http" and RequestSizeConfig.ENABLED:
+            self._check_request_size(Request(scope))
         
+        await self.app(scope, receive, send)
+    
+    def _check_request_size(self, request: Request) -> None:
+        """
+        Raise HTTPException nếu Content-Length vượt giới hạn
+        """
         # Bỏ qua GET, HEAD, OPTIONS requests (không có body)
         if request.method in ("GET", "HEAD", "OPTIONS"):
-            return await call_next(request)
+            return
         
         # Bỏ qua exempt paths
         path = request.url.path
         if self._is_exempt_path(path):
-            return await call_next(request)
+            return
         
         # Lấy Content-Length header
         content_length = request.headers.get("content-length")
@@ -122,8 +127,6 @@ class RequestSizeLimitMiddleware(BaseHTTPMiddleware):
                         "received_bytes": body_size
                     }
                 )
-        
-        return await call_next(request)
     
     def _get_max_size(self, content_type: str, path: str) -> int:
         """
@@ -152,7 +155,7 @@ class RequestSizeLimitMiddleware(BaseHTTPMiddleware):
         """Lấy IP address của client"""
         forwarded = request.headers.get("X-Forwarded-For")
         if forwarded:
-            return forwarded.split(",")[0].strip()
+            return forwarded.partition(",")[0].strip()
         
         real_ip = request.headers.get("X-Real-IP")
         if real_ip:
@@ -10,7 +10,7 @@ from datetime import datetime
 from app.utils.timezone_helper import utc_now
 from typing import Dict, Any, Optional
 from fastapi import Request, Query
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
 import logging
 import json
 
@@ -86,7 +86,7 @@ class SearchLogger:
         for header in headers:
             ip = request.headers.get(header)
             if ip:
-                return ip.split(",")[0].strip()
+                return ip.partition(",")[0].strip()
         return request.client.host if request.client else "unknown"
 
     def _update_trending_keywords(self, keyword: str):
@@ -165,55 +165,54 @@ class SearchLogger:
         return [{"keyword": kw, "count": count} for kw, count in sorted_keywords[:limit]]
 
 
-class SearchLoggingMiddleware(BaseHTTPMiddleware):
+class SearchLoggingMiddleware:
     """
-    Middleware tự động log search requests
+    Middleware tự động log search requests (pure ASGI)
     """
 
-    def __init__(self, app):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp):
+        self.app = app
         self.search_logger = SearchLogger()
 
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
         """
         Xử lý request và log nếu là search endpoint
 
         Args:
-            request: FastAPI request
-            call_next: Next middleware/handler
-
-        Returns:
-            Response: Response với search logging
+            scope: ASGI scope
+            receive: ASGI receive channel
+            send: ASGI send channel
         """
-        start_time = time.time()
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        # Check if this is a search request
-        if self._is_search_request(request):
-            # Extract search parameters
-            search_params = self._extract_search_params(request)
+        request = Request(scope)
 
-            # Process request
-            response = await call_next(request)
+        # Non-search request, just process normally
+        if not self._is_search_request(request):
+            await self.app(scope, receive, send)
+            return
 
-            # Calculate response time
-            response_time = (time.time() - start_time) * 1000
+        start_time = time.time()
 
-            # Extract result count from response if possible
-            result_count = self._extract_result_count(response)
+        # Extract search parameters
+        search_params = self._extract_search_params(request)
 
-            # Log the search
-            await self.search_logger.log_search(
-                request=request,
-                keyword=search_params.get("keyword", ""),
-                filters=search_params.get("filters", {}),
-                result_count=result_count,
-                response_time=response_time
-            )
+        # Process request
+        await self.app(scope, receive, send)
 
-            return response
+        # Calculate response time
+        response_time = (time.time() - start_time) * 1000
 
-        # Non-search request, just process normally
-        return await call_next(request)
+        # Log the search
+        await self.search_logger.log_search(
+            request=request,
+            keyword=search_params.get("keyword", ""),
+            filters=search_params.get("filters", {}),
+            result_count=0,
+            response_time=response_time
+        )
 
     def _is_search_request(self, request: Request) -> bool:
         """
@@ -262,30 +261,6 @@ class SearchLoggingMiddleware(BaseHTTPMiddleware):
 
         return search_params
 
-    def _extract_result_count(self, response) -> int:
-        """
-        Trích xuất số kết quả từ response
-
-        Args:
-            response: FastAPI response
-
-        Returns:
-            int: Số kết quả
-        """
-        try:
-            # Try to get result count from response body
-            if hasattr(response, 'body'):
-                import json
-                body = json.loads(response.body.decode())
-                if isinstance(body.get("data"), list):
-                    return len(body["data"])
-                elif body.get("pagination", {}).get("total_items"):
-                    return body["pagination"]["total_items"]
-        except Exception:
-            pass
-
-        return 0
-
 
 # Global search logger instance
 search_logger = SearchLogger()
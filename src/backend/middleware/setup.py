@@ -5,19 +5,21 @@ Cấu hình và khởi tạo toàn bộ middleware theo đúng thứ tự cho AP
 
 import os
 import sys
+import time
+import uuid
 import logging
 from fastapi import FastAPI, Request
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
 from starlette.middleware.cors import CORSMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from contextlib import asynccontextmanager
 
 if sys.platform == 'win32':
-    import io
-    # Force UTF-8 cho sys.stdout/stderr (Python 3.7+ compatible)
-    if hasattr(sys.stdout, 'buffer'):
-        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace', line_buffering=True)
-    if hasattr(sys.stderr, 'buffer'):
-        sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace', line_buffering=True)
+    # Force UTF-8 cho sys.stdout/stderr - reconfigure tại chỗ (Python 3.7+)
+    # thay vì bọc thêm một TextIOWrapper mới cho mỗi stream
+    for _stream in (sys.stdout, sys.stderr):
+        if hasattr(_stream, 'reconfigure'):
+            _stream.reconfigure(encoding='utf-8', errors='replace')
 
 from .config import config
 from .cors import setup_cors, add_security_headers
@@ -29,37 +31,55 @@ from .search_logging import SearchLoggingMiddleware
 logger = logging.getLogger(__name__)
 
 
-class RequestIDMiddleware(BaseHTTPMiddleware):
+class RequestIDMiddleware:
     """
     Middleware thêm request ID vào tất cả requests
+
+    Pure ASGI middleware - không tạo thêm task cho mỗi request như BaseHTTPMiddleware
     """
 
-    async def dispatch(self, request: Request, call_next):
-        import uuid
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         request_id = str(uuid.uuid4())
-        request.state.request_id = request_id
+        scope.setdefault("state", {})["request_id"] = request_id
 
-        # Add to response headers
-        response = await call_next(request)
-        response.headers["X-Request-ID"] = request_id
-        return response
+        async def send_with_request_id(message: Message):
+            # Add to response headers
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Request-ID"] = request_id
+            await send(message)
 
+        await self.app(scope, receive, send_with_request_id)
 
-class TimingMiddleware(BaseHTTPMiddleware):
+
+class TimingMiddleware:
     """
-    Middleware đo thời gian xử lý request
+    Middleware đo thời gian xử lý request (tới lúc bắt đầu gửi response)
     """
 
-    async def dispatch(self, request: Request, call_next):
-        import time
-        start_time = time.time()
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        response = await call_next(request)
+        start_time = time.perf_counter()
 
-        process_time = (time.time() - start_time) * 1000
-        response.headers["X-Process-Time"] = f"{process_time:.2f}ms"
+        async def send_with_timing(message: Message):
+            if message["type"] == "http.response.start":
+                process_time = (time.perf_counter() - start_time) * 1000
+                MutableHeaders(scope=message)["X-Process-Time"] = f"{process_time:.2f}ms"
+            await send(message)
 
-        return response
+        await self.app(scope, receive, send_with_timing)
 
 
 # Lưu ý: Lifespan handler đã được chuyển sang app/main.py
@@ -89,14 +109,8 @@ def setup_middleware(app: FastAPI) -> None:
     """
     logger.info("[SETUP] Setting up middleware chain...")
 
-    # 1. CORS Middleware
-    if config.CORS_ORIGINS:
-        cors_config = config.get_cors_config()
-        app.add_middleware(
-            CORSMiddleware,
-            **cors_config
-        )
-        logger.info(f"   [OK] CORS configured for: {', '.join(config.CORS_ORIGINS)}")
+    # Lưu ý: add_middleware() sau cùng = lớp ngoài cùng, nên các middleware
+    # được đăng ký theo thứ tự ngược với thứ tự thực thi ở trên
 
     # 2. Security Headers (cho production)
     if config.ENVIRONMENT == "production":
@@ -130,6 +144,17 @@ def setup_middleware(app: FastAPI) -> None:
         app.add_middleware(SearchLoggingMiddleware)
         logger.info("   [OK] Search logging middleware added")
 
+    # 1. CORS Middleware - đăng ký cuối để là lớp ngoài cùng:
+    # preflight OPTIONS được trả lời ngay (headers tính sẵn lúc khởi tạo)
+    # mà không đi qua audit/search logging và các middleware khác
+    if config.CORS_ORIGINS:
+        cors_config = config.get_cors_config()
+        app.add_middleware(
+            CORSMiddleware,
+            **cors_config
+        )
+        logger.info(f"   [OK] CORS configured for: {', '.join(config.CORS_ORIGINS)}")
+
 
     # 8. Rate Limiting
     # Note: Rate limiting được áp dụng qua FastAPI dependencies
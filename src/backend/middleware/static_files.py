@@ -0,0 +1,151 @@
+"""
+Cached Static Files
+
+StaticFiles mở rộng với LRU cache trong RAM cho ảnh upload nhỏ:
+- Ảnh được đọc từ disk một lần, các request sau serve từ bộ nhớ
+- ETag từ (st_mtime_ns, st_size) + Cache-Control/Expires để browser cũng cache
+- Giới hạn tổng dung lượng cache (mặc định 64MB)
+
+Cache được validate bằng (st_mtime_ns, st_size) nên file bị ghi đè
+sẽ tự động được đọc lại.
+
+Production nên để reverse proxy (nginx `try_files` + `sendfile on; tcp_nopush on;`)
+hoặc S3/CloudFront serve /static/uploads trực tiếp - kernel gửi file zero-copy,
+không đi qua Python.
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import NamedTuple, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+logger = logging.getLogger(__name__)
+
+
+# ==============================================
+# CONFIGURATION
+# ==============================================
+
+class StaticCacheConfig:
+    """Cấu hình cache cho static files"""
+
+    # Tổng dung lượng tối đa của cache (bytes)
+    MAX_CACHE_BYTES = int(os.getenv("STATIC_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # 64MB
+    # File lớn hơn giới hạn này không được cache (serve trực tiếp từ disk)
+    MAX_FILE_SIZE = int(os.getenv("STATIC_CACHE_MAX_FILE_SIZE", str(1024 * 1024)))  # 1MB
+    # Thời gian browser được cache (giây)
+    MAX_AGE = int(os.getenv("STATIC_CACHE_MAX_AGE", "86400"))  # 1 ngày
+    # Thêm "immutable" vào Cache-Control - chỉ bật khi tên file không bao giờ bị ghi đè
+    # (avatar_{id}.ext hiện bị ghi đè khi đổi avatar nên mặc định tắt)
+    IMMUTABLE = os.getenv("STATIC_CACHE_IMMUTABLE", "false").lower() == "true"
+
+
+class _CachedFile(NamedTuple):
+    """Entry trong cache"""
+    version: Tuple[int, int]  # (st_mtime_ns, st_size)
+    body: bytes
+    media_type: str
+    etag: str
+
+
+# ==============================================
+# STATIC FILES
+# ==============================================
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles với LRU cache nội dung file trong bộ nhớ
+
+    Usage:
+        app.mount("/static/uploads", CachedStaticFiles(directory=...), name="static_uploads")
+    """
+
+    def __init__(self, *args, config: StaticCacheConfig = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config = config or StaticCacheConfig()
+        self._cache: "OrderedDict[str, _CachedFile]" = OrderedDict()
+        self._cache_bytes = 0
+
+        cache_control = f"public, max-age={self.config.MAX_AGE}"
+        if self.config.IMMUTABLE:
+            cache_control += ", immutable"
+        self._cache_control = cache_control
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        """Serve từ cache nếu có, ngược lại đọc từ disk và lưu vào cache"""
+        request_headers = Headers(scope=scope)
+
+        # Range request / method khác: để StaticFiles xử lý như bình thường
+        if scope["method"] not in ("GET", "HEAD") or "range" in request_headers:
+            return await super().get_response(path, scope)
+
+        entry = self._cache.get(path)
+        if entry is not None:
+            _, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+            if stat_result is not None and entry.version == (stat_result.st_mtime_ns, stat_result.st_size):
+                self._cache.move_to_end(path)
+                return self._cached_response(entry, request_headers)
+            # File đã thay đổi hoặc bị xóa
+            self._evict(path)
+
+        response = await super().get_response(path, scope)
+
+        if isinstance(response, FileResponse) and response.status_code == 200:
+            stat_result = response.stat_result
+            if stat_result is not None and stat_result.st_size <= self.config.MAX_FILE_SIZE:
+                body = await anyio.to_thread.run_sync(self._read_file, response.path)
+                version = (stat_result.st_mtime_ns, stat_result.st_size)
+                entry = _CachedFile(
+                    version=version,
+                    body=body,
+                    media_type=response.media_type,
+                    etag=f'"{version[0]:x}-{version[1]:x}"'
+                )
+                self._store(path, entry)
+                return self._cached_response(entry, request_headers)
+
+        if response.status_code == 200:
+            response.headers["Cache-Control"] = self._cache_control
+        return response
+
+    @staticmethod
+    def _read_file(full_path: str) -> bytes:
+        with open(full_path, "rb") as f:
+            return f.read()
+
+    def _cached_response(self, entry: _CachedFile, request_headers: Headers) -> Response:
+        """Tạo response từ cache entry (304 nếu ETag khớp)"""
+        headers = {
+            "ETag": entry.etag,
+            "Cache-Control": self._cache_control,
+            "Expires": formatdate(time.time() + self.config.MAX_AGE, usegmt=True),
+        }
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and entry.etag in [tag.strip(" W/") for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+
+    def _store(self, path: str, entry: _CachedFile) -> None:
+        """Thêm entry vào cache và evict LRU nếu vượt giới hạn"""
+        self._evict(path)
+        self._cache[path] = entry
+        self._cache_bytes += len(entry.body)
+
+        while self._cache_bytes > self.config.MAX_CACHE_BYTES and self._cache:
+            _, oldest = self._cache.popitem(last=False)
+            self._cache_bytes -= len(oldest.body)
+
+    def _evict(self, path: str) -> None:
+        entry = self._cache.pop(path, None)
+        if entry is not None:
+            self._cache_bytes -= len(entry.body)
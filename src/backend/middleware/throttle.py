@@ -230,7 +230,7 @@ def get_client_identifier(request: Request) -> str:
     forwarded_for = request.headers.get("X-Forwarded-For")
     if forwarded_for:
         # Lấy IP đầu tiên (client thực)
-        return forwarded_for.split(",")[0].strip()
+        return forwarded_for.partition(",")[0].strip()
     
     # Kiểm tra X-Real-IP header
     real_ip = request.headers.get("X-Real-IP")
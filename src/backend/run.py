@@ -17,6 +17,10 @@ import os
 import argparse
 from pathlib import Path
 
+# UTF-8 mode cho các process con (uvicorn reload/workers) - đặc biệt trên Windows
+os.environ.setdefault("PYTHONUTF8", "1")
+os.environ.setdefault("PYTHONIOENCODING", "utf-8")
+
 # Add src/backend to Python path
 backend_dir = Path(__file__).parent
 sys.path.insert(0, str(backend_dir))
@@ -92,6 +96,28 @@ Examples:
     return parser.parse_args()
 
 
+def get_server_impl():
+    """
+    Chọn event loop / HTTP parser cho uvicorn
+
+    Dùng uvloop + httptools (C extensions) nếu đã cài,
+    fallback về "auto" (vd. uvloop không hỗ trợ Windows)
+    """
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "auto"
+
+    try:
+        import httptools  # noqa: F401
+        http = "httptools"
+    except ImportError:
+        http = "auto"
+
+    return loop, http
+
+
 def main():
     """Main function to start the server"""
     args = parse_args()
@@ -112,6 +138,11 @@ def main():
     
     # Determine reload
     reload = args.reload and not args.prod
+
+    # Determine workers (uvicorn bỏ qua workers khi reload)
+    workers = 1 if reload else int(os.getenv("WEB_CONCURRENCY", "1"))
+
+    loop, http = get_server_impl()
     
     # Print startup info
     mode = "PRODUCTION" if args.prod else "DEVELOPMENT"
@@ -122,6 +153,8 @@ def main():
     logger.info(f"Host: {host}")
     logger.info(f"Port: {port}")
     logger.info(f"Reload: {reload}")
+    logger.info(f"Workers: {workers}")
+    logger.info(f"Event loop: {loop}, HTTP parser: {http}")
     logger.info(f"Log level: {args.log_level}")
     logger.info("=" * 70)
     logger.info(f"Server URL: http://{host}:{port}")
@@ -137,6 +170,9 @@ def main():
             host=host,
             port=port,
             reload=reload,
+            workers=workers,
+            loop=loop,
+            http=http,
             log_level=args.log_level,
             access_log=True
         )
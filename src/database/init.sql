@@ -339,6 +339,18 @@ ALTER SEQUENCE public.roles_id_seq OWNER TO postgres;
 ALTER SEQUENCE public.roles_id_seq OWNED BY public.roles.id;
 
 
+--
+-- Name: sync_state; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.sync_state (
+    key character varying(100) NOT NULL,
+    value timestamp with time zone NOT NULL
+);
+
+
+ALTER TABLE public.sync_state OWNER TO postgres;
+
 --
 -- TOC entry 232 (class 1259 OID 39381)
 -- Name: token_refresh; Type: TABLE; Schema: public; Owner: postgres
@@ -2392,6 +2404,14 @@ ALTER TABLE ONLY public.roles
     ADD CONSTRAINT roles_role_name_key UNIQUE (role_name);
 
 
+--
+-- Name: sync_state sync_state_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.sync_state
+    ADD CONSTRAINT sync_state_pkey PRIMARY KEY (key);
+
+
 --
 -- TOC entry 4897 (class 2606 OID 39452)
 -- Name: token_refresh token_refresh_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
@@ -2465,11 +2485,17 @@ ALTER TABLE ONLY public.visit_logs
 
 
 --
--- TOC entry 4870 (class 1259 OID 39467)
--- Name: idx_activity_logs_user; Type: INDEX; Schema: public; Owner: postgres
+-- Name: idx_activity_logs_action_created; Type: INDEX; Schema: public; Owner: postgres
 --
 
-CREATE INDEX idx_activity_logs_user ON public.activity_logs USING btree (user_id);
+CREATE INDEX idx_activity_logs_action_created ON public.activity_logs USING btree (action, created_at);
+
+
+--
+-- Name: idx_activity_logs_user_created; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX idx_activity_logs_user_created ON public.activity_logs USING btree (user_id, created_at);
 
 
 --
@@ -2513,11 +2539,24 @@ CREATE INDEX idx_token_refresh_expires_at ON public.token_refresh USING btree (e
 
 
 --
--- TOC entry 4910 (class 1259 OID 39473)
--- Name: idx_visit_logs_place; Type: INDEX; Schema: public; Owner: postgres
+-- Name: idx_token_refresh_user_active; Type: INDEX; Schema: public; Owner: postgres
 --
 
-CREATE INDEX idx_visit_logs_place ON public.visit_logs USING btree (place_id);
+CREATE INDEX idx_token_refresh_user_active ON public.token_refresh USING btree (user_id) WHERE (revoked = false);
+
+
+--
+-- Name: idx_visit_logs_place_visited; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX idx_visit_logs_place_visited ON public.visit_logs USING btree (place_id, visited_at);
+
+
+--
+-- Name: idx_visit_logs_post_visited; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX idx_visit_logs_post_visited ON public.visit_logs USING btree (post_id, visited_at);
 
 
 --
@@ -2528,6 +2567,20 @@ CREATE INDEX idx_visit_logs_place ON public.visit_logs USING btree (place_id);
 CREATE INDEX idx_visit_logs_user ON public.visit_logs USING btree (user_id);
 
 
+--
+-- Name: idx_visit_logs_visited_at; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX idx_visit_logs_visited_at ON public.visit_logs USING btree (visited_at);
+
+
+--
+-- Name: users_email_lower_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE UNIQUE INDEX users_email_lower_idx ON public.users USING btree (lower((email)::text));
+
+
 --
 -- TOC entry 4914 (class 2606 OID 39475)
 -- Name: activity_logs activity_logs_user_id_fkey; Type: FK CONSTRAINT; Schema: public; Owner: postgres